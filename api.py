@@ -0,0 +1,275 @@
+# HTTP/JSON API over the same pipeline as the Streamlit app, for other clients and
+# load tests:
+#
+#   uvicorn api:app --host 0.0.0.0 --port 8000
+#   API_FAKE_LLM=true uvicorn api:app    # answers with llm.FakeModel, no watsonx call
+#
+#   POST /ingest         {"url": ..., "wait": true}     index a page (202 + job with "wait": false)
+#   GET  /ingest?url=... progress of the background indexing of a page
+#   POST /query          {"url": ..., "question": ...}  context retrieved for the question
+#   POST /answer         {"url": ..., "question": ...}  answer of the LLM
+#   POST /answer/stream  same body, the answer as plain text while it is generated
+#   GET  /health, GET /stats
+#
+# The embedding model, the vector stores, the caches and the pool of watsonx clients
+# are the module-level ones of webchat, shared by every request. The pipeline is
+# blocking, so it runs in the worker threads of the server: at most
+# API_MAX_CONCURRENCY requests run at once, up to API_MAX_QUEUE more wait for a
+# slot. A request arriving with the queue full gets 429, one that waited more than
+# API_QUEUE_TIMEOUT seconds gets 503; both carry a Retry-After header.
+# The watsonx credentials are read from the .env file, or from the
+# X-Watsonx-Api-Key and X-Watsonx-Project-Id headers of the request.
+import asyncio
+import itertools
+import os
+import time
+from contextlib import asynccontextmanager
+from typing import Optional
+
+from fastapi import FastAPI, Header, HTTPException
+from fastapi.responses import JSONResponse, StreamingResponse
+from pydantic import BaseModel
+from starlette.concurrency import iterate_in_threadpool, run_in_threadpool
+
+import llm
+import telemetry
+import utils
+import webchat
+
+API_MAX_CONCURRENCY = int(os.getenv("API_MAX_CONCURRENCY", 8))
+API_MAX_QUEUE = int(os.getenv("API_MAX_QUEUE", 32))
+API_QUEUE_TIMEOUT = float(os.getenv("API_QUEUE_TIMEOUT", 30))
+API_FAKE_LLM = os.getenv("API_FAKE_LLM", "false").lower() == "true"
+
+
+class ConcurrencyLimiter:
+    # Bounds the requests running at once and the ones waiting for a slot; the rest
+    # are turned away at once instead of piling up in the server
+    def __init__(self, limit, queue, timeout):
+        self.limit = limit
+        self.queue = queue
+        self.timeout = timeout
+        self.running = 0
+        self.waiting = 0
+        self.rejected = 0
+        self.timed_out = 0
+        self._semaphore = asyncio.Semaphore(limit)
+
+    async def acquire(self):
+        if self.waiting >= self.queue and self._semaphore.locked():
+            self.rejected += 1
+            raise HTTPException(429, "Too many requests in the queue", headers={"Retry-After": "1"})
+        self.waiting += 1
+        try:
+            await asyncio.wait_for(self._semaphore.acquire(), self.timeout)
+        except asyncio.TimeoutError:
+            self.timed_out += 1
+            raise HTTPException(503, "No worker became free in time", headers={"Retry-After": "5"})
+        finally:
+            self.waiting -= 1
+        self.running += 1
+
+    def release(self):
+        self.running -= 1
+        self._semaphore.release()
+
+    @asynccontextmanager
+    async def slot(self):
+        await self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self):
+        return {
+            "limit": self.limit,
+            "queue": self.queue,
+            "running": self.running,
+            "waiting": self.waiting,
+            "rejected": self.rejected,
+            "timed_out": self.timed_out,
+        }
+
+
+class IngestRequest(BaseModel):
+    url: str
+    collection: Optional[str] = None
+    # False indexes the page in the background and returns at once
+    wait: bool = True
+
+
+class QuestionRequest(BaseModel):
+    url: str
+    question: str
+    collection: Optional[str] = None
+    n_results: Optional[int] = None
+    # False answers from what is indexed already, e.g. while a background job runs
+    ingest: bool = True
+
+
+limiter = ConcurrencyLimiter(API_MAX_CONCURRENCY, API_MAX_QUEUE, API_QUEUE_TIMEOUT)
+fake_model = llm.FakeModel() if API_FAKE_LLM else None
+
+
+@asynccontextmanager
+async def lifespan(app):
+    webchat.get_credentials()
+    webchat.warm_up()
+    yield
+
+
+app = FastAPI(title="watsonx webchat API", lifespan=lifespan)
+
+if telemetry.TELEMETRY_EXPORTER != "none":
+    try:
+        from opentelemetry.instrumentation.fastapi import FastAPIInstrumentor
+        telemetry.setup()
+        FastAPIInstrumentor.instrument_app(app)
+    except ImportError:
+        print("opentelemetry-instrumentation-fastapi is not installed, HTTP spans are not exported")
+
+
+def collection_of(request):
+    return request.collection or utils.create_collection_name(request.url)
+
+
+def answer_model(api_key, project_id):
+    # The pooled watsonx client of these credentials, or the shared fake model
+    if fake_model is not None:
+        return fake_model
+    return webchat.get_answer_model(api_key, project_id)
+
+
+async def run_traced(name, url, function, *args, **kwargs):
+    # Runs the blocking pipeline in a worker thread; the breakdown of the request
+    # is returned with the result
+    async with limiter.slot():
+        with telemetry.request(name, url=url) as request_trace:
+            result = await run_in_threadpool(function, *args, **kwargs)
+    return result, request_trace.as_dict()
+
+
+@app.post("/ingest")
+async def ingest(request: IngestRequest):
+    collection_name = collection_of(request)
+    if not request.wait:
+        job = webchat.ingestion_queue.submit(request.url, collection_name, utils.chromadb_client())
+        return JSONResponse(dict(job.progress(), collection=collection_name), status_code=202)
+    try:
+        collection, trace = await run_traced("api.ingest", request.url, webchat.create_embedding, request.url,
+                                             collection_name, utils.chromadb_client())
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(502, f"Error creating embeddings: {e}")
+    return {"collection": collection_name, "chunks": collection.count(), "trace": trace}
+
+
+@app.get("/ingest")
+async def ingest_status(url: str, collection: Optional[str] = None):
+    job = webchat.ingestion_queue.get(url, collection or utils.create_collection_name(url))
+    if job is None:
+        raise HTTPException(404, "No indexing job for this url")
+    return job.progress()
+
+
+def retrieve(request, collection_name):
+    client = utils.chromadb_client()
+    if request.ingest:
+        collection = webchat.create_embedding(request.url, collection_name, client)
+    else:
+        collection = webchat.get_collection(collection_name, client)
+    return webchat.retrieve_contexts(collection, request.url, [request.question], request.n_results)[0]
+
+
+@app.post("/query")
+async def query(request: QuestionRequest):
+    collection_name = collection_of(request)
+    try:
+        context, trace = await run_traced("api.query", request.url, retrieve, request, collection_name)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(502, f"Error querying the collection: {e}")
+    return {"collection": collection_name, "context": context, "trace": trace}
+
+
+def answer_question(request, collection_name, api_key, project_id):
+    # The watsonx client is created here, in the worker thread: the first one of a
+    # set of credentials imports the WML SDK and exchanges the key for a token
+    model = answer_model(api_key, project_id)
+    return webchat.answer_questions_from_web(None, None, request.url, request.question, collection_name,
+                                             utils.chromadb_client(), model=model, ingest=request.ingest,
+                                             raise_errors=True)
+
+
+@app.post("/answer")
+async def answer(request: QuestionRequest, x_watsonx_api_key: Optional[str] = Header(None),
+                 x_watsonx_project_id: Optional[str] = Header(None)):
+    collection_name = collection_of(request)
+    try:
+        answer, trace = await run_traced("api.answer", request.url, answer_question, request, collection_name,
+                                         x_watsonx_api_key, x_watsonx_project_id)
+    except HTTPException:
+        raise
+    except Exception as e:
+        raise HTTPException(502, f"Error answering the question: {e}")
+    return {"collection": collection_name, "answer": answer, "trace": trace}
+
+
+class SlotStreamingResponse(StreamingResponse):
+    # Gives the limiter slot of the request back once the response is over: sent,
+    # failed, or cancelled by a client that went away before the first piece
+    async def __call__(self, scope, receive, send):
+        try:
+            await super().__call__(scope, receive, send)
+        finally:
+            limiter.release()
+
+
+def start_answer_stream(request, collection_name, api_key, project_id):
+    # Runs up to the first piece of the answer, so that a page that cannot be
+    # indexed, or an LLM that cannot be reached, is an error status and not a 200
+    model = answer_model(api_key, project_id)
+    pieces = webchat.answer_questions_from_web_stream(None, None, request.url, request.question, collection_name,
+                                                      utils.chromadb_client(), model=model, ingest=request.ingest,
+                                                      raise_errors=True)
+    first = next(pieces, None)
+    return itertools.chain([first] if first is not None else [], pieces)
+
+
+@app.post("/answer/stream")
+async def answer_stream(request: QuestionRequest, x_watsonx_api_key: Optional[str] = Header(None),
+                        x_watsonx_project_id: Optional[str] = Header(None)):
+    collection_name = collection_of(request)
+    # The slot is taken before the response starts, so a full server still answers
+    # 429/503, and it is held until the last piece is sent
+    await limiter.acquire()
+    try:
+        pieces = await run_in_threadpool(start_answer_stream, request, collection_name, x_watsonx_api_key,
+                                         x_watsonx_project_id)
+    except BaseException as e:
+        limiter.release()
+        if isinstance(e, Exception) and not isinstance(e, HTTPException):
+            raise HTTPException(502, f"Error answering the question: {e}")
+        raise
+    return SlotStreamingResponse(iterate_in_threadpool(pieces), media_type="text/plain; charset=utf-8")
+
+
+@app.get("/health")
+async def health():
+    return {"status": "ok", "embedding_model_loaded": webchat.model.loaded}
+
+
+@app.get("/stats")
+async def stats():
+    return {
+        "time": time.time(),
+        "limiter": limiter.stats(),
+        "model_pool": webchat.model_pool.stats(),
+        "ingestion_cache": webchat.ingestion_cache.stats(),
+        "answer_cache": webchat.answer_cache.stats(),
+        "collections": webchat.collection_registry.stats(),
+        "ingestion_jobs": [job.progress() for job in webchat.ingestion_queue.jobs()],
+    }
@@ -1,13 +1,69 @@
 import os
+import time
 from dotenv import load_dotenv
 import streamlit as st
 import webchat
 import utils
+import llm
+import telemetry
 
 # URL of the hosted LLMs is hardcoded because at this time all LLMs share the same endpoint
 url = "https://us-south.ml.cloud.ibm.com"
 
+@st.cache_resource
+def get_chromadb_client():
+    # Shared by all sessions and reruns: the indexes stay loaded between questions
+    return utils.chromadb_client()
+
+def show_request_trace(request_trace):
+    # Debug panel: where the time of the last answer, or of the indexing of its
+    # page, went
+    breakdown = request_trace.as_dict()
+    with st.expander(f"Timings of {breakdown['name']}: {breakdown['total_s']:.2f} s", expanded=True):
+        st.table([{"stage": stage, "seconds": round(totals["seconds"], 3), "calls": totals["calls"]}
+                  for stage, totals in breakdown["stages"].items()])
+        if breakdown["counters"]:
+            st.table([{"counter": name, "value": value} for name, value in breakdown["counters"].items()])
+        st.caption("Stages can be nested: the question is embedded during the query.")
+
+def wait_for_first_batch(job):
+    # Polls the background job until the first chunks of the page can be queried;
+    # the rest of the page keeps being indexed while the question is answered
+    placeholder = st.empty()
+    while not job.wait_first_batch(timeout=0.2):
+        placeholder.info(str(job))
+    placeholder.empty()
+    if job.state == "failed":
+        st.error(str(job))
+        return False
+    return True
+
+def show_collections():
+    # Indexed sites, most recently used first, against the budget they are evicted at
+    registry = webchat.collection_registry
+    rows = registry.stats()
+    used = sum(row["size_mb"] for row in rows)
+    budget = f"{registry.budget_bytes / (1024 * 1024):.0f} MB" if registry.budget_bytes > 0 else "no limit"
+    st.sidebar.caption(f"{len(rows)} sites, {used:.1f} MB of {budget}, {registry.evictions} evicted")
+    if rows:
+        now = time.time()
+        st.sidebar.dataframe([{"site": row["collection"], "pages": row["pages"], "chunks": row["chunks"],
+                               "MB": round(row["size_mb"], 2), "build (s)": round(row["build_s"], 1),
+                               "used (min ago)": round((now - row["last_access"]) / 60, 1)} for row in rows],
+                             hide_index=True)
+
+def show_ingestion_status(current_job):
+    st.sidebar.markdown("<hr>", unsafe_allow_html=True)
+    st.sidebar.header("Indexing")
+    if current_job is not None:
+        st.sidebar.caption(str(current_job))
+    for job in webchat.ingestion_queue.jobs():
+        if job is not current_job:
+            st.sidebar.caption(str(job))
+
 def main():
+    # Start loading the embedding model and spaCy while the page renders
+    webchat.warm_up()
     # Get the API key and project id and update global variables
     load_dotenv()
     # Initialize session state for credentials
@@ -42,6 +98,8 @@ def main():
     if project_id_input:
         st.session_state['watsonx_project_id'] = project_id_input
     
+    debug = st.sidebar.checkbox("Show timings", value=os.getenv("DEBUG_PANEL", "false").lower() == "true")
+
     # Main input area
     user_url = st.text_input('Provide a URL')
     # UI component to enter the question
@@ -50,28 +108,47 @@ def main():
     st.markdown("<hr>", unsafe_allow_html=True)
     st.subheader("Response")
     
-    collection_name = "base"
-    client = utils.chromadb_client()
+    # One collection per site, so sites can be evicted one by one
+    collection_name = utils.create_collection_name(user_url) if user_url else None
+    client = get_chromadb_client()
     
     if st.session_state['api_key'] and st.session_state['watsonx_project_id']:
         if button_clicked and user_url:
-            # Invoke the LLM when the button is clicked
-            response = webchat.answer_questions_from_web(st.session_state['api_key'], st.session_state['watsonx_project_id'], user_url, question, collection_name, client)
-            st.write(response)
+            # The page is indexed in the background (a url already being indexed is
+            # not submitted twice); the answer starts once its first batch is stored
+            job = webchat.ingestion_queue.submit(user_url, collection_name, client)
+            st.session_state['ingestion_job'] = job
+            if wait_for_first_batch(job):
+                # Invoke the LLM and show the answer as it is generated
+                stats = llm.GenerationStats()
+                with telemetry.request("answer", url=user_url) as request_trace:
+                    st.write_stream(webchat.answer_questions_from_web_stream(st.session_state['api_key'], st.session_state['watsonx_project_id'], user_url, question, collection_name, client, stats=stats, ingest=False))
+                st.caption(str(stats))
+                if not job.done.is_set():
+                    st.caption("The page is still being indexed: ask again for an answer from all of it.")
+                if debug:
+                    show_request_trace(request_trace)
+                    # The page is fetched, parsed, split, embedded and stored by the
+                    # background job, under its own trace
+                    if job.trace is not None:
+                        show_request_trace(job.trace)
     else:
         st.warning("Please provide API Key and Project ID in the sidebar.")
+
+    show_ingestion_status(st.session_state.get('ingestion_job'))
   
     # Cleaning Vector Database
     st.sidebar.markdown("<hr>", unsafe_allow_html=True)
     st.sidebar.header("Memory")
-    clean_button_clicked = st.sidebar.button("Clean Memory")
+    clean_button_clicked = st.sidebar.button("Clean Memory", help="Forget the site of the URL")
     if clean_button_clicked:
         if collection_name:
-            utils.clear_collection(collection_name, client)
+            webchat.clear_collection(collection_name, client)
             st.sidebar.success("Memory cleared successfully!")
             print("Memory cleared successfully!")
         else:
             st.sidebar.error("Collection name is not defined or empty.")
+    show_collections()
 
 if __name__ == "__main__":
     main()
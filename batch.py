@@ -0,0 +1,155 @@
+# Answers many questions about one or many web pages, for evaluation jobs:
+#
+#   python batch.py --input questions.jsonl --output answers.jsonl --workers 8 --rate 2
+#   python batch.py --url https://example.com/page --input questions.txt --output answers.jsonl
+#
+# Every line of a .jsonl input is {"url": ..., "question": ...} (an "id" is kept if
+# present); any other input has one question per line, asked about every --url.
+# Each page is indexed once and all its questions are retrieved with a single
+# vectorized query. Generations run on a bounded pool of workers, and no more than
+# --rate generations per second are started. Every output line holds the answer
+# and the time spent in each stage.
+import argparse
+import json
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor, as_completed
+
+import llm
+import webchat
+
+
+class RateLimiter:
+    # Token bucket: `rate` calls per second on average, bursts of up to `burst` calls
+    def __init__(self, rate, burst=1):
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = time.monotonic()
+        self._lock = threading.Lock()
+
+    def acquire(self):
+        # Blocks until a call is allowed; returns the seconds waited
+        if not self.rate:
+            return 0.0
+        start = time.monotonic()
+        while True:
+            with self._lock:
+                now = time.monotonic()
+                self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+                self.updated = now
+                if self.tokens >= 1:
+                    self.tokens -= 1
+                    return now - start
+                wait = (1 - self.tokens) / self.rate
+            time.sleep(wait)
+
+
+def read_questions(path, urls):
+    items = []
+    with open(path, encoding="utf-8") as file:
+        for line in file:
+            line = line.strip()
+            if not line:
+                continue
+            if path.endswith(".jsonl"):
+                item = json.loads(line)
+                items.append({"id": item.get("id", len(items)), "url": item["url"], "question": item["question"]})
+            else:
+                for url in urls:
+                    items.append({"id": len(items), "url": url, "question": line})
+    return items
+
+
+def prepare(items, collection_name, client, n_results=None, model_id=None):
+    # Indexes every page once and retrieves the context of all its questions in one
+    # query. Returns the items with their prompt (or error) and stage timings.
+    by_url = {}
+    for item in items:
+        by_url.setdefault(item["url"], []).append(item)
+    for url, url_items in by_url.items():
+        start = time.perf_counter()
+        try:
+            collection = webchat.create_embedding(url, collection_name, client)
+        except Exception as e:
+            for item in url_items:
+                item.update(error=f"Error creating embeddings: {e}", timings={"ingest_s": time.perf_counter() - start})
+            continue
+        ingest = time.perf_counter() - start
+        start = time.perf_counter()
+        try:
+            contexts = webchat.retrieve_contexts(collection, url, [item["question"] for item in url_items], n_results,
+                                                 model_id)
+        except Exception as e:
+            for item in url_items:
+                item.update(error=f"Error querying the collection: {e}", timings={"ingest_s": ingest})
+            continue
+        # The page and the query are shared by its questions, each gets its share
+        retrieve = (time.perf_counter() - start) / len(url_items)
+        for item, context in zip(url_items, contexts):
+            item["prompt"] = webchat.build_prompt(context, item["question"])
+            item["timings"] = {"ingest_s": ingest / len(url_items), "retrieve_s": retrieve}
+    return items
+
+
+def generate(item, model, rate_limiter):
+    if "error" in item:
+        return item
+    item["timings"]["rate_limit_wait_s"] = rate_limiter.acquire()
+    start = time.perf_counter()
+    try:
+        item["answer"] = model.generate_text(prompt=item["prompt"]).strip()
+    except Exception as e:
+        item["error"] = f"Error generating the answer: {e}"
+    item["timings"]["generate_s"] = time.perf_counter() - start
+    return item
+
+
+def answer_batch(items, collection_name, client, model, workers=4, rate=0.0, burst=1, n_results=None):
+    # Yields the items with their answer as the generations complete
+    rate_limiter = RateLimiter(rate, burst)
+    prepare(items, collection_name, client, n_results, webchat.model_id_of(model))
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        futures = [executor.submit(generate, item, model, rate_limiter) for item in items]
+        for future in as_completed(futures):
+            yield future.result()
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--input", required=True)
+    parser.add_argument("--output", required=True)
+    parser.add_argument("--url", action="append", default=[], help="page asked about by a plain text input")
+    parser.add_argument("--collection", default="batch")
+    parser.add_argument("--workers", type=int, default=4)
+    parser.add_argument("--rate", type=float, default=0.0, help="generations started per second, 0 for no limit")
+    parser.add_argument("--burst", type=int, default=1)
+    parser.add_argument("--n-results", type=int, default=None, help="chunks per prompt, CONTEXT_MAX_CHUNKS by default")
+    parser.add_argument("--fake-model", action="store_true", help="answer with llm.FakeModel, no watsonx call")
+    args = parser.parse_args()
+
+    items = read_questions(args.input, args.url)
+    if args.fake_model:
+        model = llm.FakeModel()
+    else:
+        webchat.get_credentials()
+        model = webchat.get_answer_model()
+    from utils import chromadb_client
+    client = chromadb_client()
+
+    start = time.perf_counter()
+    failed = 0
+    with open(args.output, "w", encoding="utf-8") as output:
+        for item in answer_batch(items, args.collection, client, model, args.workers, args.rate, args.burst,
+                                 args.n_results):
+            item.pop("prompt", None)
+            failed += "error" in item
+            output.write(json.dumps(item) + "\n")
+            output.flush()
+    elapsed = time.perf_counter() - start
+    print(f"Answered {len(items) - failed} of {len(items)} questions in {elapsed:.1f} s; "
+          f"model clients {webchat.model_pool.stats()}")
+
+
+if __name__ == "__main__":
+    main()
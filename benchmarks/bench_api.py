@@ -0,0 +1,123 @@
+# Throughput and latency of the HTTP API (api.py) at increasing concurrency. The
+# API is started with uvicorn and the fake LLM (API_FAKE_LLM=true), the pages are
+# served by a local HTTP server, so nothing leaves the machine. Requests rejected
+# by the backpressure of the API (429/503) are counted, not retried.
+#
+#   python benchmarks/bench_api.py --concurrency 1 2 4 8 16 32 --requests 64
+#   python benchmarks/bench_api.py --endpoint answer/stream --max-concurrency 4 --max-queue 8
+import argparse
+import os
+import socket
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from collections import Counter
+from concurrent.futures import ThreadPoolExecutor
+
+import requests
+
+from common import ROOT_DIR, sample_html, serve_pages
+
+QUESTIONS = [
+    "What is natural language processing?",
+    "What does error E1024 mean?",
+    "How are transformers trained?",
+    "Which endpoint should be reachable?",
+]
+
+
+def free_port():
+    with socket.socket() as sock:
+        sock.bind(("127.0.0.1", 0))
+        return sock.getsockname()[1]
+
+
+def start_api(args, work_dir):
+    port = free_port()
+    env = dict(os.environ, API_FAKE_LLM="true", API_MAX_CONCURRENCY=str(args.max_concurrency),
+               API_MAX_QUEUE=str(args.max_queue), API_QUEUE_TIMEOUT=str(args.queue_timeout),
+               # Every request does the work, no answer is served from the cache
+               ANSWER_CACHE_MAX_ENTRIES="0",
+               PYTHONPATH=os.pathsep.join(filter(None, [ROOT_DIR, os.environ.get("PYTHONPATH")])))
+    server = subprocess.Popen([sys.executable, "-m", "uvicorn", "api:app", "--port", str(port), "--log-level",
+                               "warning"], cwd=work_dir, env=env, stdout=subprocess.DEVNULL)
+    base_url = f"http://127.0.0.1:{port}"
+    deadline = time.monotonic() + 120
+    while time.monotonic() < deadline:
+        try:
+            if requests.get(base_url + "/health", timeout=1).ok:
+                return base_url, server
+        except requests.ConnectionError:
+            time.sleep(0.2)
+    server.kill()
+    raise RuntimeError("The API did not start")
+
+
+def call(session, base_url, endpoint, page_url, i):
+    body = {"url": page_url, "question": QUESTIONS[i % len(QUESTIONS)]}
+    start = time.perf_counter()
+    response = session.post(f"{base_url}/{endpoint}", json=body, stream=endpoint.endswith("stream"), timeout=300)
+    first = None
+    for _ in response.iter_content(chunk_size=None):
+        if first is None:
+            first = time.perf_counter() - start
+    return response.status_code, time.perf_counter() - start, first
+
+
+def run_level(base_url, endpoint, page_url, concurrency, count):
+    sessions = [requests.Session() for _ in range(concurrency)]
+    start = time.perf_counter()
+    with ThreadPoolExecutor(max_workers=concurrency) as executor:
+        results = list(executor.map(lambda i: call(sessions[i % concurrency], base_url, endpoint, page_url, i),
+                                    range(count)))
+    elapsed = time.perf_counter() - start
+    statuses = Counter(status for status, _, _ in results)
+    latencies = sorted(latency for status, latency, _ in results if status == 200)
+    firsts = [first for status, _, first in results if status == 200 and first is not None]
+    return {
+        "ok": statuses.get(200, 0),
+        "rejected": statuses.get(429, 0) + statuses.get(503, 0),
+        "errors": sum(count for status, count in statuses.items() if status not in (200, 429, 503)),
+        "throughput": statuses.get(200, 0) / elapsed,
+        "p50": statistics.median(latencies) if latencies else float("nan"),
+        "p95": latencies[min(int(round(0.95 * (len(latencies) - 1))), len(latencies) - 1)] if latencies else float("nan"),
+        "first": statistics.median(firsts) if firsts else float("nan"),
+    }
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--endpoint", default="answer", choices=["answer", "answer/stream", "query"])
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 2, 4, 8, 16, 32])
+    parser.add_argument("--requests", type=int, default=64, help="requests per concurrency level")
+    parser.add_argument("--page-size", type=int, default=50_000)
+    parser.add_argument("--max-concurrency", type=int, default=8, help="API_MAX_CONCURRENCY of the API")
+    parser.add_argument("--max-queue", type=int, default=32, help="API_MAX_QUEUE of the API")
+    parser.add_argument("--queue-timeout", type=float, default=30, help="API_QUEUE_TIMEOUT of the API")
+    args = parser.parse_args()
+
+    pages_url, pages_server = serve_pages({"/page.html": sample_html(args.page_size)})
+    page_url = pages_url + "/page.html"
+    # Models, caches and indexes are written to a scratch directory
+    with tempfile.TemporaryDirectory() as work_dir:
+        base_url, server = start_api(args, work_dir)
+        try:
+            # Index the page once, the levels then measure the questions only
+            requests.post(base_url + "/ingest", json={"url": page_url}, timeout=300).raise_for_status()
+            print(f"{'concurrency':>11} {'ok':>5} {'429/503':>8} {'errors':>7} {'answers/s':>10} {'p50 (s)':>8} "
+                  f"{'p95 (s)':>8} {'first byte (s)':>15}")
+            for concurrency in args.concurrency:
+                row = run_level(base_url, args.endpoint, page_url, concurrency, args.requests)
+                print(f"{concurrency:>11} {row['ok']:>5} {row['rejected']:>8} {row['errors']:>7} "
+                      f"{row['throughput']:>10.2f} {row['p50']:>8.2f} {row['p95']:>8.2f} {row['first']:>15.2f}")
+            print(requests.get(base_url + "/stats", timeout=10).json()["limiter"])
+        finally:
+            server.terminate()
+            server.wait()
+            pages_server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
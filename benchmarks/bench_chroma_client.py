@@ -0,0 +1,96 @@
+# Query latency of the Chroma index: rebuilt in memory on every Streamlit rerun
+# (the old chromadb.Client(Settings(persist_directory=...)) behaviour), opened from
+# disk by a fresh process (cold) and queried through the shared persistent client
+# (warm). Random unit vectors stand in for sentence embeddings.
+#
+#   python benchmarks/bench_chroma_client.py --chunks 1000 10000 --queries 50
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+import common  # noqa: F401 (puts the repository on sys.path)
+
+DIMENSION = 384
+
+
+def vectors(count, seed):
+    matrix = np.random.default_rng(seed).standard_normal((count, DIMENSION)).astype(np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def fill(collection, count, batch_size=5000):
+    matrix = vectors(count, 0)
+    for start in range(0, count, batch_size):
+        ids = [str(i) for i in range(start, min(start + batch_size, count))]
+        collection.add(ids=ids, embeddings=matrix[start:start + batch_size],
+                       documents=[f"sentence {i}" for i in ids], metadatas=[{"source": "page"}] * len(ids))
+
+
+def query(collection, vector):
+    return collection.query(query_embeddings=[vector], n_results=5, where={"source": "page"})
+
+
+def get_collection(client, name):
+    import webchat
+    return client.get_or_create_collection(name, metadata=webchat.HNSW_SETTINGS, embedding_function=None)
+
+
+def cold_query(path, name):
+    # Runs in a new process: open the persisted index and answer one query
+    import chromadb
+    start = time.perf_counter()
+    client = chromadb.PersistentClient(path=path, settings=chromadb.Settings(anonymized_telemetry=False))
+    query(get_collection(client, name), vectors(1, 1)[0])
+    print(json.dumps({"cold_s": time.perf_counter() - start}))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, nargs="+", default=[1000, 10000])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--cold", nargs=2, help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.cold:
+        cold_query(*args.cold)
+        return
+
+    import chromadb
+    queries = vectors(args.queries, 1)
+    print(f"{'chunks':>8} {'rebuild per rerun (ms)':>23} {'cold (ms)':>10} {'warm p50 (ms)':>14} {'warm p95 (ms)':>14}")
+    for count in args.chunks:
+        name = f"bench_{count}"
+        # Old behaviour: an in-memory client per rerun has to index the page again
+        start = time.perf_counter()
+        ephemeral = chromadb.EphemeralClient()
+        fill(get_collection(ephemeral, name), count)
+        query(get_collection(ephemeral, name), queries[0])
+        rebuild = time.perf_counter() - start
+        ephemeral.delete_collection(name)
+
+        with tempfile.TemporaryDirectory() as path:
+            client = chromadb.PersistentClient(path=path, settings=chromadb.Settings(anonymized_telemetry=False))
+            fill(get_collection(client, name), count)
+            output = subprocess.run([sys.executable, os.path.abspath(__file__), "--cold", path, name],
+                                    capture_output=True, text=True, check=True).stdout
+            cold = json.loads(output.strip().splitlines()[-1])["cold_s"]
+            collection = get_collection(client, name)
+            query(collection, queries[0])
+            latencies = []
+            for vector in queries:
+                start = time.perf_counter()
+                query(collection, vector)
+                latencies.append(time.perf_counter() - start)
+        p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+        print(f"{count:>8} {rebuild * 1000:>23.1f} {cold * 1000:>10.1f} "
+              f"{statistics.median(latencies) * 1000:>14.2f} {p95 * 1000:>14.2f}")
+
+
+if __name__ == "__main__":
+    main()
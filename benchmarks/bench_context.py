@@ -0,0 +1,72 @@
+# Prompt context as before (top 5 chunks joined) vs the context builder
+# (over-fetch, near-duplicate removal, optional rerank, token budget): hit rate
+# (the expected answer is in the context), context tokens and build time on the
+# fixture questions. Window chunks are used since their overlap creates the
+# near-duplicates the builder removes.
+#
+#   python benchmarks/bench_context.py --window 200:40 --candidates 20 --max-chunks 5
+import argparse
+import statistics
+import time
+
+from eval_chunking import load_pages
+
+import chromadb
+import context
+import vectorstore
+import webchat
+from chunking import Chunker
+from pipeline import ChunkSync
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--window", default="200:40", help="max_tokens:overlap_tokens, or 'sentence'")
+    parser.add_argument("--candidates", type=int, default=context.CONTEXT_CANDIDATES)
+    parser.add_argument("--max-chunks", type=int, default=context.CONTEXT_MAX_CHUNKS)
+    parser.add_argument("--filler", type=int, default=50_000, help="characters of filler text per page")
+    parser.add_argument("--reranker", default=None, help="cross-encoder model name, e.g. cross-encoder/ms-marco-MiniLM-L-6-v2")
+    args = parser.parse_args()
+
+    pages, questions = load_pages(args.filler)
+    if args.window == "sentence":
+        chunker = Chunker("sentence")
+    else:
+        max_tokens, overlap = (int(value) for value in args.window.split(":"))
+        chunker = Chunker("window", max_tokens, overlap, tokenizer=webchat.model.tokenizer)
+    client = chromadb.EphemeralClient()
+    store = vectorstore.ChromaVectorStore(client.get_or_create_collection(
+        "bench_context", metadata=webchat.HNSW_SETTINGS, embedding_function=webchat.get_embedding_function_class()()))
+    for name, sentences in pages.items():
+        sync = ChunkSync(store, name)
+        sync.upsert(list(chunker(sentences)))
+        sync.finish()
+
+    reranker = None
+    if args.reranker:
+        from sentence_transformers import CrossEncoder
+        reranker = CrossEncoder(args.reranker, device="cpu")
+    builder = context.ContextBuilder(webchat.embedding_engine.encode, webchat.chunker.count_tokens, reranker,
+                                     args.max_chunks, candidates=args.candidates)
+    rows = {"top chunks": [], "context builder": []}
+    for name, items in questions.items():
+        results = store.query(query_texts=[item["question"] for item in items],
+                              n_results=max(args.candidates, args.max_chunks), where={"source": name})
+        for item, documents in zip(items, results["documents"]):
+            start = time.perf_counter()
+            built, report = builder.build(item["question"], documents, max_chunks=args.max_chunks)
+            elapsed = time.perf_counter() - start
+            baseline = context.SEPARATOR.join(documents[:args.max_chunks])
+            rows["top chunks"].append((item["answer"] in baseline, report.baseline_tokens, 0.0))
+            rows["context builder"].append((item["answer"] in built, report.context_tokens, elapsed))
+
+    print(f"{'context':<16} {'hit rate':>9} {'tokens/prompt':>14} {'build (ms)':>11}")
+    for label, results in rows.items():
+        hits = sum(hit for hit, _, _ in results) / len(results)
+        tokens = statistics.mean(tokens for _, tokens, _ in results)
+        build = statistics.median(elapsed for _, _, elapsed in results) * 1000
+        print(f"{label:<16} {hits:>9.0%} {tokens:>14.1f} {build:>11.2f}")
+
+
+if __name__ == "__main__":
+    main()
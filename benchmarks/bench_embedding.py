@@ -0,0 +1,62 @@
+# Throughput and memory of the embedding step on CPU for a large page.
+#
+#   python benchmarks/bench_embedding.py --sentences 10000 --batch-sizes 32 64 128
+import argparse
+import os
+import tempfile
+import tracemalloc
+
+from common import peak_rss_mb, sample_text, timed
+from models import EMBEDDING_MODEL_NAME as MODEL_NAME
+
+
+def page_sentences(count):
+    import splitter
+    sentences = []
+    while len(sentences) < count:
+        sentences.extend(splitter.split_text_into_sentences(sample_text(200_000), "sentencizer"))
+    return sentences[:count]
+
+
+def measure(name, function, sentences):
+    tracemalloc.start()
+    _, elapsed = timed(function, sentences)
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    print(f"{name:<28} {len(sentences) / elapsed:>12.1f} {peak / (1024 * 1024):>18.1f} {peak_rss_mb():>14.1f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sentences", type=int, default=10_000)
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[32, 64, 128])
+    args = parser.parse_args()
+
+    from cache import EmbeddingCache
+    from embeddings import EmbeddingEngine
+    from models import embedding_model
+
+    model = embedding_model.get()
+    sentences = page_sentences(args.sentences)
+    # Warm up the model so the first measurement does not pay for it
+    model.encode(sentences[:64])
+
+    print(f"{'path':<28} {'sentences/s':>12} {'python peak (MB)':>18} {'peak RSS (MB)':>14}")
+    measure("encode().tolist()", lambda texts: model.encode(texts).tolist(), sentences)
+    for batch_size in args.batch_sizes:
+        engine = EmbeddingEngine(model, batch_size=batch_size)
+        measure(f"engine batch={batch_size}", engine.encode, sentences)
+        engine = EmbeddingEngine(model, batch_size=batch_size, sort_by_length=False)
+        measure(f"engine batch={batch_size} unsorted", engine.encode, sentences)
+
+    # Memo table: the first pass fills it, the second one reads it back
+    with tempfile.TemporaryDirectory() as cache_dir:
+        cache = EmbeddingCache(path=os.path.join(cache_dir, "embeddings.sqlite3"), max_entries=len(sentences))
+        engine = EmbeddingEngine(model, cache=cache, cache_key=MODEL_NAME)
+        measure("engine + memo table (cold)", engine.encode, sentences)
+        measure("engine + memo table (warm)", engine.encode, sentences)
+        print(f"memo table: {cache.stats()}")
+
+
+if __name__ == "__main__":
+    main()
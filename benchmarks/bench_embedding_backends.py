@@ -0,0 +1,111 @@
+# Throughput, memory and accuracy of the embedding backends (EMBEDDING_BACKEND) on
+# CPU. Every backend runs in its own process, so the load time and the peak RSS
+# are its own; the vectors of the ONNX backends are then compared with the
+# PyTorch ones and the script exits with status 1 when the cosine drift of a
+# sentence exceeds the limit of its backend.
+#
+#   python benchmarks/bench_embedding_backends.py --sentences 5000 --threads 4
+#   python benchmarks/bench_embedding_backends.py --backends torch onnx-int8 --max-drift onnx-int8=0.03
+#
+# The first ONNX run exports (and quantizes) the model into .cache/onnx.
+import argparse
+import json
+import os
+import subprocess
+import sys
+import tempfile
+import time
+
+import numpy as np
+
+from common import ROOT_DIR, peak_rss_mb
+from onnx_encoder import MAX_DRIFT, cosine_drift
+
+BACKENDS = ["torch", "onnx", "onnx-int8"]
+
+
+def measure(args):
+    # Runs in the child process, with EMBEDDING_BACKEND set
+    from bench_embedding import page_sentences
+    from embeddings import EmbeddingEngine
+    import models
+
+    sentences = page_sentences(args.sentences)
+    start = time.perf_counter()
+    model = models.embedding_model.get()
+    load_s = time.perf_counter() - start
+    engine = EmbeddingEngine(model, batch_size=args.batch_size)
+    engine.encode(sentences[:args.batch_size])
+    start = time.perf_counter()
+    vectors = engine.encode(sentences)
+    elapsed = time.perf_counter() - start
+    np.save(args.vectors, vectors)
+    files = []
+    if models.EMBEDDING_BACKEND != "torch":
+        import onnx_encoder
+        name = onnx_encoder.QUANTIZED_MODEL_FILE if models.EMBEDDING_BACKEND == "onnx-int8" else onnx_encoder.MODEL_FILE
+        files.append(os.path.join(models.onnx_model_dir(), name))
+    print(json.dumps({
+        "load_s": load_s,
+        "sentences_per_s": len(sentences) / elapsed,
+        "peak_rss_mb": peak_rss_mb(),
+        "model_mb": sum(os.path.getsize(path) for path in files) / (1024 * 1024) if files else None,
+    }))
+
+
+def run_backend(backend, args, vectors):
+    env = dict(os.environ, EMBEDDING_BACKEND=backend, EMBEDDING_THREADS=str(args.threads))
+    command = [sys.executable, os.path.abspath(__file__), "--measure", "--vectors", vectors,
+               "--sentences", str(args.sentences), "--batch-size", str(args.batch_size)]
+    output = subprocess.run(command, env=env, cwd=ROOT_DIR, capture_output=True, text=True, check=True).stdout
+    # The model loaders print too; the result is the last line
+    return json.loads(output.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--backends", nargs="+", choices=BACKENDS, default=BACKENDS)
+    parser.add_argument("--sentences", type=int, default=5000)
+    parser.add_argument("--batch-size", type=int, default=64)
+    parser.add_argument("--threads", type=int, default=0, help="EMBEDDING_THREADS, 0 = default of the runtime")
+    parser.add_argument("--max-drift", nargs="*", default=[], metavar="BACKEND=DRIFT")
+    parser.add_argument("--measure", action="store_true", help=argparse.SUPPRESS)
+    parser.add_argument("--vectors", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.measure:
+        measure(args)
+        return
+
+    limits = dict(MAX_DRIFT)
+    for item in args.max_drift:
+        backend, drift = item.split("=")
+        limits[backend] = float(drift)
+    backends = ["torch"] + [backend for backend in args.backends if backend != "torch"]
+
+    print(f"{'backend':<10} {'load (s)':>9} {'sentences/s':>12} {'peak RSS (MB)':>14} {'model (MB)':>11} "
+          f"{'mean drift':>11} {'max drift':>10}")
+    failures = 0
+    with tempfile.TemporaryDirectory() as work_dir:
+        reference = None
+        for backend in backends:
+            path = os.path.join(work_dir, f"{backend}.npy")
+            result = run_backend(backend, args, path)
+            vectors = np.load(path)
+            mean_drift = max_drift = ""
+            if reference is None:
+                reference = vectors
+            else:
+                drift = cosine_drift(reference, vectors)
+                mean_drift, max_drift = f"{drift.mean():.2e}", f"{drift.max():.2e}"
+                if drift.max() > limits.get(backend, 0.0):
+                    failures += 1
+                    max_drift += " FAIL"
+            model_mb = f"{result['model_mb']:.1f}" if result["model_mb"] is not None else "-"
+            print(f"{backend:<10} {result['load_s']:>9.2f} {result['sentences_per_s']:>12.1f} "
+                  f"{result['peak_rss_mb']:>14.1f} {model_mb:>11} {mean_drift:>11} {max_drift:>10}")
+    print(f"Drift limits: {limits}")
+    sys.exit(1 if failures else 0)
+
+
+if __name__ == "__main__":
+    main()
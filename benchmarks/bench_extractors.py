@@ -0,0 +1,97 @@
+# Parse time and extracted-text quality of the HTML extractor backends on the
+# saved pages in benchmarks/fixtures. Quality is the share of the expected
+# content phrases found in the text and the number of boilerplate phrases
+# (navigation, footers, cookie banners) that leaked into it.
+#
+#   python benchmarks/bench_extractors.py --repeat 20 --large-size 2000000
+import argparse
+import json
+import os
+import statistics
+
+from common import timed
+
+import extractors
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def legacy_extract(html):
+    # The original parse_html: <p> elements only, pure-Python parser
+    from bs4 import BeautifulSoup
+    soup = BeautifulSoup(html, "html.parser")
+    return " ".join(p.get_text() for p in soup.find_all("p")).replace("\xa0", " ")
+
+
+def incremental_extract(html, piece_size=64 * 1024):
+    parser = extractors.IncrementalExtractor()
+    for start in range(0, len(html), piece_size):
+        parser.feed(html[start:start + piece_size])
+    parser.close()
+    return " ".join(parser.blocks)
+
+
+def backends():
+    found = {"legacy (<p> only)": legacy_extract}
+    for name in ["html.parser", "bs4-lxml", "lxml", "selectolax"]:
+        extractor = extractors.get_extractor(name)
+        try:
+            extractor.extract("<p>probe</p>")
+        except ImportError:
+            print(f"Skipping {name}: not installed")
+            continue
+        found[name] = extractor.extract
+    found["incremental"] = incremental_extract
+    return found
+
+
+def load_fixtures():
+    with open(os.path.join(FIXTURES_DIR, "expected.json")) as file:
+        expected = json.load(file)
+    pages = {}
+    for name in expected:
+        with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as file:
+            pages[name] = file.read()
+    return pages, expected
+
+
+def large_page(pages, size):
+    # The bodies of the fixtures repeated until the page has about `size` characters
+    bodies = [html.split("<body>", 1)[1].rsplit("</body>", 1)[0] for html in pages.values()]
+    parts = []
+    length = 0
+    while length < size:
+        body = bodies[len(parts) % len(bodies)]
+        parts.append(body)
+        length += len(body)
+    return "<html><body>" + "".join(parts) + "</body></html>"
+
+
+def median_time(function, html, repeat):
+    return statistics.median(timed(function, html)[1] for _ in range(repeat))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--repeat", type=int, default=20)
+    parser.add_argument("--large-size", type=int, default=2_000_000)
+    args = parser.parse_args()
+
+    pages, expected = load_fixtures()
+    big = large_page(pages, args.large_size)
+    available = backends()
+    print(f"{'backend':<18} {'fixtures (ms)':>14} {'large page (ms)':>16} {'recall':>8} {'leaked':>7}")
+    for name, extract in available.items():
+        fixture_time = sum(median_time(extract, html, args.repeat) for html in pages.values())
+        large_time = median_time(extract, big, max(args.repeat // 10, 1))
+        found = total = leaked = 0
+        for page, html in pages.items():
+            text = " ".join(extract(html).split())
+            found += sum(phrase in text for phrase in expected[page]["must_include"])
+            total += len(expected[page]["must_include"])
+            leaked += sum(phrase in text for phrase in expected[page]["must_exclude"])
+        print(f"{name:<18} {fixture_time * 1000:>14.2f} {large_time * 1000:>16.1f} {found / total:>8.0%} {leaked:>7}")
+
+
+if __name__ == "__main__":
+    main()
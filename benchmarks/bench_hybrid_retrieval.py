@@ -0,0 +1,65 @@
+# Dense-only vs hybrid (dense + BM25, reciprocal rank fusion) retrieval on the
+# question/answer pairs of benchmarks/fixtures: hit rate (the expected answer is
+# in the top-k chunks) and query latency. Filler text is added to every page as
+# distractors, like eval_chunking.py does.
+#
+#   python benchmarks/bench_hybrid_retrieval.py --weights 1:1 1:2 2:1 --top-k 5 --filler 50000
+import argparse
+import statistics
+import time
+
+from eval_chunking import load_pages
+
+import chromadb
+import retrieval
+import vectorstore
+import webchat
+from pipeline import ChunkSync
+
+
+def evaluate(label, store, questions, top_k):
+    hits = total = 0
+    latencies = []
+    for name, items in questions.items():
+        for item in items:
+            start = time.perf_counter()
+            documents = store.query(query_texts=[item["question"]], n_results=top_k,
+                                    where={"source": name})["documents"][0]
+            latencies.append(time.perf_counter() - start)
+            hits += any(item["answer"] in document for document in documents)
+            total += 1
+    p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+    print(f"{label:<16} {hits / total:>9.0%} {statistics.median(latencies) * 1000:>15.2f} {p95 * 1000:>15.2f}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--weights", nargs="+", default=["1:1", "1:2", "2:1"], help="dense:sparse weight pairs")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--candidates", type=int, default=retrieval.RETRIEVAL_CANDIDATES)
+    parser.add_argument("--filler", type=int, default=50_000, help="characters of filler text per page")
+    args = parser.parse_args()
+
+    pages, questions = load_pages(args.filler)
+    client = chromadb.EphemeralClient()
+    dense = vectorstore.ChromaVectorStore(client.get_or_create_collection(
+        "bench_hybrid", metadata=webchat.HNSW_SETTINGS, embedding_function=webchat.get_embedding_function_class()()))
+    index = retrieval.BM25Index()
+    store = retrieval.HybridStore(dense, index)
+    start = time.perf_counter()
+    for name, sentences in pages.items():
+        sync = ChunkSync(store, name)
+        sync.upsert(sentences)
+        sync.finish()
+    print(f"Indexed {dense.count()} chunks in {time.perf_counter() - start:.2f} s")
+
+    print(f"{'retrieval':<16} {'hit rate':>9} {'query p50 (ms)':>15} {'query p95 (ms)':>15}")
+    evaluate("dense", dense, questions, args.top_k)
+    for weights in args.weights:
+        dense_weight, sparse_weight = (float(value) for value in weights.split(":"))
+        hybrid = retrieval.HybridStore(dense, index, "hybrid", dense_weight, sparse_weight, args.candidates)
+        evaluate(f"hybrid {weights}", hybrid, questions, args.top_k)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,51 @@
+# Model client setup per question vs a pooled client, against llm.FakeModel whose
+# `setup_delay` stands in for the authentication and connection setup of a
+# watsonx Model. Questions are answered by `--threads` concurrent sessions.
+#
+#   python benchmarks/bench_model_pool.py --setup-delay 0.8 --questions 40 --threads 4
+import argparse
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import common  # noqa: F401 (puts the repository on sys.path)
+import llm
+
+PARAMS = {"max_new_tokens": 100, "min_new_tokens": 50, "decoding_method": "greedy"}
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--setup-delay", type=float, default=0.8)
+    parser.add_argument("--generate-delay", type=float, default=0.2)
+    parser.add_argument("--questions", type=int, default=40)
+    parser.add_argument("--threads", type=int, default=4)
+    args = parser.parse_args()
+
+    def factory(model_id, params, api_key, project_id, url):
+        return llm.FakeModel(first_token_delay=args.generate_delay, token_delay=0, setup_delay=args.setup_delay)
+
+    def per_question(_):
+        model = factory("llama", PARAMS, "key", "project", "http://localhost")
+        return model.generate_text(prompt="question")
+
+    pool = llm.ModelPool(factory)
+
+    def pooled(_):
+        model = pool.get("llama", PARAMS, "key", "project", "http://localhost")
+        return model.generate_text(prompt="question")
+
+    results = {}
+    for name, answer in [("per question", per_question), ("pooled", pooled)]:
+        start = time.perf_counter()
+        with ThreadPoolExecutor(args.threads) as executor:
+            list(executor.map(answer, range(args.questions)))
+        results[name] = time.perf_counter() - start
+
+    print(f"{'client':<14} {'total (s)':>10} {'per question (ms)':>18}")
+    for name, seconds in results.items():
+        print(f"{name:<14} {seconds:>10.2f} {seconds / args.questions * 1000:>18.1f}")
+    print(f"pool: {pool.stats()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,76 @@
+# Compares the old per-request spacy.load() path with the cached splitter pipelines.
+# Every (mode, size) pair runs in its own process so that peak RSS is not shared.
+#
+#   python benchmarks/bench_sentence_splitter.py --sizes 1000000 4000000
+import argparse
+import json
+import subprocess
+import sys
+
+from common import peak_rss_mb, sample_text, timed
+
+MODES = ["legacy", "full", "sentencizer"]
+
+
+def legacy_split(text):
+    # The original implementation of webchat.split_text_into_sentences
+    import spacy
+    nlp = spacy.load("en_core_web_md")
+    # spaCy refuses texts longer than 1,000,000 characters by default
+    nlp.max_length = max(nlp.max_length, len(text) + 1)
+    doc = nlp(text)
+    return [sent.text.strip() for sent in doc.sents]
+
+
+def run_child(mode, size, repeat):
+    import splitter
+    text = sample_text(size)
+    if mode == "legacy":
+        split = legacy_split
+    else:
+        def split(text):
+            return splitter.split_text_into_sentences(text, mode)
+    timings = []
+    for _ in range(repeat):
+        sentences, elapsed = timed(split, text)
+        timings.append(elapsed)
+    warm = timings[1:] or timings
+    print(json.dumps({
+        "mode": mode,
+        "chars": len(text),
+        "sentences": len(sentences),
+        "first_call_s": round(timings[0], 3),
+        "warm_call_s": round(sum(warm) / len(warm), 3),
+        "peak_rss_mb": round(peak_rss_mb(), 1),
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--sizes", type=int, nargs="+", default=[1_000_000, 4_000_000])
+    parser.add_argument("--modes", nargs="+", default=MODES, choices=MODES)
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--child", action="store_true", help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.modes[0], args.sizes[0], args.repeat)
+        return
+
+    print(f"{'mode':<12} {'chars':>10} {'sentences':>10} {'first (s)':>10} {'warm (s)':>10} {'peak RSS (MB)':>14}")
+    for size in args.sizes:
+        for mode in args.modes:
+            output = subprocess.run(
+                [sys.executable, __file__, "--child", "--modes", mode, "--sizes", str(size), "--repeat", str(args.repeat)],
+                capture_output=True, text=True,
+            )
+            if output.returncode != 0:
+                print(f"{mode:<12} {size:>10} failed: {output.stderr.strip().splitlines()[-1]}")
+                continue
+            row = json.loads(output.stdout.strip().splitlines()[-1])
+            print(f"{row['mode']:<12} {row['chars']:>10} {row['sentences']:>10} {row['first_call_s']:>10} "
+                  f"{row['warm_call_s']:>10} {row['peak_rss_mb']:>14}")
+
+
+if __name__ == "__main__":
+    main()
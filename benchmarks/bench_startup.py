@@ -0,0 +1,74 @@
+# Measures the cost of `import webchat` and the time to the first answer in a fresh
+# process, with and without warming up the models while the page "renders".
+# Generation is replaced by a stub so only the local part of the pipeline is timed.
+#
+#   python benchmarks/bench_startup.py --runs 3 --render-delay 1.0
+import argparse
+import json
+import statistics
+import subprocess
+import sys
+import time
+
+from common import sample_html, serve_pages
+
+
+class StubModel:
+    def generate(self, prompt):
+        return {"results": [{"generated_text": "stub answer"}]}
+
+
+def run_child(warm_up, render_delay):
+    start = time.perf_counter()
+    import webchat
+    import_time = time.perf_counter() - start
+
+    import chromadb
+
+    if warm_up:
+        webchat.warm_up()
+    # Time the user needs to type the URL and the question
+    time.sleep(render_delay)
+
+    base_url, server = serve_pages({"/page": sample_html(50_000)})
+    webchat.get_model = lambda *args, **kwargs: StubModel()
+    # Measure a cold encode, not the sentences left in the on-disk memo table
+    webchat.embedding_engine.cache = None
+    question_start = time.perf_counter()
+    webchat.answer_questions_from_web("", "", f"{base_url}/page", "What is NLP?", "startup_bench", chromadb.EphemeralClient())
+    end = time.perf_counter()
+    server.shutdown()
+    print(json.dumps({
+        "import_s": import_time,
+        "question_to_answer_s": end - question_start,
+        "process_to_answer_s": end - start,
+    }))
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--runs", type=int, default=3)
+    parser.add_argument("--render-delay", type=float, default=1.0)
+    parser.add_argument("--child", choices=["cold", "warm"], help=argparse.SUPPRESS)
+    args = parser.parse_args()
+
+    if args.child:
+        run_child(args.child == "warm", args.render_delay)
+        return
+
+    print(f"{'mode':<6} {'import webchat (s)':>19} {'question to answer (s)':>23} {'start to answer (s)':>20}")
+    for mode in ["cold", "warm"]:
+        rows = []
+        for _ in range(args.runs):
+            output = subprocess.run(
+                [sys.executable, __file__, "--child", mode, "--render-delay", str(args.render_delay)],
+                capture_output=True, text=True, check=True,
+            )
+            rows.append(json.loads(output.stdout.strip().splitlines()[-1]))
+        medians = {key: statistics.median(row[key] for row in rows) for key in rows[0]}
+        print(f"{mode:<6} {medians['import_s']:>19.3f} {medians['question_to_answer_s']:>23.3f} "
+              f"{medians['process_to_answer_s']:>20.3f}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+# Time until the user sees the first words of the answer, blocking vs streaming,
+# against llm.FakeModel so that no watsonx credentials are needed.
+#
+#   python benchmarks/bench_streaming.py --first-token-delay 1.0 --token-delay 0.05 --words 80
+import argparse
+import time
+
+from common import sample_html, serve_pages
+
+import chromadb
+import llm
+import webchat
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--first-token-delay", type=float, default=1.0)
+    parser.add_argument("--token-delay", type=float, default=0.05)
+    parser.add_argument("--words", type=int, default=80)
+    args = parser.parse_args()
+
+    answer = " ".join(["word"] * args.words)
+    model = llm.FakeModel(answer, args.first_token_delay, args.token_delay)
+    base_url, server = serve_pages({"/page": sample_html(20_000)})
+    client = chromadb.EphemeralClient()
+    url = f"{base_url}/page"
+    question = "What is NLP?"
+    # Index the page first so that both runs only retrieve and generate
+    webchat.create_embedding(url, "streaming_bench", client)
+
+    start = time.perf_counter()
+    webchat.answer_questions_from_web("", "", url, question, "streaming_bench", client, model=model)
+    blocking = time.perf_counter() - start
+
+    stats = llm.GenerationStats()
+    start = time.perf_counter()
+    first_piece = None
+    for _ in webchat.answer_questions_from_web_stream("", "", url, question, "streaming_bench", client,
+                                                      model=model, stats=stats):
+        if first_piece is None:
+            first_piece = time.perf_counter() - start
+    streaming = time.perf_counter() - start
+    server.shutdown()
+
+    print(f"{'mode':<10} {'first words shown (s)':>22} {'complete (s)':>13}")
+    print(f"{'blocking':<10} {blocking:>22.2f} {blocking:>13.2f}")
+    print(f"{'streaming':<10} {first_piece:>22.2f} {streaming:>13.2f}")
+    print(f"generation: {stats.as_dict()}")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,102 @@
+# Ingest and query latency of the vector store backends at growing numbers of
+# chunks. Random unit vectors stand in for sentence embeddings; every query is
+# filtered on one page, as the app does. The recall is the share of the exact
+# top-k (float32 numpy store) that a backend returns; the memory is what the
+# vectors a query scans take in RAM, per million vectors (VECTOR_PRECISION).
+#
+#   python benchmarks/bench_vector_store.py --chunks 1000 10000 100000 --queries 50
+#   python benchmarks/bench_vector_store.py --chunks 1000000 --backends numpy "numpy float16" "numpy int8"
+import argparse
+import statistics
+import tempfile
+import time
+
+import numpy as np
+
+import common  # noqa: F401 (puts the repository on sys.path)
+import vectorstore
+
+DIMENSION = 384
+BATCH_SIZE = 5000
+
+
+def vectors(count, seed):
+    matrix = np.random.default_rng(seed).standard_normal((count, DIMENSION)).astype(np.float32)
+    return matrix / np.linalg.norm(matrix, axis=1, keepdims=True)
+
+
+def chroma_store(name):
+    import chromadb
+    import webchat
+    client = chromadb.EphemeralClient()
+    return vectorstore.ChromaVectorStore(client.get_or_create_collection(
+        name, metadata=webchat.HNSW_SETTINGS, embedding_function=None))
+
+
+def backends(directory):
+    return {
+        "chroma": chroma_store,
+        "numpy": lambda name: vectorstore.NumpyVectorStore(name, None, precision="float32"),
+        "numpy (mmap)": lambda name: vectorstore.NumpyVectorStore(name, None, directory, precision="float32"),
+        "numpy float16": lambda name: vectorstore.NumpyVectorStore(name, None, precision="float16", rescore=4),
+        "numpy int8": lambda name: vectorstore.NumpyVectorStore(name, None, precision="int8", rescore=4),
+        "numpy int8 approx": lambda name: vectorstore.NumpyVectorStore(name, None, precision="int8", rescore=0),
+    }
+
+
+def exact_top_k(matrix, queries, pages, k):
+    # Ids of the true top-k of every query among the chunks of page-0
+    rows = np.arange(0, len(matrix), pages)
+    scores = queries @ matrix[rows].T
+    return [set(str(row) for row in rows[np.argsort(-query_scores)[:k]]) for query_scores in scores]
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--chunks", type=int, nargs="+", default=[1000, 10000, 100000])
+    parser.add_argument("--queries", type=int, default=50)
+    parser.add_argument("--pages", type=int, default=10)
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--backends", nargs="+", default=None, help="default: all")
+    args = parser.parse_args()
+
+    queries = vectors(args.queries, 1)
+    print(f"{'backend':<18} {'chunks':>8} {'ingest (s)':>11} {'query p50 (ms)':>15} {'query p95 (ms)':>15} "
+          f"{'recall@' + str(args.top_k):>9} {'MB / 1M vectors':>16}")
+    with tempfile.TemporaryDirectory() as directory:
+        for count in args.chunks:
+            matrix = vectors(count, 0)
+            expected = exact_top_k(matrix, queries, args.pages, args.top_k)
+            for backend, create in backends(directory).items():
+                if args.backends and backend not in args.backends:
+                    continue
+                name = f"bench_{count}"
+                store = create(name)
+                start = time.perf_counter()
+                for batch in range(0, count, BATCH_SIZE):
+                    ids = [str(i) for i in range(batch, min(batch + BATCH_SIZE, count))]
+                    store.upsert(ids, [f"sentence {i}" for i in ids], matrix[batch:batch + BATCH_SIZE],
+                                 [{"source": f"page-{int(i) % args.pages}"} for i in ids])
+                store.persist()
+                ingest = time.perf_counter() - start
+                if backend == "numpy (mmap)":
+                    # Query the copy loaded back from disk
+                    store = create(name)
+                latencies = []
+                found = 0
+                for vector, ids in zip(queries, expected):
+                    start = time.perf_counter()
+                    result = store.query(query_embeddings=[vector], n_results=args.top_k, where={"source": "page-0"})
+                    latencies.append(time.perf_counter() - start)
+                    found += len(ids & set(result["ids"][0]))
+                p95 = statistics.quantiles(latencies, n=20)[-1] if len(latencies) > 1 else latencies[0]
+                recall = found / sum(len(ids) for ids in expected)
+                memory = "-"
+                if hasattr(store, "resident_bytes"):
+                    memory = f"{store.resident_bytes() / count * 1_000_000 / (1024 * 1024):.0f}"
+                print(f"{backend:<18} {count:>8} {ingest:>11.2f} {statistics.median(latencies) * 1000:>15.2f} "
+                      f"{p95 * 1000:>15.2f} {recall:>9.3f} {memory:>16}")
+
+
+if __name__ == "__main__":
+    main()
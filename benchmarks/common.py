@@ -0,0 +1,89 @@
+import os
+import resource
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Make the application modules importable when a benchmark is run as a script
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+SAMPLE_PARAGRAPHS = [
+    "Natural language processing is a field of linguistics and machine learning focused on "
+    "understanding everything related to human language. The aim of NLP tasks is not only to "
+    "understand single words individually, but to be able to understand the context of those words.",
+    "Transformers are language models that have been trained on large amounts of raw text in a "
+    "self-supervised fashion. This type of model develops a statistical understanding of the "
+    "language it has been trained on, but it is not very useful for specific practical tasks.",
+    "Error E1024 means the request timed out. Retry the call with a larger timeout, or check that "
+    "the endpoint https://example.com/api/v2 is reachable from your network! Is the proxy configured?",
+    "We use cookies to improve your experience on our website. By continuing to browse, you agree "
+    "to our use of cookies. Read our privacy policy for more information.",
+]
+
+
+def sample_text(size):
+    # Plain text of about `size` characters made of realistic sentences
+    paragraphs = []
+    length = 0
+    i = 0
+    while length < size:
+        paragraph = SAMPLE_PARAGRAPHS[i % len(SAMPLE_PARAGRAPHS)]
+        paragraphs.append(paragraph)
+        length += len(paragraph) + 1
+        i += 1
+    return " ".join(paragraphs)
+
+
+def sample_html(size, title="Sample page"):
+    # HTML page with about `size` characters of paragraph text
+    paragraphs = []
+    length = 0
+    i = 0
+    while length < size:
+        paragraph = SAMPLE_PARAGRAPHS[i % len(SAMPLE_PARAGRAPHS)]
+        paragraphs.append(f"<p>{paragraph}</p>")
+        length += len(paragraph) + 1
+        i += 1
+    body = "\n".join(paragraphs)
+    return f"<html><head><title>{title}</title></head><body><h1>{title}</h1>\n{body}\n</body></html>"
+
+
+def serve_pages(pages):
+    # Serves {path: html} from a local HTTP server in a background thread and
+    # returns (base_url, server); call server.shutdown() when done
+    class Handler(BaseHTTPRequestHandler):
+        def do_GET(self):
+            html = pages.get(self.path)
+            if html is None:
+                self.send_error(404)
+                return
+            body = html.encode("utf-8")
+            self.send_response(200)
+            self.send_header("Content-Type", "text/html; charset=utf-8")
+            self.send_header("Content-Length", str(len(body)))
+            self.end_headers()
+            self.wfile.write(body)
+
+        def log_message(self, format, *args):
+            pass
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    return f"http://127.0.0.1:{server.server_address[1]}", server
+
+
+def peak_rss_mb():
+    # ru_maxrss is reported in kilobytes on Linux and in bytes on macOS
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    if sys.platform == "darwin":
+        return peak / (1024 * 1024)
+    return peak / 1024
+
+
+def timed(function, *args, **kwargs):
+    start = time.perf_counter()
+    result = function(*args, **kwargs)
+    return result, time.perf_counter() - start
@@ -0,0 +1,80 @@
+# Compares per-sentence chunks with token windows: number of vectors, ingest
+# time and retrieval hit rate (the expected answer appears in the top-k chunks)
+# on the saved pages in benchmarks/fixtures. Unrelated filler text is added to
+# every page so that retrieval has distractors and the index a realistic size.
+#
+#   python benchmarks/eval_chunking.py --windows 128:32 200:40 256:64 --top-k 5 --filler 50000
+import argparse
+import json
+import os
+import time
+
+from common import sample_text
+
+import chromadb
+import extractors
+import splitter
+import webchat
+from chunking import Chunker
+from pipeline import ChunkSync
+
+FIXTURES_DIR = os.path.join(os.path.dirname(os.path.abspath(__file__)), "fixtures")
+
+
+def load_pages(filler):
+    with open(os.path.join(FIXTURES_DIR, "questions.json")) as file:
+        questions = json.load(file)
+    extractor = extractors.get_extractor()
+    filler_sentences = splitter.split_text_into_sentences(sample_text(filler)) if filler else []
+    pages = {}
+    for name in questions:
+        with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as file:
+            sentences = splitter.split_text_into_sentences(extractor.extract(file.read()))
+        # Prefix the filler with the page name so that it is not shared between pages
+        pages[name] = sentences + [f"{name}: {sentence}" for sentence in filler_sentences]
+    return pages, questions
+
+
+def evaluate(label, chunker, pages, questions, top_k, client):
+    collection = client.get_or_create_collection("eval_" + "".join(c if c.isalnum() else "_" for c in label),
+                                                 embedding_function=webchat.get_embedding_function_class()())
+    # Measure real encoding, not the on-disk memo table
+    webchat.embedding_engine.cache = None
+    start = time.perf_counter()
+    for name, sentences in pages.items():
+        sync = ChunkSync(collection, name)
+        sync.upsert(list(chunker(sentences)))
+        sync.finish()
+    ingest_time = time.perf_counter() - start
+
+    hits = total = 0
+    for name, items in questions.items():
+        results = collection.query(query_texts=[item["question"] for item in items], n_results=top_k,
+                                   where={"source": name})
+        for item, documents in zip(items, results["documents"]):
+            hits += any(item["answer"] in document for document in documents)
+            total += 1
+    print(f"{label:<14} {collection.count():>8} {ingest_time:>11.2f} {hits / total:>9.0%}")
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    parser.add_argument("--windows", nargs="+", default=["128:32", "200:40", "256:64"],
+                        help="max_tokens:overlap_tokens pairs")
+    parser.add_argument("--top-k", type=int, default=5)
+    parser.add_argument("--filler", type=int, default=50_000, help="characters of filler text per page")
+    args = parser.parse_args()
+
+    pages, questions = load_pages(args.filler)
+    tokenizer = webchat.model.tokenizer
+    client = chromadb.EphemeralClient()
+    print(f"{'chunking':<14} {'vectors':>8} {'ingest (s)':>11} {'hit rate':>9}")
+    evaluate("sentence", Chunker("sentence"), pages, questions, args.top_k, client)
+    for window in args.windows:
+        max_tokens, overlap = (int(value) for value in window.split(":"))
+        chunker = Chunker("window", max_tokens, overlap, tokenizer=tokenizer)
+        evaluate(f"window {window}", chunker, pages, questions, args.top_k, client)
+
+
+if __name__ == "__main__":
+    main()
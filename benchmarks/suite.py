@@ -0,0 +1,207 @@
+# End-to-end benchmark suite: latency (p50/p95), throughput and peak memory of
+# every pipeline stage on a corpus of HTML pages of different sizes, served by a
+# local HTTP server and answered by llm.FakeModel, so no network access or
+# watsonx credentials are needed. Results are saved as JSON and two runs can be
+# compared to catch regressions.
+#
+#   python benchmarks/suite.py run --sizes small medium large --repeat 5 --output results.json
+#   python benchmarks/suite.py compare baseline.json results.json --threshold 0.10
+#
+# The corpus is the saved pages in benchmarks/fixtures (small) and pages built
+# from their bodies repeated to ~200 KB (medium) and ~2 MB (large).
+import argparse
+import contextlib
+import json
+import os
+import platform
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+
+from bench_extractors import large_page, load_fixtures
+from common import ROOT_DIR, peak_rss_mb, serve_pages
+
+SIZES = {"small": None, "medium": 200_000, "large": 2_000_000}
+QUESTION = "How many attempts does the client make by default?"
+
+
+def corpus(sizes):
+    pages, _ = load_fixtures()
+    corpus = {}
+    for size in sizes:
+        if SIZES[size] is None:
+            corpus.update({f"/{size}/{name}": html for name, html in pages.items()})
+        else:
+            corpus[f"/{size}/page.html"] = large_page(pages, SIZES[size])
+    return corpus
+
+
+def percentile(values, fraction):
+    values = sorted(values)
+    return values[min(int(round(fraction * (len(values) - 1))), len(values) - 1)]
+
+
+class Suite:
+    def __init__(self, base_url, pages, repeat):
+        import chromadb
+        import llm
+        import webchat
+
+        self.webchat = webchat
+        self.base_url = base_url
+        self.pages = pages
+        self.repeat = repeat
+        self.client = chromadb.EphemeralClient()
+        self.model = llm.FakeModel(first_token_delay=0, token_delay=0)
+        self.runs = 0
+        # Measure real work: no memo table of embeddings and no cached answers
+        webchat.embedding_engine.cache = None
+        webchat.answer_cache.max_entries = 0
+
+    def collection_name(self, stage):
+        # A new collection per run, so every ingestion starts cold
+        self.runs += 1
+        return f"suite_{stage}_{self.runs}"
+
+    def stages(self, path):
+        # {stage: (function, amount of work, unit)} for one page of the corpus
+        webchat = self.webchat
+        url = self.base_url + path
+        html = self.pages[path]
+        text = webchat.parse_html(html)
+        sentences = webchat.split_text_into_sentences(text)
+        embedding_function = webchat.get_embedding_function_class()()
+        indexed = self.collection_name("prompt")
+        webchat.create_embedding(url, indexed, self.client)
+        nbytes = len(html.encode("utf-8"))
+        return {
+            "extract_text": (lambda: webchat.extract_text(url), nbytes, "bytes"),
+            "split_sentences": (lambda: webchat.split_text_into_sentences(text), len(sentences), "sentences"),
+            "embedding_function": (lambda: embedding_function(sentences), len(sentences), "sentences"),
+            "create_embedding": (lambda: webchat.create_embedding(url, self.collection_name("ingest"), self.client),
+                                 nbytes, "bytes"),
+            "create_prompt": (lambda: webchat.create_prompt(url, QUESTION, indexed, self.client), 1, "prompts"),
+            "end_to_end": (lambda: webchat.answer_questions_from_web("", "", url, QUESTION,
+                                                                     self.collection_name("answer"), self.client,
+                                                                     model=self.model), 1, "answers"),
+        }
+
+    def measure(self, function, amount, unit):
+        latencies = []
+        # The prompts and answers webchat prints are not part of the report
+        with open(os.devnull, "w") as devnull, contextlib.redirect_stdout(devnull):
+            function()  # warm up: models, parsers and connections
+            for _ in range(self.repeat):
+                start = time.perf_counter()
+                function()
+                latencies.append(time.perf_counter() - start)
+            # Separate pass, tracemalloc slows the code down. It sees the Python and
+            # numpy allocations, not the ones made inside torch or Chroma's Rust core.
+            tracemalloc.start()
+            function()
+            peak = tracemalloc.get_traced_memory()[1]
+            tracemalloc.stop()
+        p50 = statistics.median(latencies)
+        return {
+            "p50_ms": p50 * 1000,
+            "p95_ms": percentile(latencies, 0.95) * 1000,
+            "throughput": amount / p50 if p50 else None,
+            "unit": f"{unit}/s",
+            "peak_mb": peak / (1024 * 1024),
+            "runs": len(latencies),
+        }
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "HEAD"], cwd=ROOT_DIR, capture_output=True, text=True,
+                              check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run(args):
+    pages = corpus(args.sizes)
+    base_url, server = serve_pages(pages)
+    # Caches and indexes are written to a scratch directory, so every run starts
+    # from the same state
+    work_dir = tempfile.mkdtemp(prefix="webchat-suite-")
+    os.chdir(work_dir)
+    suite = Suite(base_url, pages, args.repeat)
+    results = {}
+    try:
+        for path in pages:
+            for stage, (function, amount, unit) in suite.stages(path).items():
+                result = suite.measure(function, amount, unit)
+                results.setdefault(stage, {})[path] = result
+                print(f"{stage:<20} {path:<28} p50 {result['p50_ms']:>9.1f} ms  p95 {result['p95_ms']:>9.1f} ms  "
+                      f"{result['throughput']:>12.1f} {result['unit']:<13} peak {result['peak_mb']:>7.1f} MB")
+    finally:
+        server.shutdown()
+    report = {
+        "meta": {
+            "date": time.strftime("%Y-%m-%dT%H:%M:%S"),
+            "commit": git_commit(),
+            "python": sys.version.split()[0],
+            "platform": platform.platform(),
+            "repeat": args.repeat,
+            "peak_rss_mb": peak_rss_mb(),
+            "config": {name: value for name, value in os.environ.items()
+                       if name.startswith(("VECTOR_", "RETRIEVAL_", "CONTEXT_", "CHUNK_", "EMBEDDING_",
+                                           "SENTENCE_", "HTML_EXTRACTOR"))},
+        },
+        "results": results,
+    }
+    with open(args.output, "w") as file:
+        json.dump(report, file, indent=2)
+    print(f"Results saved to {args.output}")
+
+
+def compare(args):
+    # Change of the p50 latency of every stage and page; slower by more than
+    # `threshold` is a regression and makes the command exit with status 1
+    with open(args.baseline) as file:
+        baseline = json.load(file)["results"]
+    with open(args.current) as file:
+        current = json.load(file)["results"]
+    regressions = 0
+    print(f"{'stage':<20} {'page':<28} {'baseline (ms)':>14} {'current (ms)':>13} {'change':>8}")
+    for stage, pages in current.items():
+        for path, result in pages.items():
+            before = baseline.get(stage, {}).get(path)
+            if before is None:
+                continue
+            change = result["p50_ms"] / before["p50_ms"] - 1 if before["p50_ms"] else 0.0
+            flag = ""
+            if change > args.threshold:
+                regressions += 1
+                flag = "  REGRESSION"
+            print(f"{stage:<20} {path:<28} {before['p50_ms']:>14.1f} {result['p50_ms']:>13.1f} {change:>+8.1%}{flag}")
+    print(f"{regressions} regressions above {args.threshold:.0%}")
+    return 1 if regressions else 0
+
+
+def main():
+    parser = argparse.ArgumentParser()
+    commands = parser.add_subparsers(dest="command", required=True)
+    run_parser = commands.add_parser("run")
+    run_parser.add_argument("--sizes", nargs="+", choices=list(SIZES), default=list(SIZES))
+    run_parser.add_argument("--repeat", type=int, default=5)
+    run_parser.add_argument("--output", default="benchmark_results.json")
+    compare_parser = commands.add_parser("compare")
+    compare_parser.add_argument("baseline")
+    compare_parser.add_argument("current")
+    compare_parser.add_argument("--threshold", type=float, default=0.10)
+    args = parser.parse_args()
+    if args.command == "run":
+        args.output = os.path.abspath(args.output)
+        run(args)
+    else:
+        sys.exit(compare(args))
+
+
+if __name__ == "__main__":
+    main()
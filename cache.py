@@ -0,0 +1,318 @@
+import hashlib
+import json
+import os
+import sqlite3
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+import numpy as np
+
+
+def default_cache_dir():
+    # Same location used by webchat for the Hugging Face models
+    cache_dir = os.path.join(os.getcwd(), ".cache")
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+def hash_text(text):
+    return hashlib.sha256(text.encode("utf-8")).hexdigest()
+
+
+class LazyCache:
+    # Creates the cache with `factory` on first use, once per process, so that
+    # importing a module that holds one does not touch the disk. Attribute access
+    # is forwarded to the cache, like models.LazyModel does for models.
+    def __init__(self, factory):
+        self._factory = factory
+        self._cache = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._cache is not None
+
+    def _get(self):
+        # Not get(): the caches have a get() of their own
+        if self._cache is None:
+            with self._lock:
+                if self._cache is None:
+                    self._cache = self._factory()
+        return self._cache
+
+    def __getattr__(self, attribute):
+        if attribute.startswith("_"):
+            raise AttributeError(attribute)
+        return getattr(self._get(), attribute)
+
+
+class IngestionCache:
+    # Remembers which pages are already indexed in which collection, together with
+    # the HTTP validators (ETag/Last-Modified), the hash of the extracted text and,
+    # for crawled pages, the links the crawler followed from the page.
+    # Entries expire after `ttl` seconds and the least recently used ones are
+    # evicted once there are more than `max_entries`. Entries written with another
+    # `version` (e.g. another chunking of the pages) are misses, so those pages are
+    # fetched without validators and indexed again.
+    # Reads only update the LRU order in memory; the file is written by put() and
+    # invalidate(), with the access times of that moment.
+    def __init__(self, path=None, ttl=24 * 3600, max_entries=256, version=None):
+        self.path = path or os.path.join(default_cache_dir(), "ingestion_cache.json")
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.version = version
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    @staticmethod
+    def _key(collection_name, url):
+        return f"{collection_name}|{url}"
+
+    def _load(self):
+        try:
+            with open(self.path) as file:
+                entries = json.load(file)
+        except (OSError, ValueError):
+            return OrderedDict()
+        # Restore the LRU order from the last access time of every entry
+        return OrderedDict(sorted(entries.items(), key=lambda item: item[1]["last_access"]))
+
+    def _save(self):
+        # A temporary file of its own, as the API and the Streamlit app may save at once
+        with tempfile.NamedTemporaryFile("w", dir=os.path.dirname(os.path.abspath(self.path)),
+                                         prefix=os.path.basename(self.path), suffix=".tmp", delete=False) as file:
+            json.dump(self._entries, file)
+        os.replace(file.name, self.path)
+
+    def get(self, collection_name, url):
+        key = self._key(collection_name, url)
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or entry.get("version") != self.version:
+                return None
+            now = time.time()
+            if now - entry["created"] > self.ttl:
+                del self._entries[key]
+                return None
+            entry["last_access"] = now
+            self._entries.move_to_end(key)
+            return dict(entry)
+
+    def put(self, collection_name, url, etag, last_modified, text_hash, links=None):
+        key = self._key(collection_name, url)
+        now = time.time()
+        with self._lock:
+            self._entries[key] = {
+                "collection": collection_name,
+                "url": url,
+                "etag": etag,
+                "last_modified": last_modified,
+                "text_hash": text_hash,
+                "links": links,
+                "version": self.version,
+                "created": now,
+                "last_access": now,
+            }
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+            self._save()
+
+    def invalidate(self, collection_name, url=None):
+        # Without a url every page cached for the collection is dropped
+        with self._lock:
+            for key, entry in list(self._entries.items()):
+                if entry["collection"] == collection_name and url in (None, entry["url"]):
+                    del self._entries[key]
+            self._save()
+
+    def record_hit(self):
+        with self._lock:
+            self.hits += 1
+
+    def record_miss(self):
+        with self._lock:
+            self.misses += 1
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self._entries),
+            }
+
+
+class EmbeddingCache:
+    # On-disk memo table of sentence embeddings keyed by (model, sha256(sentence)).
+    # Boilerplate such as cookie banners and footers is encoded only once per site.
+    # When the table grows beyond `max_entries` the least recently used rows are
+    # deleted until it is back to 90% of the limit.
+    QUERY_CHUNK = 500
+
+    def __init__(self, path=None, max_entries=200_000):
+        self.path = path or os.path.join(default_cache_dir(), "embeddings.sqlite3")
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._connection = sqlite3.connect(self.path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            "CREATE TABLE IF NOT EXISTS embeddings ("
+            "model TEXT NOT NULL, key TEXT NOT NULL, vector BLOB NOT NULL, last_access REAL NOT NULL, "
+            "PRIMARY KEY (model, key))"
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings (last_access)")
+        self._connection.commit()
+        self._size = self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+
+    def get_many(self, model_name, texts):
+        # Returns {position in texts: float32 vector} for the texts already embedded
+        keys = [hash_text(text) for text in texts]
+        found = {}
+        with self._lock:
+            for start in range(0, len(keys), self.QUERY_CHUNK):
+                chunk = list(set(keys[start:start + self.QUERY_CHUNK]))
+                placeholders = ",".join("?" * len(chunk))
+                rows = self._connection.execute(
+                    f"SELECT key, vector FROM embeddings WHERE model = ? AND key IN ({placeholders})",
+                    [model_name, *chunk],
+                ).fetchall()
+                found.update(rows)
+            if found:
+                now = time.time()
+                self._connection.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE model = ? AND key = ?",
+                    [(now, model_name, key) for key in found],
+                )
+                self._connection.commit()
+            vectors = {i: np.frombuffer(found[key], dtype=np.float32) for i, key in enumerate(keys) if key in found}
+            self.hits += len(vectors)
+            self.misses += len(keys) - len(vectors)
+        return vectors
+
+    def put_many(self, model_name, texts, vectors):
+        now = time.time()
+        rows = [
+            (model_name, hash_text(text), np.asarray(vector, dtype=np.float32).tobytes(), now)
+            for text, vector in zip(texts, vectors)
+        ]
+        with self._lock:
+            before = self._connection.total_changes
+            self._connection.executemany(
+                "INSERT OR IGNORE INTO embeddings (model, key, vector, last_access) VALUES (?, ?, ?, ?)", rows
+            )
+            self._size += self._connection.total_changes - before
+            if self._size > self.max_entries:
+                excess = self._size - int(self.max_entries * 0.9)
+                self._connection.execute(
+                    "DELETE FROM embeddings WHERE rowid IN "
+                    "(SELECT rowid FROM embeddings ORDER BY last_access LIMIT ?)",
+                    (excess,),
+                )
+                self._size -= excess
+            self._connection.commit()
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": self._size,
+            }
+
+
+class AnswerCache:
+    # In-memory cache of generated answers. An answer is stored under
+    # (collection, url, page version, model) with the embedding of its question,
+    # and is returned for any later question whose embedding has a cosine
+    # similarity of at least `threshold` with it. The page version changes with
+    # the content hash of the page, so answers about an older version are never
+    # returned and are dropped when an answer for the new version is stored.
+    # Entries expire after `ttl` seconds, the least recently used ones are
+    # evicted once there are more than `max_entries`.
+    def __init__(self, threshold=0.95, ttl=3600, max_entries=1024):
+        self.threshold = threshold
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._next_id = 0
+
+    @staticmethod
+    def _normalize(vector):
+        vector = np.asarray(vector, dtype=np.float32)
+        norm = np.linalg.norm(vector)
+        return vector / norm if norm else vector
+
+    def _expire(self, now):
+        for entry_id, entry in list(self._entries.items()):
+            if now - entry["created"] > self.ttl:
+                del self._entries[entry_id]
+
+    def get(self, collection_name, url, version, model_id, question_vector):
+        # Returns the stored answer of the most similar question, or None
+        key = (collection_name, url, version, model_id)
+        vector = self._normalize(question_vector)
+        with self._lock:
+            self._expire(time.time())
+            candidates = [(entry_id, entry) for entry_id, entry in self._entries.items() if entry["key"] == key]
+            if candidates:
+                similarities = np.stack([entry["vector"] for _, entry in candidates]) @ vector
+                best = int(np.argmax(similarities))
+                if similarities[best] >= self.threshold:
+                    entry_id, entry = candidates[best]
+                    self._entries.move_to_end(entry_id)
+                    self.hits += 1
+                    return entry["answer"]
+            self.misses += 1
+            return None
+
+    def put(self, collection_name, url, version, model_id, question_vector, answer):
+        if self.max_entries <= 0:
+            return
+        key = (collection_name, url, version, model_id)
+        now = time.time()
+        with self._lock:
+            # Answers about another version of the page are stale
+            for entry_id, entry in list(self._entries.items()):
+                stored_collection, stored_url, stored_version, _ = entry["key"]
+                if stored_collection == collection_name and stored_url == url and stored_version != version:
+                    del self._entries[entry_id]
+            self._entries[self._next_id] = {
+                "key": key,
+                "vector": self._normalize(question_vector),
+                "answer": answer,
+                "created": now,
+            }
+            self._next_id += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+    def invalidate(self, collection_name, url=None):
+        # Without a url every answer cached for the collection is dropped
+        with self._lock:
+            for entry_id, entry in list(self._entries.items()):
+                if entry["key"][0] == collection_name and url in (None, entry["key"][1]):
+                    del self._entries[entry_id]
+
+    def stats(self):
+        with self._lock:
+            total = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / total if total else 0.0,
+                "entries": len(self._entries),
+            }
@@ -0,0 +1,72 @@
+import os
+
+CHUNK_MODE = os.getenv("CHUNK_MODE", "sentence")
+CHUNK_MAX_TOKENS = int(os.getenv("CHUNK_MAX_TOKENS", 200))
+CHUNK_OVERLAP_TOKENS = int(os.getenv("CHUNK_OVERLAP_TOKENS", 40))
+
+
+class Chunker:
+    # Turns the sentences of a page into the chunks that get embedded.
+    # "sentence" keeps one chunk per sentence. "window" packs consecutive sentences
+    # into windows of at most `max_tokens` tokens of the embedding model's tokenizer,
+    # each window repeating the last `overlap_tokens` tokens worth of sentences of
+    # the previous one. A sentence longer than `max_tokens` is a window on its own.
+    def __init__(self, mode=CHUNK_MODE, max_tokens=CHUNK_MAX_TOKENS, overlap_tokens=CHUNK_OVERLAP_TOKENS,
+                 tokenizer=None, batch_size=256):
+        if mode not in ("sentence", "window"):
+            raise ValueError(f"Unknown chunk mode: {mode}")
+        self.mode = mode
+        self.max_tokens = max_tokens
+        self.overlap_tokens = min(overlap_tokens, max_tokens // 2)
+        self.tokenizer = tokenizer
+        self.batch_size = batch_size
+
+    @property
+    def signature(self):
+        # Pages indexed with another chunking have to be indexed again
+        if self.mode == "sentence":
+            return "sentence"
+        return f"window-{self.max_tokens}-{self.overlap_tokens}"
+
+    def count_tokens(self, sentences):
+        encoded = self.tokenizer(sentences, add_special_tokens=False)["input_ids"]
+        return [len(ids) for ids in encoded]
+
+    def __call__(self, sentences):
+        if self.mode == "sentence":
+            return iter(sentences)
+        return self._windows(sentences)
+
+    def _counted(self, sentences):
+        # Tokenize in batches; the fast tokenizers are much quicker on lists
+        batch = []
+        for sentence in sentences:
+            batch.append(sentence)
+            if len(batch) == self.batch_size:
+                yield from zip(batch, self.count_tokens(batch))
+                batch = []
+        if batch:
+            yield from zip(batch, self.count_tokens(batch))
+
+    def _windows(self, sentences):
+        window = []
+        tokens = 0
+        for sentence, count in self._counted(sentences):
+            if window and tokens + count > self.max_tokens:
+                yield " ".join(text for text, _ in window)
+                # Carry the tail of the window over, as long as it fits the overlap
+                # and leaves room for the new sentence
+                overlap = []
+                overlap_tokens = 0
+                for text, text_count in reversed(window):
+                    if overlap_tokens + text_count > self.overlap_tokens or \
+                            overlap_tokens + text_count + count > self.max_tokens:
+                        break
+                    overlap.insert(0, (text, text_count))
+                    overlap_tokens += text_count
+                window = overlap
+                tokens = overlap_tokens
+            window.append((sentence, count))
+            tokens += count
+        if window:
+            yield " ".join(text for text, _ in window)
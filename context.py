@@ -0,0 +1,164 @@
+import os
+
+import numpy as np
+
+# Chunks retrieved for a question before duplicates are removed and the rest is
+# ranked and packed into the prompt
+CONTEXT_CANDIDATES = int(os.getenv("CONTEXT_CANDIDATES", 20))
+# Most chunks put in a prompt
+CONTEXT_MAX_CHUNKS = int(os.getenv("CONTEXT_MAX_CHUNKS", 5))
+# Chunks more similar than this to a chunk already selected are duplicates
+CONTEXT_DUPLICATE_THRESHOLD = float(os.getenv("CONTEXT_DUPLICATE_THRESHOLD", 0.92))
+# Relevance vs diversity of the maximal marginal relevance selection (1 = relevance only)
+CONTEXT_MMR_LAMBDA = float(os.getenv("CONTEXT_MMR_LAMBDA", 0.7))
+# Overrides the budget computed from the model's context length
+CONTEXT_TOKEN_BUDGET = int(os.getenv("CONTEXT_TOKEN_BUDGET", 0))
+# The chunks are counted with the tokenizer of the embedding model (MiniLM's
+# WordPiece), not with the watsonx model's, which is not available locally. The
+# LLM tokenizers split the same text into more tokens (SentencePiece on numbers,
+# code, URLs and non-English text), so the computed budget is divided by
+# 1 + this margin to keep the prompt within the context length.
+CONTEXT_TOKEN_MARGIN = float(os.getenv("CONTEXT_TOKEN_MARGIN", 0.25))
+
+# Context length of the watsonx models, in tokens
+MODEL_CONTEXT_LENGTHS = {
+    "meta-llama/llama-2-70b-chat": 4096,
+    "meta-llama/llama-2-13b-chat": 4096,
+    "meta-llama/llama-3-70b-instruct": 8192,
+    "meta-llama/llama-3-8b-instruct": 8192,
+    "ibm/granite-13b-chat-v2": 8192,
+    "mistralai/mixtral-8x7b-instruct-v01": 32768,
+}
+DEFAULT_CONTEXT_LENGTH = 4096
+# Prompt template, question and generated answer
+RESERVED_TOKENS = 512
+
+SEPARATOR = "\n\n\n"
+
+
+def token_budget(model_id=None):
+    # In tokens of the embedding model's tokenizer, see CONTEXT_TOKEN_MARGIN;
+    # CONTEXT_TOKEN_BUDGET is taken as is
+    if CONTEXT_TOKEN_BUDGET:
+        return CONTEXT_TOKEN_BUDGET
+    llm_tokens = MODEL_CONTEXT_LENGTHS.get(model_id, DEFAULT_CONTEXT_LENGTH) - RESERVED_TOKENS
+    return int(llm_tokens / (1 + CONTEXT_TOKEN_MARGIN))
+
+
+class ContextReport:
+    # What happened to the candidates of one prompt. `baseline_tokens` is the size
+    # of the old context, the first `max_chunks` candidates joined as retrieved.
+    def __init__(self, candidates, duplicates, selected, context_tokens, baseline_tokens, budget):
+        self.candidates = candidates
+        self.duplicates = duplicates
+        self.selected = selected
+        self.context_tokens = context_tokens
+        self.baseline_tokens = baseline_tokens
+        self.budget = budget
+
+    @property
+    def tokens_saved(self):
+        return self.baseline_tokens - self.context_tokens
+
+    def as_dict(self):
+        return {
+            "candidates": self.candidates,
+            "duplicates": self.duplicates,
+            "selected": self.selected,
+            "context_tokens": self.context_tokens,
+            "baseline_tokens": self.baseline_tokens,
+            "tokens_saved": self.tokens_saved,
+            "budget": self.budget,
+        }
+
+    def __str__(self):
+        return (f"Context: {self.selected} of {self.candidates} chunks ({self.duplicates} duplicates), "
+                f"{self.context_tokens} tokens of {self.budget}, {self.tokens_saved} saved")
+
+
+class ContextBuilder:
+    # Turns the over-fetched candidates of a question into the context of its prompt:
+    #  1. relevance of every candidate, from the cross-encoder `reranker` when given
+    #     or else the cosine similarity of the embeddings,
+    #  2. maximal marginal relevance selection, skipping near-duplicates of the
+    #     chunks already selected,
+    #  3. packing in that order until `max_chunks` or the token budget is reached.
+    # `embed` returns one vector per text, `count_tokens` one count per text.
+    def __init__(self, embed, count_tokens, reranker=None, max_chunks=CONTEXT_MAX_CHUNKS,
+                 duplicate_threshold=CONTEXT_DUPLICATE_THRESHOLD, mmr_lambda=CONTEXT_MMR_LAMBDA,
+                 candidates=CONTEXT_CANDIDATES):
+        self.embed = embed
+        self.count_tokens = count_tokens
+        self.reranker = reranker
+        self.max_chunks = max_chunks
+        self.duplicate_threshold = duplicate_threshold
+        self.mmr_lambda = mmr_lambda
+        self.candidates = candidates
+
+    @staticmethod
+    def _normalize(matrix):
+        matrix = np.asarray(matrix, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=-1, keepdims=True)
+        norms[norms == 0] = 1
+        return matrix / norms
+
+    def _relevance(self, question, documents, similarities):
+        if self.reranker is None:
+            return similarities
+        scores = np.asarray(self.reranker.predict([(question, document) for document in documents]),
+                            dtype=np.float32)
+        # Same range as the similarities of the MMR penalty
+        low, high = scores.min(), scores.max()
+        return (scores - low) / (high - low) if high > low else np.ones_like(scores)
+
+    def select(self, question, documents, max_chunks=None):
+        # Indices of the candidates in the order they go into the prompt, and the
+        # number of near-duplicates skipped
+        max_chunks = max_chunks or self.max_chunks
+        if not documents:
+            return [], 0
+        vectors = self._normalize(self.embed([question] + list(documents)))
+        question_vector, document_vectors = vectors[0], vectors[1:]
+        relevance = self._relevance(question, documents, document_vectors @ question_vector)
+        pairwise = document_vectors @ document_vectors.T
+        selected = []
+        duplicates = 0
+        remaining = list(range(len(documents)))
+        # The most similar selected chunk of every candidate
+        redundancy = np.full(len(documents), -np.inf, dtype=np.float32)
+        while remaining and len(selected) < max_chunks:
+            candidates = np.array(remaining)
+            penalty = np.where(np.isfinite(redundancy[candidates]), redundancy[candidates], 0)
+            scores = self.mmr_lambda * relevance[candidates] - (1 - self.mmr_lambda) * penalty
+            best = int(candidates[np.argmax(scores)])
+            remaining.remove(best)
+            if redundancy[best] >= self.duplicate_threshold:
+                duplicates += 1
+                continue
+            selected.append(best)
+            redundancy = np.maximum(redundancy, pairwise[best])
+        # Candidates left over that duplicate the selection are counted too
+        duplicates += sum(1 for i in remaining if redundancy[i] >= self.duplicate_threshold)
+        return selected, duplicates
+
+    def build(self, question, documents, model_id=None, max_chunks=None):
+        # Returns (context, ContextReport)
+        documents = list(documents)
+        max_chunks = max_chunks or self.max_chunks
+        budget = token_budget(model_id)
+        order, duplicates = self.select(question, documents, max_chunks)
+        counts = self.count_tokens(documents) if documents else []
+        separator_tokens = 1
+        packed = []
+        tokens = 0
+        for i in order:
+            cost = counts[i] + (separator_tokens if packed else 0)
+            if tokens + cost > budget:
+                # A smaller chunk further down may still fit
+                continue
+            packed.append(documents[i])
+            tokens += cost
+        baseline = documents[:max_chunks]
+        baseline_tokens = sum(counts[:max_chunks]) + separator_tokens * max(len(baseline) - 1, 0)
+        report = ContextReport(len(documents), duplicates, len(packed), tokens, baseline_tokens, budget)
+        return SEPARATOR.join(packed), report
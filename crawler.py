@@ -0,0 +1,189 @@
+import asyncio
+import os
+from urllib import robotparser
+from urllib.parse import urldefrag, urljoin, urlparse
+
+import requests
+from bs4 import BeautifulSoup
+from requests.adapters import HTTPAdapter
+from urllib3.util.retry import Retry
+
+USER_AGENT = "WatsonX-WebChat"
+REQUEST_TIMEOUT = float(os.getenv("REQUEST_TIMEOUT", 30))
+
+
+def make_session(pool_size=10, retries=2):
+    # Keep-alive connections are pooled per host and failed requests are retried
+    # with exponential backoff on connection errors and 429/5xx answers
+    retry = Retry(
+        total=retries,
+        backoff_factor=0.5,
+        status_forcelist=(429, 500, 502, 503, 504),
+        allowed_methods=("GET", "HEAD"),
+    )
+    adapter = HTTPAdapter(pool_connections=pool_size, pool_maxsize=pool_size, max_retries=retry)
+    session = requests.Session()
+    session.mount("http://", adapter)
+    session.mount("https://", adapter)
+    session.headers["User-Agent"] = USER_AGENT
+    return session
+
+
+def conditional_headers(etag=None, last_modified=None):
+    # Validators of a previous response; the server answers 304 if nothing changed
+    headers = {}
+    if etag:
+        headers["If-None-Match"] = etag
+    if last_modified:
+        headers["If-Modified-Since"] = last_modified
+    return headers
+
+
+def extract_links(base_url, html):
+    links = []
+    for anchor in BeautifulSoup(html, "html.parser").find_all("a", href=True):
+        link = urldefrag(urljoin(base_url, anchor["href"]))[0]
+        if urlparse(link).scheme in ("http", "https"):
+            links.append(link)
+    return links
+
+
+class Crawler:
+    # Breadth-first crawl of the pages of the seed's domain, at most `max_depth`
+    # links away from the seed and at most `max_pages` pages in total.
+    # Requests run in worker threads on a shared pooled session, with at most
+    # `per_host_concurrency` requests in flight per host. With an ingestion cache
+    # (see cache.IngestionCache) pages are fetched with conditional GETs; the links
+    # of a page that did not change are the ones cached with it.
+    def __init__(self, max_depth=1, max_pages=20, per_host_concurrency=4, timeout=REQUEST_TIMEOUT,
+                 retries=2, respect_robots=True, ingestion_cache=None, collection_name=None):
+        self.max_depth = max_depth
+        self.max_pages = max_pages
+        self.per_host_concurrency = per_host_concurrency
+        self.timeout = timeout
+        self.respect_robots = respect_robots
+        self.ingestion_cache = ingestion_cache
+        self.collection_name = collection_name
+        self.session = make_session(pool_size=per_host_concurrency, retries=retries)
+        self._host_limits = {}
+        self._robots = {}
+
+    def _host_limit(self, url):
+        host = urlparse(url).netloc
+        if host not in self._host_limits:
+            self._host_limits[host] = asyncio.Semaphore(self.per_host_concurrency)
+        return self._host_limits[host]
+
+    def _load_robots(self, url):
+        parsed = urlparse(url)
+        parser = robotparser.RobotFileParser()
+        try:
+            response = self.session.get(f"{parsed.scheme}://{parsed.netloc}/robots.txt", timeout=self.timeout)
+        except requests.RequestException:
+            response = None
+        if response is not None and response.status_code == 200:
+            parser.parse(response.text.splitlines())
+        else:
+            # No robots.txt (or an unreachable one): everything is allowed
+            parser.parse([])
+        return parser
+
+    async def allowed(self, url):
+        if not self.respect_robots:
+            return True
+        host = urlparse(url).netloc
+        if host not in self._robots:
+            self._robots[host] = await asyncio.to_thread(self._load_robots, url)
+        return self._robots[host].can_fetch(USER_AGENT, url)
+
+    def _get(self, url, follow_links, conditional=True):
+        # Returns the response and the links cached for the url
+        headers = {}
+        links = None
+        if self.ingestion_cache is not None and conditional:
+            cached = self.ingestion_cache.get(self.collection_name, url)
+            # A 304 has no html to take the links from, so a page whose links are
+            # needed but not cached is fetched in full
+            if cached is not None and (not follow_links or cached.get("links") is not None):
+                headers = conditional_headers(cached["etag"], cached["last_modified"])
+                links = cached.get("links") if follow_links else None
+        return self.session.get(url, headers=headers, timeout=self.timeout), links
+
+    async def fetch(self, url, follow_links=False, conditional=True):
+        # Returns a page dict, or None when the page is disallowed or failed. With
+        # `follow_links` its "links" are the ones to crawl from it (else None).
+        # With conditional=False the cached validators are not sent, so the page
+        # comes back in full.
+        if not await self.allowed(url):
+            print(f"Skipping {url}: disallowed by robots.txt")
+            return None
+        async with self._host_limit(url):
+            try:
+                response, links = await asyncio.to_thread(self._get, url, follow_links, conditional)
+            except requests.RequestException as e:
+                print(f"Failed to retrieve {url}: {e}")
+                return None
+        if response.status_code not in (200, 304):
+            print(f"Failed to retrieve {url}. Status code: {response.status_code}")
+            return None
+        if response.status_code == 200 and "html" not in response.headers.get("Content-Type", "text/html"):
+            return None
+        html = response.text if response.status_code == 200 else None
+        if html is not None:
+            links = extract_links(url, html) if follow_links else None
+        return {
+            "url": url,
+            "status": response.status_code,
+            "html": html,
+            "links": links,
+            "etag": response.headers.get("ETag"),
+            "last_modified": response.headers.get("Last-Modified"),
+        }
+
+    async def crawl(self, seed_url):
+        # Async generator of the pages as they are fetched; 304 answers are
+        # yielded too (with status 304 and no html) so callers know they are current.
+        # Callers store the "links" of a page with its validators, see fetch().
+        seed_url = urldefrag(seed_url)[0]
+        domain = urlparse(seed_url).netloc
+        frontier = asyncio.Queue()
+        pages = asyncio.Queue()
+        seen = {seed_url}
+        frontier.put_nowait((seed_url, 0))
+
+        async def worker():
+            while True:
+                url, depth = await frontier.get()
+                try:
+                    page = await self.fetch(url, follow_links=depth < self.max_depth)
+                    if page is not None:
+                        if page["links"]:
+                            for link in page["links"]:
+                                if urlparse(link).netloc == domain and link not in seen and len(seen) < self.max_pages:
+                                    seen.add(link)
+                                    frontier.put_nowait((link, depth + 1))
+                        pages.put_nowait(page)
+                finally:
+                    frontier.task_done()
+
+        workers = [asyncio.create_task(worker()) for _ in range(self.per_host_concurrency)]
+        finished = asyncio.create_task(frontier.join())
+        try:
+            while True:
+                next_page = asyncio.create_task(pages.get())
+                await asyncio.wait({next_page, finished}, return_when=asyncio.FIRST_COMPLETED)
+                if next_page.done():
+                    yield next_page.result()
+                    continue
+                next_page.cancel()
+                break
+            while not pages.empty():
+                yield pages.get_nowait()
+        finally:
+            finished.cancel()
+            for task in workers:
+                task.cancel()
+            await asyncio.gather(*workers, finished, return_exceptions=True)
+
+    def close(self):
+        self.session.close()
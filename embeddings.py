@@ -0,0 +1,61 @@
+import numpy as np
+
+
+class EmbeddingEngine:
+    # Encodes texts in fixed-size batches and writes the vectors straight into one
+    # preallocated float32 matrix. Texts are bucketed by length (longest first) so
+    # every batch is padded to a similar length, then the rows are put back in the
+    # input order.
+    # With a `cache` (see cache.EmbeddingCache) only the texts that were never
+    # embedded before, or appear for the first time in the batch, reach the model.
+    def __init__(self, model, batch_size=64, normalize=False, sort_by_length=True, cache=None, cache_key=None):
+        self.model = model
+        self.batch_size = batch_size
+        self.normalize = normalize
+        self.sort_by_length = sort_by_length
+        self.cache = cache
+        # Normalized and raw vectors of the same model are different cache entries
+        self.cache_key = f"{cache_key}|normalized" if normalize else cache_key
+
+    @property
+    def dimension(self):
+        return self.model.get_sentence_embedding_dimension()
+
+    def encode(self, texts):
+        if self.cache is None:
+            return self._encode(texts)
+        vectors = np.empty((len(texts), self.dimension), dtype=np.float32)
+        cached = self.cache.get_many(self.cache_key, texts)
+        for i, vector in cached.items():
+            vectors[i] = vector
+        # Texts to encode, each one once, with every position where it appears
+        missing = {}
+        for i, text in enumerate(texts):
+            if i not in cached:
+                missing.setdefault(text, []).append(i)
+        if missing:
+            new_texts = list(missing)
+            new_vectors = self._encode(new_texts)
+            for text, vector in zip(new_texts, new_vectors):
+                vectors[missing[text]] = vector
+            self.cache.put_many(self.cache_key, new_texts, new_vectors)
+        return vectors
+
+    def _encode(self, texts):
+        vectors = np.empty((len(texts), self.dimension), dtype=np.float32)
+        if not texts:
+            return vectors
+        if self.sort_by_length:
+            order = np.argsort([-len(text) for text in texts], kind="stable")
+        else:
+            order = np.arange(len(texts))
+        for start in range(0, len(texts), self.batch_size):
+            batch_index = order[start:start + self.batch_size]
+            vectors[batch_index] = self.model.encode(
+                [texts[i] for i in batch_index],
+                batch_size=len(batch_index),
+                convert_to_numpy=True,
+                normalize_embeddings=self.normalize,
+                show_progress_bar=False,
+            )
+        return vectors
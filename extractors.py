@@ -0,0 +1,301 @@
+import logging
+import os
+import re
+from html.parser import HTMLParser
+
+logger = logging.getLogger(__name__)
+
+# Elements whose text is kept as one block
+BLOCK_TAGS = {"h1", "h2", "h3", "h4", "h5", "h6", "p", "li", "pre", "tr", "blockquote", "dt", "dd", "figcaption", "caption"}
+# Table cells, joined with " | " inside their row
+CELL_TAGS = {"td", "th"}
+# Navigation, page chrome and non-text elements that are skipped with everything inside them
+BOILERPLATE_TAGS = {"nav", "footer", "aside", "script", "style", "noscript", "template", "form", "svg", "iframe", "button", "select"}
+# Blocks that end when a new block of the same kind starts (optional end tags)
+SELF_CLOSING_BLOCKS = {"p", "li", "tr", "dt", "dd"}
+# XML declaration at the start of XHTML pages, e.g. <?xml version="1.0" encoding="utf-8"?>
+XML_DECLARATION = re.compile(r"^\s*<\?xml[^>]*\?>")
+# Blocks whose start ends an open block of these kinds at the same nesting level,
+# like the HTML parsers of the tree extractors do (<dt>Term<dd>Definition)
+IMPLIED_END = {"li": {"li"}, "dt": {"dt", "dd"}, "dd": {"dt", "dd"}, "tr": {"tr"}, "p": {"p"}}
+# Elements whose start ends an open paragraph (<p>Text<div>...), following the
+# HTML 4 rules of libxml2 that lxml.html uses
+PARAGRAPH_CLOSERS = {"address", "blockquote", "div", "dl", "fieldset", "form", "h1", "h2", "h3", "h4", "h5", "h6",
+                     "hr", "menu", "ol", "p", "pre", "table", "ul"}
+# Elements whose end also ends an open block with an optional end tag
+CONTAINER_TAGS = {"ul", "ol", "dl", "table", "thead", "tbody", "tfoot", "div", "section", "article", "main", "body", "html"}
+
+
+def clean_block(text):
+    # Collapse whitespace, including the \xa0 used in html to avoid words break across lines
+    return " ".join(text.split())
+
+
+class Extractor:
+    # Turns an HTML page into the list of its text blocks (headings, paragraphs,
+    # list items, table rows and code blocks), leaving navigation and footers out.
+    # With debug=True every extracted block is logged at DEBUG level.
+    name = None
+
+    def __init__(self, debug=False):
+        self.debug = debug
+
+    def extract_blocks(self, html):
+        raise NotImplementedError
+
+    def extract(self, html):
+        blocks = self.extract_blocks(html)
+        if self.debug:
+            for block in blocks:
+                logger.debug("[%s] %s", self.name, block)
+        return " ".join(blocks)
+
+
+class TreeExtractor(Extractor):
+    # Walks a parsed document tree; backends only say how to read a node
+    def extract_blocks(self, html):
+        blocks = []
+        if not html.strip():
+            return blocks
+        root = self._root(html)
+        # None when the backend found no document in the page, e.g. only comments
+        if root is None:
+            return blocks
+        stack = [root]
+        while stack:
+            node = stack.pop()
+            tag = self._tag(node)
+            if tag in BOILERPLATE_TAGS:
+                continue
+            if tag in BLOCK_TAGS:
+                if tag == "tr":
+                    cells = [clean_block(self._text(cell)) for cell in self._children(node) if self._tag(cell) in CELL_TAGS]
+                    text = " | ".join(cell for cell in cells if cell)
+                else:
+                    text = clean_block(self._text(node))
+                if text:
+                    blocks.append(text)
+                continue
+            # Children are pushed in reverse so they are visited in document order
+            stack.extend(reversed(list(self._children(node))))
+        return blocks
+
+    def _root(self, html):
+        raise NotImplementedError
+
+    def _tag(self, node):
+        raise NotImplementedError
+
+    def _children(self, node):
+        raise NotImplementedError
+
+    def _text(self, node):
+        raise NotImplementedError
+
+
+class SoupExtractor(TreeExtractor):
+    # BeautifulSoup with the pure-Python 'html.parser' or the C-backed 'lxml' parser.
+    # 'html.parser' does not close optional end tags, so <li>one<li>two nests the
+    # items and their blocks run together ("onetwo"); it is kept for comparison in
+    # the benchmarks and is never the default.
+    def __init__(self, parser="html.parser", debug=False):
+        super().__init__(debug)
+        self.parser = parser
+        self.name = f"bs4-{parser}"
+
+    def _root(self, html):
+        from bs4 import BeautifulSoup
+        return BeautifulSoup(html, self.parser)
+
+    def _tag(self, node):
+        return node.name
+
+    def _children(self, node):
+        return [child for child in node.children if child.name is not None]
+
+    def _text(self, node):
+        return node.get_text()
+
+
+class LxmlExtractor(TreeExtractor):
+    # lxml.html directly, without building a BeautifulSoup tree on top of it
+    name = "lxml"
+
+    def _root(self, html):
+        import lxml.etree
+        import lxml.html
+        # lxml refuses str input with an encoding declaration; the page is decoded already
+        html = XML_DECLARATION.sub("", html, count=1)
+        try:
+            return lxml.html.document_fromstring(html)
+        except lxml.etree.ParserError:
+            # "Document is empty"
+            return None
+
+    def _tag(self, node):
+        # Comments and processing instructions have a non-string tag
+        return node.tag if isinstance(node.tag, str) else None
+
+    def _children(self, node):
+        return [child for child in node if isinstance(child.tag, str)]
+
+    def _text(self, node):
+        # Like text_content(), but without the text of scripts, styles and the other
+        # boilerplate elements nested in the block; comments are skipped too
+        parts = [node.text or ""]
+        for child in node:
+            if isinstance(child.tag, str) and child.tag not in BOILERPLATE_TAGS:
+                parts.append(self._text(child))
+            parts.append(child.tail or "")
+        return "".join(parts)
+
+
+class SelectolaxExtractor(TreeExtractor):
+    # selectolax's Lexbor engine; an optional dependency (pip install selectolax)
+    name = "selectolax"
+
+    def _root(self, html):
+        from selectolax.lexbor import LexborHTMLParser
+        return LexborHTMLParser(html).root
+
+    def _tag(self, node):
+        return node.tag
+
+    def _children(self, node):
+        return [child for child in node.iter(include_text=False)]
+
+    def _text(self, node):
+        return node.text(deep=True, separator="")
+
+
+class IncrementalExtractor(HTMLParser):
+    # Same content selection as the tree extractors for HTML that arrives in
+    # pieces: feed() the pieces and drain `blocks` after each call. A block longer
+    # than `max_chars` is emitted in pieces cut by `split_long_text`.
+    def __init__(self, max_chars=None, split_long_text=None):
+        super().__init__()
+        self.max_chars = max_chars
+        self.split_long_text = split_long_text
+        self.blocks = []
+        self._skip = 0
+        self._block_tag = None
+        self._block_containers = 0
+        self._containers = 0
+        self._nested = 0
+        self._text = []
+        self._cells = []
+        self._length = 0
+
+    def handle_starttag(self, tag, attrs):
+        if self._block_tag == "p" and tag in PARAGRAPH_CLOSERS and not self._skip:
+            self._flush()
+        if tag in BOILERPLATE_TAGS:
+            self._skip += 1
+        elif self._skip:
+            return
+        elif tag in BLOCK_TAGS:
+            if self._block_tag is None:
+                self._start_block(tag)
+            elif self._block_tag == "p" or (self._block_tag in IMPLIED_END.get(tag, ())
+                                            and self._containers == self._block_containers):
+                # The open block ends implicitly where the new one starts
+                self._flush()
+                self._start_block(tag)
+            elif tag == self._block_tag:
+                self._nested += 1
+        elif tag in CELL_TAGS and self._block_tag == "tr":
+            self._end_cell()
+        elif tag in CONTAINER_TAGS:
+            self._containers += 1
+
+    def _start_block(self, tag):
+        self._block_tag = tag
+        self._block_containers = self._containers
+
+    def handle_endtag(self, tag):
+        if tag in BOILERPLATE_TAGS:
+            self._skip = max(self._skip - 1, 0)
+        elif self._skip:
+            return
+        elif tag == self._block_tag:
+            if self._nested:
+                self._nested -= 1
+            else:
+                self._flush()
+        elif tag in CONTAINER_TAGS:
+            # Only the end of a container opened before the block ends the block
+            self._containers = max(self._containers - 1, 0)
+            if self._block_tag in SELF_CLOSING_BLOCKS and self._containers < self._block_containers:
+                self._flush()
+        elif tag in CELL_TAGS and self._block_tag == "tr":
+            self._end_cell()
+
+    def handle_data(self, data):
+        if self._skip or self._block_tag is None:
+            return
+        self._text.append(data)
+        self._length += len(data)
+        if self.max_chars and self._length > self.max_chars and self._block_tag != "tr":
+            *complete, rest = self.split_long_text("".join(self._text), self.max_chars)
+            self.blocks.extend(clean_block(text) for text in complete)
+            self._text = [rest]
+            self._length = len(rest)
+
+    def close(self):
+        super().close()
+        self._flush()
+
+    def _end_cell(self):
+        cell = clean_block("".join(self._text))
+        if cell:
+            self._cells.append(cell)
+        self._text = []
+
+    def _flush(self):
+        if self._block_tag == "tr":
+            self._end_cell()
+            text = " | ".join(self._cells)
+        else:
+            text = clean_block("".join(self._text))
+        if text:
+            self.blocks.append(text)
+        self._block_tag = None
+        self._nested = 0
+        self._text = []
+        self._cells = []
+        self._length = 0
+
+
+class StreamingExtractor(Extractor):
+    # IncrementalExtractor fed the whole page at once: pure Python, and it closes
+    # optional end tags like lxml does, so it stands in for lxml when it is missing
+    name = "incremental"
+
+    def extract_blocks(self, html):
+        parser = IncrementalExtractor()
+        parser.feed(html)
+        parser.close()
+        return parser.blocks
+
+
+def default_extractor_name():
+    try:
+        import lxml.html  # noqa: F401
+        return "lxml"
+    except ImportError:
+        return "incremental"
+
+
+def get_extractor(name=None, debug=False):
+    name = name or os.getenv("HTML_EXTRACTOR") or default_extractor_name()
+    if name == "lxml":
+        return LxmlExtractor(debug=debug)
+    if name == "selectolax":
+        return SelectolaxExtractor(debug=debug)
+    if name == "incremental":
+        return StreamingExtractor(debug=debug)
+    if name in ("html.parser", "bs4-html.parser"):
+        return SoupExtractor("html.parser", debug=debug)
+    if name == "bs4-lxml":
+        return SoupExtractor("lxml", debug=debug)
+    raise ValueError(f"Unknown HTML extractor: {name}")
@@ -0,0 +1,167 @@
+import multiprocessing
+import os
+import threading
+import time
+from concurrent.futures import ProcessPoolExecutor, ThreadPoolExecutor
+
+import models
+
+# Threads that download, parse and split pages
+INGESTION_WORKERS = int(os.getenv("INGESTION_WORKERS", 2))
+# Processes that run the embedding model; 0 embeds in the ingestion threads
+EMBEDDING_PROCESSES = int(os.getenv("EMBEDDING_PROCESSES", 1))
+# Finished jobs kept so the UI can still show how they ended
+FINISHED_JOBS = 100
+
+
+def _load_model():
+    # Runs once in every embedding process
+    models.embedding_model.get()
+
+
+def _encode_in_process(texts, kwargs):
+    return models.embedding_model.encode(texts, **kwargs)
+
+
+class ProcessPoolModel:
+    # Stands in for the SentenceTransformer in an EmbeddingEngine: encode() runs in
+    # a pool of worker processes, each holding its own copy of the model, so
+    # encoding does not compete with the app's threads for the GIL and several
+    # pages are encoded in parallel. The pool starts on first use.
+    def __init__(self, processes=EMBEDDING_PROCESSES):
+        self.processes = processes
+        self._executor = None
+        self._lock = threading.Lock()
+
+    def _pool(self):
+        with self._lock:
+            if self._executor is None:
+                # spawn: forking a process that runs threads and torch is unsafe
+                self._executor = ProcessPoolExecutor(max_workers=self.processes,
+                                                     mp_context=multiprocessing.get_context("spawn"),
+                                                     initializer=_load_model)
+            return self._executor
+
+    def get_sentence_embedding_dimension(self):
+        return models.embedding_model.get_sentence_embedding_dimension()
+
+    def encode(self, sentences, **kwargs):
+        return self._pool().submit(_encode_in_process, list(sentences), kwargs).result()
+
+    def shutdown(self):
+        with self._lock:
+            if self._executor is not None:
+                self._executor.shutdown(cancel_futures=True)
+                self._executor = None
+
+
+class Job:
+    # Indexing of one url into one collection. `first_batch` is set as soon as
+    # the first chunks can be queried, `done` when the whole page is indexed or
+    # the job failed (then `error` holds the message).
+    def __init__(self, url, collection_name):
+        self.url = url
+        self.collection_name = collection_name
+        self.state = "queued"
+        self.error = None
+        self.chunks = 0
+        self.bytes = 0
+        self.sentences = 0
+        self.created = time.time()
+        self.finished = None
+        self.first_batch = threading.Event()
+        self.done = threading.Event()
+        # telemetry.RequestTrace of the indexing, set by the ingest function
+        self.trace = None
+
+    def update(self, sync, stats=None):
+        # Called by the pipeline after every batch it upserted, or once for a page
+        # indexed in one go, whose numbers are then in the trace of the job
+        self.state = "running"
+        self.chunks = len(sync.seen)
+        if stats is not None:
+            self.bytes = stats.stages.get("fetch", {}).get("bytes", 0)
+            self.sentences = stats.stages.get("split", {}).get("items", 0)
+        elif self.trace is not None:
+            counters = self.trace.as_dict()["counters"]
+            self.bytes = counters.get("bytes_fetched", 0)
+            self.sentences = counters.get("sentences", 0)
+        self.first_batch.set()
+
+    def finish(self, error=None):
+        self.state = "failed" if error else "done"
+        self.error = error
+        self.finished = time.time()
+        self.first_batch.set()
+        self.done.set()
+
+    def wait_first_batch(self, timeout=None):
+        return self.first_batch.wait(timeout)
+
+    def wait(self, timeout=None):
+        return self.done.wait(timeout)
+
+    def progress(self):
+        return {
+            "url": self.url,
+            "state": self.state,
+            "chunks": self.chunks,
+            "bytes": self.bytes,
+            "sentences": self.sentences,
+            "error": self.error,
+            "seconds": (self.finished or time.time()) - self.created,
+        }
+
+    def __str__(self):
+        if self.state == "failed":
+            return f"Indexing {self.url} failed: {self.error}"
+        return (f"Indexing {self.url}: {self.state}, {self.chunks} chunks, "
+                f"{self.bytes / (1024 * 1024):.1f} MB in {self.progress()['seconds']:.1f} s")
+
+
+class IngestionQueue:
+    # Indexes pages in the background. `ingest(url, collection_name, client, job)`
+    # does the work and reports its progress to the job. A url already queued or
+    # being indexed into the same collection is not indexed twice: submit()
+    # returns the job in flight.
+    def __init__(self, ingest, workers=INGESTION_WORKERS):
+        self.ingest = ingest
+        self._executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="ingestion")
+        self._lock = threading.Lock()
+        self._in_flight = {}
+        self._finished = {}
+
+    def submit(self, url, collection_name, client):
+        key = (collection_name, url)
+        with self._lock:
+            job = self._in_flight.get(key)
+            if job is not None:
+                return job
+            job = self._in_flight[key] = Job(url, collection_name)
+        self._executor.submit(self._run, key, job, client)
+        return job
+
+    def _run(self, key, job, client):
+        job.state = "running"
+        error = None
+        try:
+            self.ingest(job.url, job.collection_name, client, job)
+        except Exception as e:
+            error = str(e)
+            print(job.url, f"indexing failed: {e}")
+        with self._lock:
+            self._in_flight.pop(key, None)
+            self._finished[key] = job
+            while len(self._finished) > FINISHED_JOBS:
+                self._finished.pop(next(iter(self._finished)))
+        job.finish(error)
+
+    def get(self, url, collection_name):
+        # The job in flight for the url, or the last one that finished
+        key = (collection_name, url)
+        with self._lock:
+            return self._in_flight.get(key) or self._finished.get(key)
+
+    def jobs(self):
+        with self._lock:
+            return list(self._in_flight.values())
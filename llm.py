@@ -0,0 +1,182 @@
+import hashlib
+import threading
+import time
+from collections import OrderedDict
+
+
+class GenerationStats:
+    # Time to first token and generation speed of one streamed answer.
+    # Every piece yielded by the stream counts as one token.
+    def __init__(self):
+        self.started = None
+        self.first_token = None
+        self.finished = None
+        self.tokens = 0
+
+    def begin(self):
+        self.started = time.perf_counter()
+
+    def record(self, piece):
+        if self.first_token is None:
+            self.first_token = time.perf_counter()
+        self.tokens += 1
+
+    def end(self):
+        self.finished = time.perf_counter()
+
+    @property
+    def time_to_first_token(self):
+        if self.first_token is None:
+            return None
+        return self.first_token - self.started
+
+    @property
+    def tokens_per_second(self):
+        if self.first_token is None or self.finished is None or self.finished <= self.first_token:
+            return None
+        # The first token is excluded: its latency is reported separately
+        return (self.tokens - 1) / (self.finished - self.first_token)
+
+    def as_dict(self):
+        return {
+            "time_to_first_token_s": self.time_to_first_token,
+            "tokens": self.tokens,
+            "tokens_per_s": self.tokens_per_second,
+            "total_s": self.finished - self.started if self.finished is not None else None,
+        }
+
+    def __str__(self):
+        if self.time_to_first_token is None:
+            return "No tokens generated"
+        speed = self.tokens_per_second
+        return (f"First token after {self.time_to_first_token:.2f} s, {self.tokens} tokens"
+                + (f" at {speed:.1f} tokens/s" if speed else ""))
+
+
+def stream_generate(model, prompt, stats=None):
+    # Yields the pieces of the answer as the watsonx model produces them
+    stats = stats if stats is not None else GenerationStats()
+    stats.begin()
+    try:
+        for piece in model.generate_text_stream(prompt=prompt):
+            stats.record(piece)
+            yield piece
+    finally:
+        stats.end()
+
+
+class FakeModel:
+    # Local stand-in for a watsonx foundation model, for tests, benchmarks and
+    # demos without credentials: it answers with a fixed text after
+    # `first_token_delay` seconds, then one word every `token_delay` seconds.
+    # `setup_delay` imitates the authentication done when a Model is created.
+    def __init__(self, answer="This is an answer from the local fake model.", first_token_delay=0.5, token_delay=0.05,
+                 setup_delay=0.0):
+        time.sleep(setup_delay)
+        self.answer = answer
+        self.first_token_delay = first_token_delay
+        self.token_delay = token_delay
+
+    def _pieces(self):
+        words = self.answer.split(" ")
+        return [word if i == 0 else " " + word for i, word in enumerate(words)]
+
+    def generate_text_stream(self, prompt=None, params=None):
+        time.sleep(self.first_token_delay)
+        for i, piece in enumerate(self._pieces()):
+            if i:
+                time.sleep(self.token_delay)
+            yield piece
+
+    def generate(self, prompt=None, params=None):
+        time.sleep(self.first_token_delay + self.token_delay * (len(self._pieces()) - 1))
+        return {"results": [{"generated_text": self.answer}]}
+
+    def generate_text(self, prompt=None, params=None):
+        return self.generate(prompt, params)["results"][0]["generated_text"]
+
+
+def create_watsonx_model(model_id, params, api_key, project_id, url):
+    # WML python SDK
+    from ibm_watson_machine_learning.foundation_models import Model
+
+    return Model(
+        model_id=model_id,
+        params=params,
+        credentials={
+            "apikey": api_key,
+            "url": url
+        },
+        project_id=project_id
+    )
+
+
+class ModelPool:
+    # Thread-safe pool of model clients keyed by (credentials, model id, parameters).
+    # Building a watsonx Model exchanges the API key for an IAM token and opens
+    # connections to the endpoint; a pooled Model keeps its API client, which
+    # caches the token and renews it before it expires. Different keys are built
+    # concurrently, the same key only once. At most `max_size` clients are kept,
+    # the least recently used one is dropped first.
+    def __init__(self, factory=create_watsonx_model, max_size=32):
+        self.factory = factory
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self.setup_seconds = 0.0
+        self._models = OrderedDict()
+        self._building = {}
+        self._lock = threading.Lock()
+
+    @staticmethod
+    def _key(model_id, params, api_key, project_id, url):
+        # The API key itself is not kept in the key
+        api_key_hash = hashlib.sha256((api_key or "").encode("utf-8")).hexdigest()
+        return (api_key_hash, url, project_id, model_id, tuple(sorted((str(k), str(v)) for k, v in params.items())))
+
+    def get(self, model_id, params, api_key, project_id, url):
+        key = self._key(model_id, params, api_key, project_id, url)
+        with self._lock:
+            if key in self._models:
+                self._models.move_to_end(key)
+                self.hits += 1
+                return self._models[key]
+            build_lock = self._building.setdefault(key, threading.Lock())
+        with build_lock:
+            with self._lock:
+                if key in self._models:
+                    # Built by the thread that held the build lock
+                    self._models.move_to_end(key)
+                    self.hits += 1
+                    return self._models[key]
+            try:
+                start = time.perf_counter()
+                model = self.factory(model_id, params, api_key, project_id, url)
+                elapsed = time.perf_counter() - start
+                with self._lock:
+                    self._models[key] = model
+                    self.misses += 1
+                    self.setup_seconds += elapsed
+                    while len(self._models) > self.max_size:
+                        self._models.popitem(last=False)
+            finally:
+                # Also when the factory failed, e.g. with a wrong API key
+                with self._lock:
+                    self._building.pop(key, None)
+        return model
+
+    def clear(self):
+        with self._lock:
+            self._models.clear()
+
+    def stats(self):
+        with self._lock:
+            average_setup = self.setup_seconds / self.misses if self.misses else 0.0
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "clients": len(self._models),
+                "average_setup_s": average_setup,
+                # Each hit skipped one client setup
+                "saved_setup_s": self.hits * average_setup,
+            }
@@ -0,0 +1,133 @@
+import os
+import threading
+
+EMBEDDING_MODEL_NAME = "sentence-transformers/all-MiniLM-L6-v2"
+# "torch" runs the sentence-transformers model, "onnx" the same network exported
+# to ONNX Runtime and "onnx-int8" its dynamically quantized version
+EMBEDDING_BACKEND = os.getenv("EMBEDDING_BACKEND", "torch")
+# CPU threads of the embedding model; 0 keeps the default of the runtime
+EMBEDDING_THREADS = int(os.getenv("EMBEDDING_THREADS", 0))
+# The vectors of every backend differ slightly, so they are cached separately
+EMBEDDING_CACHE_KEY = EMBEDDING_MODEL_NAME if EMBEDDING_BACKEND == "torch" else f"{EMBEDDING_MODEL_NAME}|{EMBEDDING_BACKEND}"
+
+
+def model_cache_dir():
+    # Set up cache directory (consider user-defined location)
+    cache_dir = os.path.join(os.getcwd(), ".cache")
+    os.makedirs(cache_dir, exist_ok=True)
+    return cache_dir
+
+
+class LazyModel:
+    # Loads the model on first use, once per process. Attribute access is forwarded
+    # to the loaded model, so a LazyModel can be used wherever the model is expected.
+    def __init__(self, name, loader):
+        self.name = name
+        self._loader = loader
+        self._model = None
+        self._thread = None
+        self._lock = threading.Lock()
+
+    @property
+    def loaded(self):
+        return self._model is not None
+
+    def get(self):
+        if self._model is None:
+            with self._lock:
+                if self._model is None:
+                    self._model = self._loader()
+        return self._model
+
+    def warm_up(self):
+        # Load in a background thread; callers of get() wait for it if needed
+        if self._model is None and self._thread is None:
+            self._thread = threading.Thread(target=self._warm_up, name=f"warm-up-{self.name}", daemon=True)
+            self._thread.start()
+
+    def _warm_up(self):
+        try:
+            self.get()
+        except Exception as e:
+            print(f"Warm up of model '{self.name}' failed: {e}")
+
+    def __getattr__(self, attribute):
+        if attribute.startswith("_"):
+            raise AttributeError(attribute)
+        return getattr(self.get(), attribute)
+
+
+_registry = {}
+
+
+def register(name, loader):
+    _registry[name] = LazyModel(name, loader)
+    return _registry[name]
+
+
+def get(name):
+    return _registry[name].get()
+
+
+def warm_up(*names):
+    for name in names or list(_registry):
+        _registry[name].warm_up()
+
+
+def load_sentence_transformer():
+    cache_dir = model_cache_dir()
+    # Set the Hugging Face cache directory before the hub libraries are imported
+    os.environ["HF_HOME"] = cache_dir
+    from sentence_transformers import SentenceTransformer
+
+    # Offline mode: a directory written by SentenceTransformer.save() or a copy of the
+    # model repository, so no request is made to the Hugging Face hub
+    local_dir = os.getenv("EMBEDDING_MODEL_DIR")
+    if local_dir:
+        model = SentenceTransformer(local_dir)
+        print(f"Model '{EMBEDDING_MODEL_NAME}' loaded from local directory: {local_dir}")
+    else:
+        model = SentenceTransformer(EMBEDDING_MODEL_NAME, cache_folder=cache_dir)
+        print(f"Model '{EMBEDDING_MODEL_NAME}' downloaded and loaded from cache directory: {cache_dir}")
+    return model
+
+
+def onnx_model_dir():
+    # The exported model, next to the downloaded one
+    return os.path.join(model_cache_dir(), "onnx", EMBEDDING_MODEL_NAME.replace("/", "--"))
+
+
+def load_embedding_model():
+    if EMBEDDING_BACKEND == "torch":
+        model = load_sentence_transformer()
+        if EMBEDDING_THREADS:
+            import torch
+            torch.set_num_threads(EMBEDDING_THREADS)
+        return model
+    if EMBEDDING_BACKEND in ("onnx", "onnx-int8"):
+        import onnx_encoder
+        model = onnx_encoder.load(load_sentence_transformer, onnx_model_dir(),
+                                  quantized=EMBEDDING_BACKEND == "onnx-int8", threads=EMBEDDING_THREADS)
+        print(f"Model '{EMBEDDING_MODEL_NAME}' loaded with the {EMBEDDING_BACKEND} backend")
+        return model
+    raise ValueError(f"Unknown embedding backend: {EMBEDDING_BACKEND}")
+
+
+embedding_model = register("embedding", load_embedding_model)
+
+
+# Optional cross-encoder that reranks the retrieved chunks, e.g.
+# cross-encoder/ms-marco-MiniLM-L-6-v2; small enough to run on the CPU
+RERANKER_MODEL_NAME = os.getenv("CONTEXT_RERANKER", "")
+
+
+def load_reranker_model():
+    os.environ["HF_HOME"] = model_cache_dir()
+    from sentence_transformers import CrossEncoder
+
+    model = CrossEncoder(RERANKER_MODEL_NAME, device="cpu")
+    print(f"Reranker '{RERANKER_MODEL_NAME}' loaded")
+    return model
+
+
+reranker_model = register("reranker", load_reranker_model)
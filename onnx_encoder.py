@@ -0,0 +1,161 @@
+import inspect
+import json
+import os
+import shutil
+import tempfile
+
+import numpy as np
+
+# Written next to the exported network: how the sentence-transformers pipeline
+# pools and normalizes the token embeddings
+CONFIG_FILE = "encoder.json"
+MODEL_FILE = "model.onnx"
+QUANTIZED_MODEL_FILE = "model_int8.onnx"
+OPSET_VERSION = 14
+# Largest 1 - cosine similarity to the PyTorch vector of the same sentence
+MAX_DRIFT = {"onnx": 1e-4, "onnx-int8": 0.05}
+
+
+def cosine_drift(reference, vectors):
+    # 1 - cosine similarity of every row of `vectors` with the same row of `reference`
+    reference = reference / np.linalg.norm(reference, axis=1, keepdims=True)
+    vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    return 1 - np.sum(reference * vectors, axis=1)
+
+
+def export(sentence_transformer, directory):
+    # Exports the transformer of a SentenceTransformer to ONNX with its tokenizer.
+    # The files are written to a temporary directory that is renamed at the end, so
+    # processes loading the model at the same time never see a partial export.
+    import torch
+    from sentence_transformers.models import Normalize, Pooling
+
+    pooling = next(module for module in sentence_transformer if isinstance(module, Pooling))
+    # sentence-transformers 6 replaced get_pooling_mode_str() with an attribute
+    mode = pooling.get_pooling_mode_str() if hasattr(pooling, "get_pooling_mode_str") else pooling.pooling_mode
+    if mode not in ("mean", "cls"):
+        raise ValueError(f"Pooling '{mode}' is not supported by the ONNX encoder")
+    config = {
+        "pooling": mode,
+        "normalize": any(isinstance(module, Normalize) for module in sentence_transformer),
+        "max_seq_length": sentence_transformer.max_seq_length,
+        "dimension": sentence_transformer.get_sentence_embedding_dimension(),
+    }
+    auto_model = sentence_transformer[0].auto_model.eval()
+
+    class Encoder(torch.nn.Module):
+        # The transformer called with keyword arguments: the forward() wrappers of
+        # transformers 5 reject the positional inputs of the exporter
+        def __init__(self, names):
+            super().__init__()
+            self.model = auto_model
+            self.names = names
+
+        def forward(self, *inputs):
+            return self.model(**dict(zip(self.names, inputs)))[0]
+
+    tokenizer = sentence_transformer.tokenizer
+    parent = os.path.dirname(os.path.abspath(directory))
+    os.makedirs(parent, exist_ok=True)
+    work_dir = tempfile.mkdtemp(dir=parent, prefix=".export-")
+    try:
+        sample = tokenizer(["An example sentence to trace the model."], return_tensors="pt")
+        names = [name for name in ("input_ids", "attention_mask", "token_type_ids") if name in sample]
+        axes = {name: {0: "batch", 1: "sequence"} for name in names + ["last_hidden_state"]}
+        # The TorchScript exporter, which recent PyTorch versions only use when asked
+        options = {"dynamo": False} if "dynamo" in inspect.signature(torch.onnx.export).parameters else {}
+        with torch.no_grad():
+            # eval() on the wrapper too: the exporter restores its mode on the model afterwards
+            torch.onnx.export(Encoder(names).eval(), tuple(sample[name] for name in names),
+                              os.path.join(work_dir, MODEL_FILE),
+                              input_names=names, output_names=["last_hidden_state"], dynamic_axes=axes,
+                              opset_version=OPSET_VERSION, **options)
+        tokenizer.save_pretrained(work_dir)
+        with open(os.path.join(work_dir, CONFIG_FILE), "w") as file:
+            json.dump(config, file)
+        try:
+            os.rename(work_dir, directory)
+        except OSError:
+            # Another process finished its export first
+            if not os.path.exists(os.path.join(directory, CONFIG_FILE)):
+                raise
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+    print(f"Embedding model exported to ONNX in {directory}")
+
+
+def quantize(directory):
+    # int8 weights for the matrix multiplications, activations quantized on the
+    # fly: about 4x smaller and faster on CPUs with VNNI, at a small accuracy cost
+    from onnxruntime.quantization import QuantType, quantize_dynamic
+
+    target = os.path.join(directory, QUANTIZED_MODEL_FILE)
+    handle, work_file = tempfile.mkstemp(dir=directory, suffix=".onnx")
+    os.close(handle)
+    try:
+        quantize_dynamic(os.path.join(directory, MODEL_FILE), work_file, weight_type=QuantType.QInt8)
+        os.replace(work_file, target)
+    finally:
+        if os.path.exists(work_file):
+            os.remove(work_file)
+    print(f"Embedding model quantized to int8 in {target}")
+
+
+class OnnxSentenceEncoder:
+    # Runs an exported sentence-transformers model with ONNX Runtime, without
+    # PyTorch. encode() takes the arguments EmbeddingEngine passes to
+    # SentenceTransformer.encode and pools and normalizes the same way.
+    def __init__(self, directory, quantized=False, threads=0):
+        import onnxruntime
+        from transformers import AutoTokenizer
+
+        with open(os.path.join(directory, CONFIG_FILE)) as file:
+            config = json.load(file)
+        self.pooling = config["pooling"]
+        self.normalize = config["normalize"]
+        self.max_seq_length = config["max_seq_length"]
+        self.dimension = config["dimension"]
+        options = onnxruntime.SessionOptions()
+        if threads:
+            options.intra_op_num_threads = threads
+            options.inter_op_num_threads = 1
+        path = os.path.join(directory, QUANTIZED_MODEL_FILE if quantized else MODEL_FILE)
+        self.session = onnxruntime.InferenceSession(path, options, providers=["CPUExecutionProvider"])
+        self.input_names = [model_input.name for model_input in self.session.get_inputs()]
+        self.tokenizer = AutoTokenizer.from_pretrained(directory)
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+    def encode(self, sentences, batch_size=32, convert_to_numpy=True, normalize_embeddings=False,
+               show_progress_bar=False, **kwargs):
+        single = isinstance(sentences, str)
+        if single:
+            sentences = [sentences]
+        vectors = np.empty((len(sentences), self.dimension), dtype=np.float32)
+        for start in range(0, len(sentences), batch_size):
+            batch = list(sentences[start:start + batch_size])
+            encoded = self.tokenizer(batch, padding=True, truncation=True, max_length=self.max_seq_length,
+                                     return_tensors="np")
+            input_ids = encoded["input_ids"]
+            feeds = {name: encoded.get(name, np.zeros_like(input_ids)).astype(np.int64) for name in self.input_names}
+            hidden = self.session.run(["last_hidden_state"], feeds)[0]
+            if self.pooling == "cls":
+                pooled = hidden[:, 0]
+            else:
+                mask = encoded["attention_mask"][..., None].astype(np.float32)
+                pooled = (hidden * mask).sum(axis=1) / np.maximum(mask.sum(axis=1), 1e-9)
+            if self.normalize or normalize_embeddings:
+                pooled = pooled / np.maximum(np.linalg.norm(pooled, axis=1, keepdims=True), 1e-12)
+            vectors[start:start + len(batch)] = pooled
+        return vectors[0] if single else vectors
+
+
+def load(load_sentence_transformer, directory, quantized=False, threads=0):
+    # The PyTorch model is only loaded the first time, to export it; later loads
+    # read the ONNX files
+    if not os.path.exists(os.path.join(directory, CONFIG_FILE)):
+        export(load_sentence_transformer(), directory)
+    if quantized and not os.path.exists(os.path.join(directory, QUANTIZED_MODEL_FILE)):
+        quantize(directory)
+    return OnnxSentenceEncoder(directory, quantized, threads)
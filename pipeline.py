@@ -0,0 +1,195 @@
+import codecs
+import hashlib
+import time
+
+import splitter
+from cache import hash_text
+from extractors import IncrementalExtractor
+
+# Size of the pieces read from the network
+CHUNK_SIZE = 64 * 1024
+# Number of sentences embedded and upserted together
+BATCH_SIZE = 256
+
+
+class PipelineStats:
+    # Time spent in every stage with the amount of work it did, so that the
+    # throughput of each stage can be compared
+    def __init__(self):
+        self.stages = {}
+
+    def add(self, stage, seconds, items=0, nbytes=0):
+        totals = self.stages.setdefault(stage, {"seconds": 0.0, "items": 0, "bytes": 0})
+        totals["seconds"] += seconds
+        totals["items"] += items
+        totals["bytes"] += nbytes
+
+    def report(self):
+        report = {}
+        for stage, totals in self.stages.items():
+            seconds = totals["seconds"] or 1e-9
+            report[stage] = dict(totals, items_per_s=totals["items"] / seconds,
+                                 mb_per_s=totals["bytes"] / seconds / (1024 * 1024))
+        return report
+
+    def __str__(self):
+        lines = [f"{'stage':<8} {'seconds':>9} {'items':>9} {'items/s':>11} {'MB/s':>9}"]
+        for stage, row in self.report().items():
+            lines.append(f"{stage:<8} {row['seconds']:>9.3f} {row['items']:>9} {row['items_per_s']:>11.1f} {row['mb_per_s']:>9.2f}")
+        return "\n".join(lines)
+
+
+def chunk_id(url, text):
+    # Derived from the content, so inserting a sentence does not shift the other ids
+    return hash_text(f"{url}\n{text}")
+
+
+class ChunkSync:
+    # Diff-based sync of the chunks of one page with what the collection already
+    # stores for that url: upsert() only embeds and writes chunks that are not
+    # stored yet, finish() deletes the chunks that vanished from the page.
+    def __init__(self, collection, url):
+        self.collection = collection
+        self.url = url
+        self.existing = set(collection.get(where={"source": url}, include=[])["ids"])
+        self.seen = set()
+        self.added = 0
+        self.deleted = 0
+
+    def upsert(self, texts, embed=None):
+        ids = []
+        documents = []
+        for text in texts:
+            id = chunk_id(self.url, text)
+            # A sentence repeated on the page is stored once
+            if id in self.seen:
+                continue
+            self.seen.add(id)
+            if id not in self.existing:
+                ids.append(id)
+                documents.append(text)
+        if ids:
+            # Without `embed` the collection's embedding function is used
+            embeddings = list(embed(documents)) if embed is not None else None
+            self.collection.upsert(
+                ids=ids,
+                documents=documents,
+                embeddings=embeddings,
+                metadatas=[{"source": self.url}] * len(ids),
+            )
+            self.added += len(ids)
+        return len(ids)
+
+    def finish(self):
+        stale = list(self.existing - self.seen)
+        if stale:
+            self.collection.delete(ids=stale)
+            self.deleted += len(stale)
+        return self.deleted
+
+
+def decode_chunks(chunks, encoding, stats):
+    decoder = codecs.getincrementaldecoder(encoding or "utf-8")(errors="replace")
+    iterator = iter(chunks)
+    while True:
+        start = time.perf_counter()
+        chunk = next(iterator, None)
+        if chunk is None:
+            break
+        text = decoder.decode(chunk)
+        stats.add("fetch", time.perf_counter() - start, 1, len(chunk))
+        yield text
+    yield decoder.decode(b"", final=True)
+
+
+def parse_blocks(texts, stats):
+    # A block longer than BLOCK_SIZE is cut at sentence boundaries, so memory
+    # stays bounded even for a single huge element
+    parser = IncrementalExtractor(max_chars=splitter.BLOCK_SIZE, split_long_text=splitter.iter_blocks)
+    for text in texts:
+        start = time.perf_counter()
+        parser.feed(text)
+        blocks, parser.blocks = parser.blocks, []
+        stats.add("parse", time.perf_counter() - start, len(blocks), len(text))
+        yield from blocks
+    start = time.perf_counter()
+    parser.close()
+    stats.add("parse", time.perf_counter() - start, len(parser.blocks))
+    yield from parser.blocks
+
+
+def split_sentences(blocks, stats, text_hash=None, group_size=splitter.BLOCK_SIZE, mode=None):
+    # Text blocks are joined like parse_html does and split into sentences a group
+    # at a time. `text_hash` (a hashlib object) is fed the same text that
+    # webchat.parse_html would return for the whole page with the default lxml
+    # extractor (tests/test_extractors.py checks the two parsers agree), so a page
+    # keeps its hash when it grows past STREAMING_MIN_BYTES. `mode` is the splitter
+    # mode of the whole page; every group is split with it.
+    group = []
+    length = 0
+    separator = ""
+
+    def split(group, length):
+        start = time.perf_counter()
+        sentences = list(splitter.iter_sentences(" ".join(group), mode))
+        stats.add("split", time.perf_counter() - start, len(sentences), length)
+        return sentences
+
+    for text in blocks:
+        if text_hash is not None:
+            text_hash.update((separator + text).encode("utf-8"))
+            separator = " "
+        group.append(text)
+        length += len(text) + 1
+        if length >= group_size:
+            yield from split(group, length)
+            group = []
+            length = 0
+    if group:
+        yield from split(group, length)
+
+
+def batched(items, size):
+    batch = []
+    for item in items:
+        batch.append(item)
+        if len(batch) == size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def index_stream(collection, url, chunks, encoding, embedding_engine, chunker=None, batch_size=BATCH_SIZE, stats=None,
+                 progress=None):
+    # fetch -> incremental parse -> split -> chunk -> embed -> upsert, one
+    # fixed-size batch at a time; only chunks not stored yet are embedded.
+    # `progress(sync, stats)` is called after every batch, once it can be queried.
+    # Returns (ChunkSync, sha256 of the text, stats).
+    stats = stats or PipelineStats()
+    text_hash = hashlib.sha256()
+    texts = decode_chunks(chunks, encoding, stats)
+    # Streamed pages are the large ones (STREAMING_MIN_BYTES): in "auto" mode they
+    # get the sentencizer, decided once for the page and not from each group
+    mode = splitter.resolve_mode("", large=True)
+    sentences = split_sentences(parse_blocks(texts, stats), stats, text_hash, mode=mode)
+    if chunker is not None:
+        sentences = chunker(sentences)
+    sync = ChunkSync(collection, url)
+
+    def embed(batch):
+        start = time.perf_counter()
+        vectors = embedding_engine.encode(batch)
+        stats.add("embed", time.perf_counter() - start, len(batch))
+        return vectors
+
+    for batch in batched(sentences, batch_size):
+        start = time.perf_counter()
+        sync.upsert(batch, embed)
+        stats.add("upsert", time.perf_counter() - start, len(batch))
+        if progress is not None:
+            progress(sync, stats)
+    start = time.perf_counter()
+    sync.finish()
+    stats.add("upsert", time.perf_counter() - start)
+    return sync, text_hash.hexdigest(), stats
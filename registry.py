@@ -0,0 +1,103 @@
+import json
+import os
+import tempfile
+import threading
+import time
+from collections import OrderedDict
+
+from cache import default_cache_dir
+
+# Estimated size of all the indexed sites above which the least recently used
+# ones are evicted; 0 disables the eviction
+COLLECTIONS_BUDGET_MB = float(os.getenv("COLLECTIONS_BUDGET_MB", 2048))
+
+
+class CollectionRegistry:
+    # The collections of the vector store with, for every page indexed in them, its
+    # number of chunks, its estimated size (vectors + text) and the time it took to
+    # index it, plus the last time the collection was used. over_budget() names the
+    # least recently used collections to drop to stay within `budget_bytes`.
+    # Saved to disk like the ingestion cache, in least recently used order: touch()
+    # only updates the order in memory, record() and remove() write the file.
+    def __init__(self, path=None, budget_bytes=COLLECTIONS_BUDGET_MB * 1024 * 1024):
+        self.path = path or os.path.join(default_cache_dir(), "collections.json")
+        self.budget_bytes = budget_bytes
+        self.evictions = 0
+        self._lock = threading.Lock()
+        self._entries = self._load()
+
+    def _load(self):
+        try:
+            with open(self.path) as file:
+                entries = json.load(file)
+        except (OSError, ValueError):
+            return OrderedDict()
+        return OrderedDict(sorted(entries.items(), key=lambda item: item[1]["last_access"]))
+
+    def _save(self):
+        with tempfile.NamedTemporaryFile("w", dir=os.path.dirname(os.path.abspath(self.path)),
+                                         prefix=os.path.basename(self.path), suffix=".tmp", delete=False) as file:
+            json.dump(self._entries, file)
+        os.replace(file.name, self.path)
+
+    @staticmethod
+    def _size(entry):
+        return sum(page["bytes"] for page in entry["pages"].values())
+
+    def touch(self, name):
+        with self._lock:
+            entry = self._entries.get(name)
+            if entry is None:
+                return
+            entry["last_access"] = time.time()
+            self._entries.move_to_end(name)
+
+    def record(self, name, url, chunks, nbytes, build_s):
+        # A page was (re)indexed in the collection
+        now = time.time()
+        with self._lock:
+            entry = self._entries.setdefault(name, {"created": now, "last_access": now, "pages": {}})
+            entry["pages"][url] = {"chunks": chunks, "bytes": nbytes, "build_s": build_s, "indexed": now}
+            entry["last_access"] = now
+            self._entries.move_to_end(name)
+            self._save()
+
+    def remove(self, name):
+        with self._lock:
+            if self._entries.pop(name, None) is not None:
+                self._save()
+
+    def total_bytes(self):
+        with self._lock:
+            return sum(self._size(entry) for entry in self._entries.values())
+
+    def over_budget(self, keep=()):
+        # Collections to evict, least recently used first, so that the rest fits in
+        # the budget. Collections in `keep` (e.g. being indexed) are never chosen.
+        if self.budget_bytes <= 0:
+            return []
+        with self._lock:
+            total = sum(self._size(entry) for entry in self._entries.values())
+            evict = []
+            for name, entry in self._entries.items():
+                if total <= self.budget_bytes:
+                    break
+                if name in keep:
+                    continue
+                evict.append(name)
+                total -= self._size(entry)
+            self.evictions += len(evict)
+            return evict
+
+    def stats(self):
+        # One row per collection, most recently used first
+        with self._lock:
+            rows = [{
+                "collection": name,
+                "pages": len(entry["pages"]),
+                "chunks": sum(page["chunks"] for page in entry["pages"].values()),
+                "size_mb": self._size(entry) / (1024 * 1024),
+                "build_s": sum(page["build_s"] for page in entry["pages"].values()),
+                "last_access": entry["last_access"],
+            } for name, entry in reversed(self._entries.items())]
+        return rows
@@ -0,0 +1,229 @@
+import math
+import os
+import re
+import threading
+from collections import Counter
+
+import numpy as np
+
+from vectorstore import VectorStore
+
+# "dense" queries the vectors only, "hybrid" fuses them with BM25
+RETRIEVAL_MODE = os.getenv("RETRIEVAL_MODE", "hybrid")
+DENSE_WEIGHT = float(os.getenv("RETRIEVAL_DENSE_WEIGHT", 1.0))
+SPARSE_WEIGHT = float(os.getenv("RETRIEVAL_SPARSE_WEIGHT", 1.0))
+# Candidates taken from each retriever before the fusion
+RETRIEVAL_CANDIDATES = int(os.getenv("RETRIEVAL_CANDIDATES", 20))
+RRF_K = 60
+
+# Words, numbers and identifiers such as E2048, max_attempts=5 parts, v2.1 or ERR-42
+TOKEN_PATTERN = re.compile(r"[a-z0-9]+(?:[._-][a-z0-9]+)*")
+
+
+def tokenize(text):
+    return TOKEN_PATTERN.findall(text.lower())
+
+
+class BM25Index:
+    # Incremental inverted index. Postings are python lists while documents are
+    # added and are turned into numpy arrays on the first query after a change,
+    # so scoring a query term is one vectorized expression over its postings.
+    # Deleted documents stay in the postings, masked out, until they are more
+    # than half of the index and it is compacted.
+    def __init__(self, k1=1.5, b=0.75):
+        self.k1 = k1
+        self.b = b
+        self._lock = threading.RLock()
+        self._reset()
+
+    def _reset(self):
+        self.ids = []
+        self.documents = []
+        self._rows = {}
+        self._terms = []
+        self._lengths = []
+        self._alive = []
+        self._sources = []
+        self._source_codes = {}
+        self._postings = {}
+        self._arrays = {}
+        self._df = Counter()
+        self._total_length = 0
+        self._dead = 0
+
+    def __len__(self):
+        return len(self._rows)
+
+    def add(self, ids, documents, metadatas=None):
+        metadatas = metadatas or [None] * len(ids)
+        with self._lock:
+            self.remove([id for id in ids if id in self._rows])
+            for id, document, metadata in zip(ids, documents, metadatas):
+                row = len(self.ids)
+                terms = Counter(tokenize(document))
+                self.ids.append(id)
+                self.documents.append(document)
+                self._rows[id] = row
+                self._terms.append(terms)
+                self._lengths.append(sum(terms.values()))
+                self._alive.append(True)
+                source = (metadata or {}).get("source")
+                self._sources.append(self._source_codes.setdefault(source, len(self._source_codes)))
+                for term, count in terms.items():
+                    self._postings.setdefault(term, ([], []))
+                    self._postings[term][0].append(row)
+                    self._postings[term][1].append(count)
+                    self._arrays.pop(term, None)
+                    self._df[term] += 1
+                self._total_length += self._lengths[row]
+
+    def remove(self, ids):
+        with self._lock:
+            for id in ids:
+                row = self._rows.pop(id, None)
+                if row is None:
+                    continue
+                self._alive[row] = False
+                self._total_length -= self._lengths[row]
+                for term in self._terms[row]:
+                    self._df[term] -= 1
+                self._terms[row] = None
+                self._dead += 1
+            if self._dead > 1000 and self._dead > len(self._rows):
+                self._compact()
+
+    def _compact(self):
+        rows = sorted(self._rows.values())
+        documents = [(self.ids[row], self.documents[row], self._sources[row]) for row in rows]
+        codes = {code: source for source, code in self._source_codes.items()}
+        self._reset()
+        self.add([id for id, _, _ in documents], [document for _, document, _ in documents],
+                 [{"source": codes[code]} for _, _, code in documents])
+
+    def _posting_arrays(self, term):
+        arrays = self._arrays.get(term)
+        if arrays is None:
+            rows, counts = self._postings[term]
+            arrays = self._arrays[term] = (np.array(rows, dtype=np.int64), np.array(counts, dtype=np.float32))
+        return arrays
+
+    def scores(self, query, where=None):
+        # BM25 score of every row of the index; deleted and filtered rows score 0
+        with self._lock:
+            size = len(self.ids)
+            scores = np.zeros(size, dtype=np.float32)
+            if not self._rows:
+                return scores
+            lengths = np.asarray(self._lengths, dtype=np.float32)
+            average_length = self._total_length / len(self._rows) or 1.0
+            # The length normalization of every row, shared by all the query terms
+            norms = self.k1 * (1 - self.b + self.b * lengths / average_length)
+            for term in set(tokenize(query)):
+                df = self._df.get(term, 0)
+                if df <= 0:
+                    continue
+                idf = math.log(1 + (len(self._rows) - df + 0.5) / (df + 0.5))
+                rows, counts = self._posting_arrays(term)
+                scores[rows] += idf * counts * (self.k1 + 1) / (counts + norms[rows])
+            mask = np.asarray(self._alive, dtype=bool)
+            if where:
+                if set(where) != {"source"}:
+                    raise ValueError(f"Only source filters are supported, got {where}")
+                code = self._source_codes.get(where["source"])
+                mask &= np.asarray(self._sources, dtype=np.int64) == (code if code is not None else -1)
+            scores[~mask] = 0
+            return scores
+
+    def top_k(self, query, k, where=None):
+        # [(id, document, score)] of the best matches with a positive score
+        with self._lock:
+            scores = self.scores(query, where)
+            k = min(k, int(np.count_nonzero(scores)))
+            if k == 0:
+                return []
+            top = np.argpartition(-scores, k - 1)[:k]
+            top = top[np.argsort(-scores[top])]
+            return [(self.ids[row], self.documents[row], float(scores[row])) for row in top]
+
+
+def reciprocal_rank_fusion(rankings, weights, k=RRF_K):
+    # rankings: lists of ids, best first. Returns the ids by fused score.
+    fused = Counter()
+    for ranking, weight in zip(rankings, weights):
+        for rank, id in enumerate(ranking):
+            fused[id] += weight / (k + rank + 1)
+    return [id for id, _ in fused.most_common()]
+
+
+class HybridStore(VectorStore):
+    # Vector store that keeps a BM25 index of the same chunks: every upsert and
+    # delete goes to both, and query() fuses the dense and the sparse rankings
+    # with reciprocal rank fusion. With RETRIEVAL_MODE=dense it only queries the
+    # vectors.
+    def __init__(self, store, index, mode=RETRIEVAL_MODE, dense_weight=DENSE_WEIGHT, sparse_weight=SPARSE_WEIGHT,
+                 candidates=RETRIEVAL_CANDIDATES):
+        self.store = store
+        self.index = index
+        self.name = store.name
+        self.mode = mode
+        self.dense_weight = dense_weight
+        self.sparse_weight = sparse_weight
+        self.candidates = candidates
+
+    def get(self, ids=None, where=None, limit=None, include=None):
+        return self.store.get(ids=ids, where=where, limit=limit, include=include)
+
+    def upsert(self, ids, documents, embeddings=None, metadatas=None):
+        self.store.upsert(ids, documents, embeddings, metadatas)
+        self.index.add(ids, documents, metadatas)
+
+    def delete(self, ids):
+        self.store.delete(ids)
+        self.index.remove(ids)
+
+    def count(self):
+        return self.store.count()
+
+    def persist(self):
+        self.store.persist()
+
+    def query(self, query_texts=None, query_embeddings=None, n_results=10, where=None):
+        if self.mode == "dense" or query_texts is None:
+            return self.store.query(query_texts, query_embeddings, n_results, where)
+        dense = self.store.query(query_texts, query_embeddings, max(n_results, self.candidates), where)
+        result = {"ids": [], "documents": []}
+        for question, dense_ids, dense_documents in zip(query_texts, dense["ids"], dense["documents"]):
+            sparse = self.index.top_k(question, max(n_results, self.candidates), where)
+            documents = dict(zip(dense_ids, dense_documents))
+            documents.update((id, document) for id, document, _ in sparse)
+            ids = reciprocal_rank_fusion([dense_ids, [id for id, _, _ in sparse]],
+                                         [self.dense_weight, self.sparse_weight])[:n_results]
+            result["ids"].append(ids)
+            result["documents"].append([documents[id] for id in ids])
+        return result
+
+
+# One BM25 index per collection for the life of the process. It is built from
+# the stored chunks the first time the collection is used, then kept up to date.
+_indexes = {}
+_indexes_lock = threading.Lock()
+
+
+def get_index(store):
+    with _indexes_lock:
+        index = _indexes.get(store.name)
+        if index is None:
+            index = _indexes[store.name] = BM25Index()
+            stored = store.get(include=["documents", "metadatas"])
+            if stored["ids"]:
+                index.add(stored["ids"], stored["documents"], stored["metadatas"])
+        return index
+
+
+def drop_index(name):
+    with _indexes_lock:
+        _indexes.pop(name, None)
+
+
+def hybrid_store(store):
+    return HybridStore(store, get_index(store))
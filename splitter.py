@@ -0,0 +1,90 @@
+import os
+import threading
+
+SPACY_MODEL = "en_core_web_md"
+# Texts longer than this go through the lightweight sentencizer in "auto" mode
+LARGE_TEXT_CHARS = int(os.getenv("SENTENCE_SPLITTER_LARGE_TEXT", 100_000))
+# Long texts are fed to nlp.pipe in blocks of about this many characters
+BLOCK_SIZE = 50_000
+DEFAULT_MODE = os.getenv("SENTENCE_SPLITTER", "auto")
+
+# Process-wide spaCy pipelines, loaded on first use
+_pipelines = {}
+_warming_up = set()
+_lock = threading.Lock()
+
+
+def _load_pipeline(mode):
+    import spacy
+    if mode == "full":
+        # Sentence boundaries from the dependency parser of the model
+        return spacy.load(SPACY_MODEL)
+    if mode == "sentencizer":
+        # Rule based boundaries with the English tokenizer only: no tok2vec,
+        # tagger, parser, NER or word vectors get loaded
+        nlp = spacy.blank("en")
+        nlp.add_pipe("sentencizer")
+        return nlp
+    raise ValueError(f"Unknown sentence splitter mode: {mode}")
+
+
+def get_pipeline(mode):
+    nlp = _pipelines.get(mode)
+    if nlp is None:
+        with _lock:
+            nlp = _pipelines.get(mode)
+            if nlp is None:
+                nlp = _pipelines[mode] = _load_pipeline(mode)
+    return nlp
+
+
+def warm_up(mode=None):
+    # Load the pipeline used for small pages in a background thread
+    mode = mode or DEFAULT_MODE
+    if mode == "auto":
+        mode = "full"
+    with _lock:
+        if mode in _pipelines or mode in _warming_up:
+            return
+        _warming_up.add(mode)
+    threading.Thread(target=get_pipeline, args=(mode,), name=f"warm-up-spacy-{mode}", daemon=True).start()
+
+
+def resolve_mode(text, mode=None, large=None):
+    # `large` overrides the size of `text`, for a page split in several pieces
+    mode = mode or DEFAULT_MODE
+    if mode == "auto":
+        if large is None:
+            large = len(text) > LARGE_TEXT_CHARS
+        return "sentencizer" if large else "full"
+    return mode
+
+
+def iter_blocks(text, block_size=BLOCK_SIZE):
+    # Cut the text after the last sentence-ending punctuation of every block so
+    # that almost no sentence is split across two blocks
+    start = 0
+    while len(text) - start > block_size:
+        end = start + block_size
+        cut = max(text.rfind(". ", start, end), text.rfind("? ", start, end), text.rfind("! ", start, end))
+        if cut <= start:
+            cut = text.rfind(" ", start, end)
+        if cut <= start:
+            cut = end - 1
+        yield text[start:cut + 1]
+        start = cut + 1
+    if start < len(text):
+        yield text[start:]
+
+
+def iter_sentences(text, mode=None, batch_size=8):
+    nlp = get_pipeline(resolve_mode(text, mode))
+    for doc in nlp.pipe(iter_blocks(text), batch_size=batch_size):
+        for sent in doc.sents:
+            sentence = sent.text.strip()
+            if sentence:
+                yield sentence
+
+
+def split_text_into_sentences(text, mode=None):
+    return list(iter_sentences(text, mode))
@@ -0,0 +1,199 @@
+import contextvars
+import os
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+
+try:
+    from opentelemetry import metrics, trace
+except ImportError:
+    metrics = trace = None
+
+# "none" only keeps the per-request breakdown, "console" prints spans and metrics,
+# "otlp" sends them to OTEL_EXPORTER_OTLP_ENDPOINT (default localhost:4317)
+TELEMETRY_EXPORTER = os.getenv("TELEMETRY_EXPORTER", "none")
+SERVICE_NAME = os.getenv("OTEL_SERVICE_NAME", "watsonx-webchat")
+
+# Counters exported as metrics, with their unit
+COUNTERS = {
+    "bytes_fetched": "By",
+    "sentences": "1",
+    "chunks_embedded": "1",
+    "context_tokens": "1",
+    "tokens_generated": "1",
+}
+
+
+class RequestTrace:
+    # Time spent in every stage of one request, with the counters it added.
+    # Stages can be nested (the question is embedded inside "query"), so the
+    # stages do not have to add up to the total.
+    def __init__(self, name):
+        self.name = name
+        self.stages = {}
+        self.counters = Counter()
+        self.started = time.perf_counter()
+        self.finished = None
+        self._lock = threading.Lock()
+
+    def add_stage(self, stage, seconds):
+        with self._lock:
+            totals = self.stages.setdefault(stage, {"seconds": 0.0, "calls": 0})
+            totals["seconds"] += seconds
+            totals["calls"] += 1
+
+    def add(self, counter, value):
+        with self._lock:
+            self.counters[counter] += value
+
+    def finish(self):
+        self.finished = time.perf_counter()
+
+    @property
+    def total(self):
+        return (self.finished or time.perf_counter()) - self.started
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                "name": self.name,
+                "total_s": self.total,
+                "stages": {stage: dict(totals) for stage, totals in self.stages.items()},
+                "counters": dict(self.counters),
+            }
+
+    def __str__(self):
+        lines = [f"{self.name}: {self.total:.3f} s"]
+        for stage, totals in self.as_dict()["stages"].items():
+            lines.append(f"  {stage:<10} {totals['seconds']:>8.3f} s  {totals['calls']:>4} calls")
+        for counter, value in self.counters.items():
+            lines.append(f"  {counter:<16} {value:>10}")
+        return "\n".join(lines)
+
+
+_current = contextvars.ContextVar("telemetry_request", default=None)
+_instruments = None
+_setup_lock = threading.Lock()
+
+
+def setup(exporter=None):
+    # Configures the exporters once per process; the OpenTelemetry SDK is only
+    # imported when an exporter is chosen
+    global _instruments
+    with _setup_lock:
+        if _instruments is not None:
+            return _instruments
+        exporter = exporter or TELEMETRY_EXPORTER
+        if trace is not None and exporter != "none":
+            _configure(exporter)
+        if metrics is not None:
+            meter = metrics.get_meter("webchat")
+            _instruments = {
+                "duration": meter.create_histogram("rag.stage.duration", unit="s",
+                                                   description="Duration of the RAG pipeline stages"),
+            }
+            for name, unit in COUNTERS.items():
+                _instruments[name] = meter.create_counter(f"rag.{name}", unit=unit)
+        else:
+            _instruments = {}
+        return _instruments
+
+
+def _configure(exporter):
+    from opentelemetry.sdk.metrics import MeterProvider
+    from opentelemetry.sdk.metrics.export import ConsoleMetricExporter, PeriodicExportingMetricReader
+    from opentelemetry.sdk.resources import Resource
+    from opentelemetry.sdk.trace import TracerProvider
+    from opentelemetry.sdk.trace.export import BatchSpanProcessor, ConsoleSpanExporter
+
+    if exporter == "otlp":
+        from opentelemetry.exporter.otlp.proto.grpc.metric_exporter import OTLPMetricExporter
+        from opentelemetry.exporter.otlp.proto.grpc.trace_exporter import OTLPSpanExporter
+        span_exporter, metric_exporter = OTLPSpanExporter(), OTLPMetricExporter()
+    elif exporter == "console":
+        span_exporter, metric_exporter = ConsoleSpanExporter(), ConsoleMetricExporter()
+    else:
+        raise ValueError(f"Unknown telemetry exporter: {exporter}")
+    resource = Resource.create({"service.name": SERVICE_NAME})
+    tracer_provider = TracerProvider(resource=resource)
+    tracer_provider.add_span_processor(BatchSpanProcessor(span_exporter))
+    trace.set_tracer_provider(tracer_provider)
+    metrics.set_meter_provider(MeterProvider(resource=resource,
+                                             metric_readers=[PeriodicExportingMetricReader(metric_exporter)]))
+
+
+def current():
+    # The RequestTrace of the request running in this context, or None
+    return _current.get()
+
+
+@contextmanager
+def _span(name, attributes, detached=False):
+    if trace is None:
+        yield None
+        return
+    tracer = trace.get_tracer("webchat")
+    if detached:
+        # Not made the current span, so nothing has to be detached from the
+        # contextvars Context that was current when it started
+        span = tracer.start_span(name, attributes=attributes)
+        try:
+            yield span
+        except BaseException as e:
+            if not isinstance(e, GeneratorExit):
+                span.record_exception(e)
+                span.set_status(trace.Status(trace.StatusCode.ERROR, str(e)))
+            raise
+        finally:
+            span.end()
+        return
+    with tracer.start_as_current_span(name, attributes=attributes) as span:
+        yield span
+
+
+@contextmanager
+def request(name="request", **attributes):
+    # Collects the breakdown of everything done inside the block, under one root span
+    setup()
+    request_trace = RequestTrace(name)
+    token = _current.set(request_trace)
+    try:
+        with _span(name, attributes):
+            yield request_trace
+    finally:
+        request_trace.finish()
+        _current.reset(token)
+
+
+@contextmanager
+def stage(name, detached=False, **attributes):
+    # detached=True for a stage around the yields of a generator: a generator can
+    # be resumed in another thread and Context (e.g. by iterate_in_threadpool), so
+    # its span is started without becoming the parent of the spans inside it
+    setup()
+    start = time.perf_counter()
+    try:
+        with _span(name, attributes, detached) as span:
+            yield span
+    finally:
+        record(name, time.perf_counter() - start)
+
+
+def record(name, seconds):
+    # Duration of a stage measured elsewhere, e.g. by pipeline.PipelineStats
+    instruments = setup()
+    if "duration" in instruments:
+        instruments["duration"].record(seconds, {"stage": name})
+    request_trace = _current.get()
+    if request_trace is not None:
+        request_trace.add_stage(name, seconds)
+
+
+def count(name, value):
+    instruments = setup()
+    if name in instruments:
+        instruments[name].add(value)
+    request_trace = _current.get()
+    if request_trace is not None:
+        request_trace.add(name, value)
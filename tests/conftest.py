@@ -0,0 +1,128 @@
+import hashlib
+import os
+import sys
+import threading
+from collections import Counter
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import numpy as np
+import pytest
+
+# Make the application modules importable when the tests are run with `pytest`
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+if ROOT_DIR not in sys.path:
+    sys.path.insert(0, ROOT_DIR)
+
+
+class HashTokenizer:
+    # Whitespace tokens, enough for the chunker to count them
+    def __call__(self, texts, add_special_tokens=False, **kwargs):
+        return {"input_ids": [text.split() for text in texts]}
+
+
+class HashModel:
+    # Bag of hashed words: a deterministic stand-in for the sentence-transformers
+    # model, so the pipeline tests do not download one
+    dimension = 32
+    tokenizer = HashTokenizer()
+
+    def get_sentence_embedding_dimension(self):
+        return self.dimension
+
+    def encode(self, texts, **kwargs):
+        vectors = np.zeros((len(texts), self.dimension), dtype=np.float32)
+        for row, text in enumerate(texts):
+            for word in text.lower().split():
+                vectors[row, int(hashlib.md5(word.encode()).hexdigest(), 16) % self.dimension] += 1
+        norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+        return vectors / np.where(norms == 0, 1, norms)
+
+
+class PageServer:
+    # Serves {path: html} with an ETag per version of a page and answers 304 to a
+    # matching If-None-Match (validators=False sends neither); `pages` can be
+    # changed while it runs
+    def __init__(self, pages, validators=True):
+        self.pages = dict(pages)
+        self.validators = validators
+        self.statuses = Counter()
+        server = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def do_GET(self):
+                html = server.pages.get(self.path)
+                if html is None:
+                    server.statuses[(self.path, 404)] += 1
+                    self.send_error(404)
+                    return
+                body = html.encode("utf-8")
+                etag = '"' + hashlib.sha1(body).hexdigest() + '"'
+                if server.validators and self.headers.get("If-None-Match") == etag:
+                    server.statuses[(self.path, 304)] += 1
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                server.statuses[(self.path, 200)] += 1
+                self.send_response(200)
+                self.send_header("Content-Type", "text/html; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                if server.validators:
+                    self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, format, *args):
+                pass
+
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), Handler)
+        self.base_url = f"http://127.0.0.1:{self._server.server_address[1]}"
+        threading.Thread(target=self._server.serve_forever, daemon=True).start()
+
+    def url(self, path):
+        return self.base_url + path
+
+    def close(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+
+@pytest.fixture
+def page_server():
+    servers = []
+
+    def serve(pages, validators=True):
+        servers.append(PageServer(pages, validators))
+        return servers[-1]
+
+    yield serve
+    for server in servers:
+        server.close()
+
+
+@pytest.fixture
+def app_state(tmp_path, monkeypatch):
+    # webchat with the hash model and its caches, registry and Chroma client in
+    # tmp_path; returns (webchat, client)
+    monkeypatch.chdir(tmp_path)
+    import chromadb
+
+    import models
+    import splitter
+    import webchat
+    from cache import IngestionCache
+    from registry import CollectionRegistry
+
+    monkeypatch.setattr(models.embedding_model, "_model", HashModel())
+    monkeypatch.setattr(splitter, "DEFAULT_MODE", "sentencizer")
+    monkeypatch.setattr(webchat.embedding_engine, "cache", None)
+    monkeypatch.setattr(webchat, "ingestion_cache", IngestionCache(path=str(tmp_path / "ingestion_cache.json"),
+                                                                   version=webchat.chunker.signature))
+    monkeypatch.setattr(webchat, "collection_registry", CollectionRegistry(path=str(tmp_path / "collections.json")))
+    return webchat, chromadb.PersistentClient(path=str(tmp_path / "chroma"))
+
+
+@pytest.fixture
+def hash_engine():
+    from embeddings import EmbeddingEngine
+    return EmbeddingEngine(HashModel())
@@ -0,0 +1,70 @@
+import pytest
+
+pytest.importorskip("fastapi")
+pytest.importorskip("httpx")
+pytest.importorskip("chromadb")
+pytest.importorskip("spacy")
+
+from fastapi.testclient import TestClient  # noqa: E402
+
+PAGE = "<html><body><p>Natural language processing is a field of linguistics.</p></body></html>"
+# Nothing listens on port 1
+UNREACHABLE = "http://127.0.0.1:1/page.html"
+
+
+@pytest.fixture
+def client(app_state, monkeypatch):
+    import api
+    import llm
+
+    monkeypatch.setattr(api, "fake_model", llm.FakeModel(answer="A field of linguistics.", first_token_delay=0,
+                                                         token_delay=0))
+    monkeypatch.setattr(api, "limiter", api.ConcurrencyLimiter(2, 2, 5))
+    return TestClient(api.app), api.limiter
+
+
+@pytest.mark.parametrize("endpoint", ["answer", "answer/stream"])
+def test_answer(client, page_server, endpoint):
+    client, limiter = client
+    server = page_server({"/page.html": PAGE})
+    response = client.post(f"/{endpoint}", json={"url": server.url("/page.html"), "question": "What is NLP?"})
+    assert response.status_code == 200
+    assert "A field of linguistics." in response.text
+    assert limiter.running == 0
+
+
+@pytest.mark.parametrize("endpoint", ["answer", "answer/stream"])
+def test_answer_about_a_page_that_cannot_be_fetched(client, endpoint):
+    client, limiter = client
+    response = client.post(f"/{endpoint}", json={"url": UNREACHABLE, "question": "What is NLP?"})
+    assert response.status_code == 502
+    assert limiter.running == 0
+
+
+@pytest.fixture(scope="module")
+def span_exporter():
+    sdk_trace = pytest.importorskip("opentelemetry.sdk.trace")
+    from opentelemetry import trace
+    from opentelemetry.sdk.trace.export import SimpleSpanProcessor
+    from opentelemetry.sdk.trace.export.in_memory_span_exporter import InMemorySpanExporter
+
+    # The global tracer provider can only be set once per process
+    exporter = InMemorySpanExporter()
+    provider = sdk_trace.TracerProvider()
+    provider.add_span_processor(SimpleSpanProcessor(exporter))
+    trace.set_tracer_provider(provider)
+    if trace.get_tracer_provider() is not provider:
+        pytest.skip("another tracer provider is already set")
+    return exporter
+
+
+def test_answer_stream_spans(client, page_server, span_exporter, caplog):
+    # The stream is started in one worker thread and pulled in others
+    client, limiter = client
+    server = page_server({"/page.html": PAGE})
+    span_exporter.clear()
+    response = client.post("/answer/stream", json={"url": server.url("/page.html"), "question": "What is NLP?"})
+    assert response.status_code == 200
+    assert "A field of linguistics." in response.text
+    assert "generate" in [span.name for span in span_exporter.get_finished_spans()]
+    assert not [record for record in caplog.records if "Failed to detach context" in record.getMessage()]
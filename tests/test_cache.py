@@ -0,0 +1,81 @@
+import os
+import subprocess
+import sys
+
+from conftest import ROOT_DIR
+
+
+def test_importing_webchat_creates_no_files(tmp_path):
+    env = dict(os.environ, PYTHONPATH=os.pathsep.join(filter(None, [ROOT_DIR, os.environ.get("PYTHONPATH")])))
+    subprocess.run([sys.executable, "-c", "import webchat"], cwd=tmp_path, env=env, check=True)
+    assert list(tmp_path.iterdir()) == []
+
+
+def test_ingestion_cache_reads_do_not_write(tmp_path):
+    from cache import IngestionCache
+
+    path = tmp_path / "ingestion_cache.json"
+    cache = IngestionCache(path=str(path))
+    cache.put("docs", "https://example.com/a", "etag-a", None, "hash-a")
+    cache.put("docs", "https://example.com/b", "etag-b", None, "hash-b")
+    saved = path.read_text()
+    assert cache.get("docs", "https://example.com/a")["etag"] == "etag-a"
+    assert path.read_text() == saved
+    # The access is persisted with the next write, so "a" is now the most recent
+    cache.put("docs", "https://example.com/c", "etag-c", None, "hash-c")
+    reloaded = IngestionCache(path=str(path), max_entries=3)
+    reloaded.put("docs", "https://example.com/d", "etag-d", None, "hash-d")
+    assert reloaded.get("docs", "https://example.com/b") is None
+    assert reloaded.get("docs", "https://example.com/a") is not None
+    assert sorted(file.name for file in tmp_path.iterdir()) == ["ingestion_cache.json"]
+
+
+def test_answer_cache_matches_similar_questions():
+    from cache import AnswerCache
+
+    cache = AnswerCache(threshold=0.95)
+    cache.put("docs", "https://example.com/", "v1", "model", [1, 0, 0], "An answer.")
+
+    assert cache.get("docs", "https://example.com/", "v1", "model", [0.99, 0.1, 0]) == "An answer."
+    # Below the threshold, or under another page, version or model
+    assert cache.get("docs", "https://example.com/", "v1", "model", [0.9, 0.44, 0]) is None
+    assert cache.get("docs", "https://example.com/other", "v1", "model", [1, 0, 0]) is None
+    assert cache.get("docs", "https://example.com/", "v2", "model", [1, 0, 0]) is None
+    assert cache.get("docs", "https://example.com/", "v1", "other-model", [1, 0, 0]) is None
+    assert cache.stats()["hits"] == 1 and cache.stats()["misses"] == 4
+
+
+def test_answer_cache_drops_answers_about_older_versions():
+    from cache import AnswerCache
+
+    cache = AnswerCache()
+    cache.put("docs", "https://example.com/", "v1", "model", [1, 0, 0], "Old answer.")
+    cache.put("docs", "https://example.com/other", "v1", "model", [1, 0, 0], "Other page.")
+    cache.put("docs", "https://example.com/", "v2", "model", [0, 1, 0], "New answer.")
+
+    assert cache.get("docs", "https://example.com/", "v1", "model", [1, 0, 0]) is None
+    assert cache.get("docs", "https://example.com/", "v2", "model", [0, 1, 0]) == "New answer."
+    assert cache.get("docs", "https://example.com/other", "v1", "model", [1, 0, 0]) == "Other page."
+    cache.invalidate("docs", "https://example.com/other")
+    assert cache.get("docs", "https://example.com/other", "v1", "model", [1, 0, 0]) is None
+    cache.invalidate("docs")
+    assert cache.stats()["entries"] == 0
+
+
+def test_answer_cache_expiry_and_eviction(monkeypatch):
+    import cache as cache_module
+    from cache import AnswerCache
+
+    now = [1000.0]
+    monkeypatch.setattr(cache_module.time, "time", lambda: now[0])
+    cache = AnswerCache(ttl=60, max_entries=2)
+    for i, vector in enumerate(([1, 0, 0], [0, 1, 0], [0, 0, 1])):
+        cache.put("docs", "https://example.com/", "v1", "model", vector, f"Answer {i}.")
+    # The least recently used answer was evicted
+    assert cache.get("docs", "https://example.com/", "v1", "model", [1, 0, 0]) is None
+    assert cache.get("docs", "https://example.com/", "v1", "model", [0, 1, 0]) == "Answer 1."
+    now[0] += 61
+    assert cache.get("docs", "https://example.com/", "v1", "model", [0, 1, 0]) is None
+    disabled = AnswerCache(max_entries=0)
+    disabled.put("docs", "https://example.com/", "v1", "model", [1, 0, 0], "x")
+    assert disabled.stats()["entries"] == 0
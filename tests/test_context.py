@@ -0,0 +1,76 @@
+import numpy as np
+
+import context
+from context import ContextBuilder
+
+# 3-dimensional embeddings: the question points along the first axis
+VECTORS = {
+    "question": [1, 0, 0],
+    "a": [1, 0, 0],
+    "a again": [0.99, 0.05, 0],
+    "x": [0.9, 0.436, 0],
+    "y": [0.8, 0, 0.6],
+}
+
+
+def embed(texts):
+    return np.array([VECTORS[text] for text in texts], dtype=np.float32)
+
+
+def count_words(texts):
+    return [len(text.split()) for text in texts]
+
+
+def test_mmr_order_skips_duplicates():
+    documents = ["a", "a again", "x", "y"]
+    relevance_only = ContextBuilder(embed, count_words, mmr_lambda=1.0, max_chunks=4)
+    diverse = ContextBuilder(embed, count_words, mmr_lambda=0.3, max_chunks=4)
+
+    assert relevance_only.select("question", documents) == ([0, 2, 3], 1)
+    # "y" is less relevant than "x" but less similar to "a"
+    assert diverse.select("question", documents) == ([0, 3, 2], 1)
+    assert diverse.select("question", documents, max_chunks=2) == ([0, 3], 1)
+    assert diverse.select("question", []) == ([], 0)
+
+
+def test_reranker_scores_replace_the_similarities():
+    class Reranker:
+        def predict(self, pairs):
+            return [{"a": 0.0, "x": 5.0, "y": 1.0}[document] for _, document in pairs]
+
+    builder = ContextBuilder(embed, count_words, reranker=Reranker(), mmr_lambda=1.0)
+    assert builder.select("question", ["a", "x", "y"]) == ([1, 2, 0], 0)
+
+
+def test_build_stops_at_the_token_budget(monkeypatch):
+    monkeypatch.setattr(context, "CONTEXT_TOKEN_BUDGET", 10)
+    words = {"a": "one two three four", "x": "one two three four five six seven", "y": "one two three four five"}
+    builder = ContextBuilder(lambda texts: embed([{v: k for k, v in words.items()}.get(text, text) for text in texts]),
+                             count_words, mmr_lambda=1.0)
+
+    text, report = builder.build("question", [words["a"], words["x"], words["y"]])
+
+    # "x" (7 tokens) does not fit after "a" (4), "y" (5 + 1 separator) does
+    assert text == words["a"] + context.SEPARATOR + words["y"]
+    assert report.as_dict() == {
+        "candidates": 3,
+        "duplicates": 0,
+        "selected": 2,
+        "context_tokens": 10,
+        "baseline_tokens": 18,
+        "tokens_saved": 8,
+        "budget": 10,
+    }
+
+
+def test_token_budget_of_the_model(monkeypatch):
+    monkeypatch.setattr(context, "CONTEXT_TOKEN_BUDGET", 0)
+    monkeypatch.setattr(context, "CONTEXT_TOKEN_MARGIN", 0.25)
+    # The context is counted with the embedding tokenizer: 25% is kept for the LLM's
+    assert context.token_budget("meta-llama/llama-3-8b-instruct") == int((8192 - context.RESERVED_TOKENS) / 1.25)
+    assert context.token_budget("unknown") == int((context.DEFAULT_CONTEXT_LENGTH - context.RESERVED_TOKENS) / 1.25)
+    monkeypatch.setattr(context, "CONTEXT_TOKEN_MARGIN", 0)
+    assert context.token_budget("unknown") == context.DEFAULT_CONTEXT_LENGTH - context.RESERVED_TOKENS
+    monkeypatch.setattr(context, "CONTEXT_TOKEN_BUDGET", 100)
+    assert context.token_budget("meta-llama/llama-3-8b-instruct") == 100
+
@@ -0,0 +1,57 @@
+import pytest
+
+pytest.importorskip("chromadb")
+pytest.importorskip("spacy")
+
+SEED = '<html><body><p>The seed page links to the others.</p><a href="/b">b</a></body></html>'
+
+
+def page(text):
+    return f"<html><body><p>{text}</p></body></html>"
+
+
+def stored_text(collection, url):
+    return " ".join(collection.get(where={"source": url})["documents"])
+
+
+def test_recrawl_refetches_changed_pages_behind_an_unchanged_seed(app_state, page_server):
+    webchat, client = app_state
+    server = page_server({"/": SEED, "/b": page("Bananas are yellow.")})
+
+    collection = webchat.crawl_and_embed(server.url("/"), "recrawl", client, max_depth=1)
+    assert "Bananas are yellow." in stored_text(collection, server.url("/b"))
+
+    server.pages["/b"] = page("Blueberries are blue.")
+    collection = webchat.crawl_and_embed(server.url("/"), "recrawl", client, max_depth=1)
+
+    # The seed did not change: its links come from the ingestion cache
+    assert server.statuses[("/", 304)] == 1
+    assert stored_text(collection, server.url("/b")) == "Blueberries are blue."
+
+
+def test_recrawl_of_an_unchanged_site_only_revalidates(app_state, page_server):
+    webchat, client = app_state
+    server = page_server({"/": SEED, "/b": page("Bananas are yellow.")})
+
+    webchat.crawl_and_embed(server.url("/"), "unchanged", client, max_depth=1)
+    webchat.crawl_and_embed(server.url("/"), "unchanged", client, max_depth=1)
+
+    assert server.statuses[("/", 200)] == 1 and server.statuses[("/", 304)] == 1
+    assert server.statuses[("/b", 200)] == 1 and server.statuses[("/b", 304)] == 1
+
+
+def test_recrawl_refetches_unchanged_pages_missing_from_the_collection(app_state, page_server, monkeypatch):
+    webchat, client = app_state
+    server = page_server({"/": SEED, "/b": page("Bananas are yellow.")})
+    collection = webchat.crawl_and_embed(server.url("/"), "missing", client, max_depth=1)
+    collection.delete(ids=collection.get(where={"source": server.url("/b")})["ids"])
+
+    def fetch_page(*args, **kwargs):
+        raise AssertionError("pages are fetched by the crawler")
+
+    monkeypatch.setattr(webchat, "fetch_page", fetch_page)
+    collection = webchat.crawl_and_embed(server.url("/"), "missing", client, max_depth=1)
+
+    # /b answered 304 but was not indexed any more: it is fetched again without validators
+    assert server.statuses[("/b", 304)] == 1 and server.statuses[("/b", 200)] == 2
+    assert stored_text(collection, server.url("/b")) == "Bananas are yellow."
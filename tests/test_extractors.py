@@ -0,0 +1,85 @@
+import os
+import sys
+
+import pytest
+
+from conftest import ROOT_DIR
+import extractors
+from extractors import IncrementalExtractor, LxmlExtractor, SoupExtractor, StreamingExtractor
+
+pytest.importorskip("lxml")
+
+FIXTURES_DIR = os.path.join(ROOT_DIR, "benchmarks", "fixtures")
+# Optional end tags, which the streaming parser has to close like lxml does
+SNIPPETS = [
+    "<dl><dt>Term<dd>Definition</dl>",
+    "<dl><dt>A<dd>B<dt>C<dd>D</dl><p>After",
+    "<ul><li>one<li>two</ul>",
+    "<ul><li>a<ul><li>b</ul><li>c</ul>",
+    "<p>one<p>two",
+    "<p>before<div>inside</div>after",
+    "<p>before<ul><li>item</ul>",
+    "<p>A<script>x=1</script> c</p>",
+    "<table><tr><td>1<td>2<tr><td>3</table>",
+]
+
+
+def fixture_pages():
+    return sorted(name for name in os.listdir(FIXTURES_DIR) if name.endswith(".html"))
+
+
+def read_fixture(name):
+    with open(os.path.join(FIXTURES_DIR, name), encoding="utf-8") as file:
+        return file.read()
+
+
+def incremental_blocks(html, piece_size=7):
+    parser = IncrementalExtractor()
+    blocks = []
+    for start in range(0, len(html), piece_size):
+        parser.feed(html[start:start + piece_size])
+        blocks.extend(parser.blocks)
+        parser.blocks = []
+    parser.close()
+    return blocks + parser.blocks
+
+
+@pytest.mark.parametrize("html", [read_fixture(name) for name in fixture_pages()] + SNIPPETS,
+                         ids=fixture_pages() + [f"snippet-{i}" for i in range(len(SNIPPETS))])
+def test_streaming_parser_matches_lxml(html):
+    # The text hash of a page must not depend on whether it was streamed
+    assert incremental_blocks(html) == LxmlExtractor().extract_blocks(html)
+
+
+def test_xhtml_with_encoding_declaration():
+    html = ('<?xml version="1.0" encoding="utf-8"?>\n'
+            '<html xmlns="http://www.w3.org/1999/xhtml"><body><p>Hello</p></body></html>')
+    assert LxmlExtractor().extract_blocks(html) == ["Hello"]
+
+
+def test_comment_only_page():
+    assert LxmlExtractor().extract_blocks("<!-- nothing here -->") == []
+
+
+def test_inline_script_and_style_are_dropped():
+    html = "<p>A <b>b</b><script>x=1</script> c<!-- note --></p><table><tr><td>1<style>.a{}</style></td><td>2</td></tr></table>"
+    assert LxmlExtractor().extract_blocks(html) == ["A b c", "1 | 2"]
+
+
+def test_html_parser_runs_blocks_with_optional_end_tags_together():
+    # Why html.parser is not the fallback when lxml is missing
+    html = read_fixture("blog_post.html")
+    assert "Embedding modelTurns" in SoupExtractor("html.parser").extract(html)
+    assert SoupExtractor("html.parser").extract_blocks("<ul><li>one<li>two</ul>") == ["onetwo"]
+    for extractor in (LxmlExtractor(), StreamingExtractor()):
+        assert "Embedding modelTurns" not in extractor.extract(html)
+        assert extractor.extract_blocks("<ul><li>one<li>two</ul>") == ["one", "two"]
+
+
+def test_fallback_without_lxml(monkeypatch):
+    expected = {name: LxmlExtractor().extract(read_fixture(name)) for name in fixture_pages()}
+    monkeypatch.delenv("HTML_EXTRACTOR", raising=False)
+    monkeypatch.setitem(sys.modules, "lxml.html", None)
+    assert extractors.default_extractor_name() == "incremental"
+    extractor = extractors.get_extractor()
+    assert {name: extractor.extract(read_fixture(name)) for name in fixture_pages()} == expected
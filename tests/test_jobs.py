@@ -0,0 +1,47 @@
+import pytest
+
+pytest.importorskip("chromadb")
+pytest.importorskip("spacy")
+
+PAGE = "<html><body><p>Apples are red. Bananas are yellow.</p><p>Cherries are dark red.</p></body></html>"
+
+
+@pytest.fixture
+def ingest(app_state, monkeypatch):
+    webchat, client = app_state
+    import jobs
+
+    # Embed in the test process, the hash model is not available to spawned ones
+    monkeypatch.setattr(webchat, "background_engine", webchat.embedding_engine)
+
+    def run(url, collection_name):
+        job = jobs.Job(url, collection_name)
+        webchat.ingest(url, collection_name, client, job)
+        job.finish()
+        return job
+
+    return webchat, run
+
+
+def test_job_records_the_ingestion_stages(ingest, page_server):
+    webchat, run = ingest
+    server = page_server({"/page.html": PAGE})
+    job = run(server.url("/page.html"), "jobs")
+
+    assert job.chunks == 3 and job.sentences == 3 and job.bytes == len(PAGE)
+    stages = job.trace.as_dict()["stages"]
+    assert {"fetch", "parse", "split", "embed", "upsert"} <= set(stages)
+
+
+def test_unchanged_page_without_validators_is_not_split_again(ingest, page_server):
+    webchat, run = ingest
+    server = page_server({"/page.html": PAGE}, validators=False)
+    run(server.url("/page.html"), "jobs")
+    hits = webchat.ingestion_cache.hits
+
+    job = run(server.url("/page.html"), "jobs")
+
+    assert server.statuses[("/page.html", 200)] == 2
+    assert webchat.ingestion_cache.hits == hits + 1
+    stages = job.trace.as_dict()["stages"]
+    assert "parse" in stages and "split" not in stages and "upsert" not in stages
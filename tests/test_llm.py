@@ -0,0 +1,67 @@
+import threading
+import time
+
+import pytest
+
+import llm
+
+ANSWER = "Natural language processing is  a field of linguistics."
+
+
+def test_streamed_pieces_join_to_the_answer():
+    model = llm.FakeModel(answer=ANSWER, first_token_delay=0, token_delay=0)
+    stats = llm.GenerationStats()
+
+    pieces = list(llm.stream_generate(model, "prompt", stats))
+
+    assert "".join(pieces) == ANSWER == model.generate_text("prompt")
+    assert len(pieces) == len(ANSWER.split(" "))
+    assert stats.tokens == len(pieces)
+    assert stats.time_to_first_token is not None and stats.as_dict()["total_s"] is not None
+
+
+def test_stream_stats_end_when_the_stream_is_closed():
+    model = llm.FakeModel(answer=ANSWER, first_token_delay=0, token_delay=0)
+    stats = llm.GenerationStats()
+    pieces = llm.stream_generate(model, "prompt", stats)
+
+    assert next(pieces) == "Natural"
+    pieces.close()
+
+    assert stats.tokens == 1 and stats.finished is not None
+    assert str(llm.GenerationStats()) == "No tokens generated"
+
+
+def test_model_pool_forgets_failed_builds():
+    def factory(model_id, params, api_key, project_id, url):
+        if api_key == "wrong":
+            raise ValueError("invalid API key")
+        return llm.FakeModel(answer=model_id, first_token_delay=0, token_delay=0)
+
+    pool = llm.ModelPool(factory)
+    with pytest.raises(ValueError):
+        pool.get("model", {}, "wrong", "project", "url")
+    assert pool._building == {}
+    assert pool.get("model", {}, "key", "project", "url") is pool.get("model", {}, "key", "project", "url")
+    assert pool._building == {}
+    assert pool.stats()["hits"] == 1 and pool.stats()["misses"] == 1
+
+
+def test_model_pool_waiters_refresh_the_lru_order():
+    pool = llm.ModelPool(lambda model_id, *args: llm.FakeModel(answer=model_id), max_size=2)
+    # Another thread is building "slow": a second get() for it waits for the build
+    key = pool._key("slow", {}, "key", "project", "url")
+    build_lock = pool._building.setdefault(key, threading.Lock())
+    build_lock.acquire()
+    waiter = threading.Thread(target=pool.get, args=("slow", {}, "key", "project", "url"))
+    waiter.start()
+    time.sleep(0.1)
+    with pool._lock:
+        pool._models[key] = llm.FakeModel(answer="slow")
+    pool.get("other", {}, "key", "project", "url")
+    build_lock.release()
+    waiter.join(5)
+
+    pool.get("third", {}, "key", "project", "url")
+    # The waiter used "slow" after "other" was built, so "other" is evicted
+    assert sorted(model.answer for model in pool._models.values()) == ["slow", "third"]
@@ -0,0 +1,44 @@
+import pytest
+
+# The export needs PyTorch and the reference vectors need sentence-transformers
+pytest.importorskip("torch")
+pytest.importorskip("sentence_transformers")
+pytest.importorskip("onnx")
+pytest.importorskip("onnxruntime")
+pytest.importorskip("transformers")
+
+import models  # noqa: E402
+import onnx_encoder  # noqa: E402
+
+SENTENCES = [
+    "Natural language processing is a field of linguistics and machine learning.",
+    "Error E1024 means the request timed out.",
+    "We use cookies to improve your experience on our website.",
+    "Short.",
+    "Transformers are language models trained on large amounts of raw text in a self-supervised fashion, "
+    "which gives them a statistical understanding of the language they were trained on.",
+]
+
+
+@pytest.fixture(scope="module")
+def sentence_transformer():
+    # EMBEDDING_MODEL_DIR runs the test offline
+    try:
+        return models.load_sentence_transformer()
+    except OSError as e:
+        pytest.skip(f"The embedding model could not be loaded: {e}")
+
+
+@pytest.fixture(scope="module")
+def onnx_dir(tmp_path_factory):
+    return str(tmp_path_factory.mktemp("onnx") / "model")
+
+
+@pytest.mark.parametrize("backend", ["onnx", "onnx-int8"])
+def test_onnx_vectors_match_pytorch(sentence_transformer, onnx_dir, backend):
+    # Exported on the first call, quantized on the first int8 one
+    encoder = onnx_encoder.load(lambda: sentence_transformer, onnx_dir, quantized=backend == "onnx-int8")
+    reference = sentence_transformer.encode(SENTENCES, convert_to_numpy=True)
+    vectors = encoder.encode(SENTENCES)
+    assert vectors.shape == reference.shape
+    assert onnx_encoder.cosine_drift(reference, vectors).max() < onnx_encoder.MAX_DRIFT[backend]
@@ -0,0 +1,52 @@
+import pytest
+
+pytest.importorskip("spacy")
+
+import pipeline  # noqa: E402
+import splitter  # noqa: E402
+from vectorstore import NumpyVectorStore  # noqa: E402
+
+SENTENCES = ["Apples are red.", "Bananas are yellow.", "Cherries are dark red."]
+
+
+def html_pieces(paragraphs, size=64):
+    html = "<html><body>" + "".join(f"<p>{text}</p>" for text in paragraphs) + "</body></html>"
+    data = html.encode("utf-8")
+    return [data[start:start + size] for start in range(0, len(data), size)]
+
+
+def test_streamed_page_is_split_with_the_mode_of_the_whole_page(hash_engine, monkeypatch):
+    # Every group of a streamed page is small, but the page is not: "auto" picks
+    # the sentencizer for all of them
+    modes = []
+    get_pipeline = splitter.get_pipeline
+    monkeypatch.setattr(splitter, "DEFAULT_MODE", "auto")
+    monkeypatch.setattr(splitter, "get_pipeline", lambda mode: modes.append(mode) or get_pipeline("sentencizer"))
+    store = NumpyVectorStore("stream", hash_engine.encode)
+
+    pipeline.index_stream(store, "http://example.com/", html_pieces(SENTENCES * 50), "utf-8", hash_engine)
+
+    assert modes and set(modes) == {"sentencizer"}
+
+
+def test_chunk_sync_only_writes_changes(hash_engine):
+    store = NumpyVectorStore("sync", hash_engine.encode)
+    other = pipeline.ChunkSync(store, "http://example.com/other")
+    other.upsert(["Apples are red."])
+    first = pipeline.ChunkSync(store, "http://example.com/")
+    assert first.upsert(SENTENCES + ["Apples are red."], hash_engine.encode) == 3
+    first.finish()
+
+    embedded = []
+    second = pipeline.ChunkSync(store, "http://example.com/")
+    added = second.upsert(["Apples are red.", "Kiwis are green."],
+                          lambda texts: embedded.extend(texts) or hash_engine.encode(texts))
+
+    # Only the new sentence is embedded, the sentences gone from the page are deleted
+    assert added == 1 and embedded == ["Kiwis are green."]
+    assert second.finish() == 2
+    assert (second.added, second.deleted) == (1, 2)
+    assert sorted(store.get(where={"source": "http://example.com/"})["documents"]) == ["Apples are red.",
+                                                                                       "Kiwis are green."]
+    # The same sentence on another page is a chunk of its own
+    assert store.get(where={"source": "http://example.com/other"})["documents"] == ["Apples are red."]
@@ -0,0 +1,17 @@
+from registry import CollectionRegistry
+
+
+def test_touch_does_not_write(tmp_path):
+    path = tmp_path / "collections.json"
+    registry = CollectionRegistry(path=str(path), budget_bytes=250)
+    registry.record("a", "https://a.example/", chunks=1, nbytes=100, build_s=0.1)
+    registry.record("b", "https://b.example/", chunks=1, nbytes=100, build_s=0.1)
+    saved = path.read_text()
+    registry.touch("a")
+    assert path.read_text() == saved
+    # The order is kept in memory: "b" is now the least recently used
+    registry.record("c", "https://c.example/", chunks=1, nbytes=100, build_s=0.1)
+    assert registry.over_budget() == ["b"]
+    registry.remove("b")
+    assert [row["collection"] for row in CollectionRegistry(path=str(path)).stats()] == ["c", "a"]
+    assert sorted(file.name for file in tmp_path.iterdir()) == ["collections.json"]
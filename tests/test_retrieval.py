@@ -0,0 +1,129 @@
+import math
+from types import SimpleNamespace
+
+import pytest
+
+import retrieval
+from retrieval import BM25Index, HybridStore, reciprocal_rank_fusion
+from vectorstore import NumpyVectorStore
+
+DOCUMENTS = {
+    "a": "The server returned error E2048 after the upgrade.",
+    "b": "Restart the server to apply the new settings.",
+    "c": "Bananas are yellow and apples are red.",
+}
+
+
+def bm25(index, query, document, documents):
+    # The textbook formula, over the tokens of the documents
+    tokenized = [retrieval.tokenize(text) for text in documents]
+    average_length = sum(len(tokens) for tokens in tokenized) / len(tokenized)
+    tokens = retrieval.tokenize(document)
+    score = 0.0
+    for term in set(retrieval.tokenize(query)):
+        df = sum(term in other for other in tokenized)
+        if not df:
+            continue
+        idf = math.log(1 + (len(tokenized) - df + 0.5) / (df + 0.5))
+        tf = tokens.count(term)
+        score += idf * tf * (index.k1 + 1) / (tf + index.k1 * (1 - index.b + index.b * len(tokens) / average_length))
+    return score
+
+
+def test_tokenize_keeps_identifiers():
+    assert retrieval.tokenize("Set max_attempts=5 in v2.1 (ERR-42)") == ["set", "max_attempts", "5", "in", "v2.1",
+                                                                           "err-42"]
+
+
+def test_bm25_scores():
+    index = BM25Index()
+    index.add(list(DOCUMENTS), list(DOCUMENTS.values()))
+    query = "server error E2048"
+
+    scores = index.scores(query)
+
+    for row, id in enumerate(index.ids):
+        assert scores[row] == pytest.approx(bm25(index, query, DOCUMENTS[id], list(DOCUMENTS.values())), rel=1e-5)
+    assert [id for id, _, _ in index.top_k(query, 3)] == ["a", "b"]
+    assert index.top_k("kiwi", 3) == []
+
+
+def test_bm25_where_filters_on_source():
+    index = BM25Index()
+    index.add(list(DOCUMENTS), list(DOCUMENTS.values()), [{"source": "page1"}, {"source": "page2"}, None])
+    assert [id for id, _, _ in index.top_k("server", 3, where={"source": "page2"})] == ["b"]
+    assert index.top_k("server", 3, where={"source": "unknown"}) == []
+    with pytest.raises(ValueError):
+        index.scores("server", where={"kind": "note"})
+
+
+def test_bm25_follows_updates_and_removals():
+    index = BM25Index()
+    index.add(list(DOCUMENTS), list(DOCUMENTS.values()))
+    index.top_k("server", 3)
+    index.add(["a"], ["Apples are green."])
+    index.remove(["b", "missing"])
+
+    assert len(index) == 2
+    assert index.top_k("server", 3) == []
+    assert [id for id, _, _ in index.top_k("apples", 3)] == ["a", "c"]
+    # The statistics are those of the documents left
+    current = ["Apples are green.", DOCUMENTS["c"]]
+    assert index.top_k("apples", 3)[0][2] == pytest.approx(bm25(index, "apples", current[0], current), rel=1e-5)
+
+
+def test_bm25_compaction_keeps_the_live_documents():
+    index = BM25Index()
+    ids = [f"id{i}" for i in range(2500)]
+    index.add(ids, [f"document number {i}" for i in range(2500)], [{"source": f"page{i % 2}"} for i in range(2500)])
+    index.remove(ids[:2000])
+
+    assert len(index.ids) == 500
+    assert [id for id, _, _ in index.top_k("2100", 1, where={"source": "page0"})] == ["id2100"]
+    assert index.top_k("2101", 1, where={"source": "page0"}) == []
+
+
+def test_reciprocal_rank_fusion():
+    # "b" is second in both rankings and beats the ids first in only one of them
+    assert reciprocal_rank_fusion([["a", "b", "c"], ["d", "b"]], [1.0, 1.0])[:1] == ["b"]
+    assert reciprocal_rank_fusion([["a", "b"], ["b", "a"]], [2.0, 1.0]) == ["a", "b"]
+    assert reciprocal_rank_fusion([["a"], ["b"]], [1.0, 0.0]) == ["a", "b"]
+
+
+def test_hybrid_store_keeps_the_index_in_sync(hash_engine):
+    store = HybridStore(NumpyVectorStore("test", hash_engine.encode), BM25Index(), mode="hybrid", candidates=3)
+    store.upsert(list(DOCUMENTS), list(DOCUMENTS.values()), metadatas=[{"source": "page"}] * 3)
+
+    result = store.query(query_texts=["error E2048"], n_results=2, where={"source": "page"})
+    assert result["ids"][0][0] == "a"
+    assert result["documents"][0][0] == DOCUMENTS["a"]
+
+    store.upsert(["a"], ["Apples are green."], metadatas=[{"source": "page"}])
+    store.delete(["b"])
+    assert store.count() == len(store.index) == 2
+    result = store.query(query_texts=["server error"], n_results=3)
+    assert "b" not in result["ids"][0]
+    assert result["documents"][0][result["ids"][0].index("a")] == "Apples are green."
+    assert store.index.top_k("server", 3) == []
+
+
+def test_dense_mode_only_queries_the_vectors(hash_engine):
+    vectors = NumpyVectorStore("test", hash_engine.encode)
+    store = HybridStore(vectors, BM25Index(), mode="dense")
+    store.upsert(list(DOCUMENTS), list(DOCUMENTS.values()))
+    assert store.query(query_texts=["error E2048"], n_results=2) == vectors.query(query_texts=["error E2048"],
+                                                                                  n_results=2)
+
+
+def test_index_text_is_counted_in_the_collection_budget(app_state, monkeypatch):
+    webchat, _ = app_state
+    sync = SimpleNamespace(seen={"chunk1", "chunk2"})
+    vector_bytes = 2 * webchat.embedding_engine.dimension * 4
+    monkeypatch.setattr(retrieval, "RETRIEVAL_MODE", "dense")
+    webchat.record_page("dense", "https://example.com/", sync, 1000, 0.1)
+    monkeypatch.setattr(retrieval, "RETRIEVAL_MODE", "hybrid")
+    webchat.record_page("hybrid", "https://example.com/", sync, 1000, 0.1)
+
+    sizes = {row["collection"]: row["size_mb"] * 1024 * 1024 for row in webchat.collection_registry.stats()}
+    assert sizes["dense"] == pytest.approx(vector_bytes + 1000)
+    assert sizes["hybrid"] == pytest.approx(vector_bytes + 2000)
@@ -0,0 +1,152 @@
+import numpy as np
+import pytest
+
+from vectorstore import NumpyVectorStore
+
+
+def random_vectors(count, dimension=32, seed=0):
+    return np.random.default_rng(seed).standard_normal((count, dimension)).astype(np.float32)
+
+
+def exact_top(vectors, query, k):
+    vectors = vectors / np.linalg.norm(vectors, axis=1, keepdims=True)
+    scores = vectors @ (query / np.linalg.norm(query))
+    return np.argsort(-scores)[:k].tolist(), np.sort(1 - scores)[:k]
+
+
+def filled_store(vectors, embed=None, **kwargs):
+    store = NumpyVectorStore("test", embed, **kwargs)
+    store.upsert(ids=[f"id{i}" for i in range(len(vectors))], documents=[f"doc {i}" for i in range(len(vectors))],
+                 embeddings=vectors, metadatas=[{"source": f"page{i % 3}"} for i in range(len(vectors))])
+    return store
+
+
+def test_query_ranks_by_cosine_distance():
+    vectors = random_vectors(200)
+    store = filled_store(vectors)
+    query = random_vectors(1, seed=1)[0]
+    rows, distances = exact_top(vectors, query, 5)
+
+    result = store.query(query_embeddings=[query], n_results=5)
+
+    assert result["ids"] == [[f"id{row}" for row in rows]]
+    assert result["documents"] == [[f"doc {row}" for row in rows]]
+    np.testing.assert_allclose(result["distances"][0], distances, rtol=1e-5, atol=1e-6)
+
+
+def test_query_texts_are_embedded(hash_engine):
+    store = NumpyVectorStore("test", hash_engine.encode)
+    store.upsert(ids=["a", "b"], documents=["apples are red", "the sky is blue"])
+    assert store.query(query_texts=["red apples"], n_results=1)["ids"] == [["a"]]
+
+
+def test_where_filters_on_metadata():
+    vectors = random_vectors(30)
+    store = filled_store(vectors)
+    # Rows added later without the key never match it
+    store.upsert(ids=["extra"], documents=["extra"], embeddings=vectors[:1], metadatas=[{"kind": "note"}])
+    query = vectors[0]
+
+    result = store.query(query_embeddings=[query], n_results=30, where={"source": "page1"})
+
+    assert sorted(result["ids"][0]) == sorted(f"id{i}" for i in range(1, 30, 3))
+    assert store.get(where={"source": "page1", "kind": "note"})["ids"] == []
+    assert store.get(where={"kind": "note"})["ids"] == ["extra"]
+    assert store.get(where={"source": "unknown"})["ids"] == []
+    # A metadata change moves the row to the other value
+    store.upsert(ids=["id1"], documents=["doc 1"], embeddings=vectors[1:2], metadatas=[{"source": "page2"}])
+    assert "id1" not in store.get(where={"source": "page1"})["ids"]
+    assert "id1" in store.get(where={"source": "page2"})["ids"]
+
+
+def test_delete_fills_the_hole_with_the_last_row():
+    vectors = random_vectors(10)
+    store = filled_store(vectors)
+
+    store.delete(["id2", "missing", "id9"])
+
+    assert store.count() == 8
+    # id8 (the last row once id9 is gone) took the place of id2
+    assert store.ids[2] == "id8"
+    assert store.get(ids=["id8"], include=["documents", "metadatas", "embeddings"])["metadatas"] == [
+        {"source": "page2"}]
+    assert sorted(store.get(where={"source": "page2"})["ids"]) == ["id5", "id8"]
+    for i in (0, 3, 8):
+        result = store.query(query_embeddings=[vectors[i]], n_results=1)
+        assert result["ids"] == [[f"id{i}"]]
+        assert result["distances"][0][0] == pytest.approx(0, abs=1e-5)
+    store.delete([f"id{i}" for i in range(10)])
+    assert store.count() == 0
+    assert store.query(query_embeddings=[vectors[0]], n_results=3)["ids"] == [[]]
+
+
+def test_persist_and_reload(tmp_path):
+    vectors = random_vectors(50)
+    store = filled_store(vectors, directory=str(tmp_path))
+    store.persist()
+    query = random_vectors(1, seed=2)[0]
+    expected = store.query(query_embeddings=[query], n_results=5)
+
+    reloaded = NumpyVectorStore("test", None, directory=str(tmp_path))
+
+    assert reloaded.count() == 50
+    assert reloaded.query(query_embeddings=[query], n_results=5)["ids"] == expected["ids"]
+    assert reloaded.get(where={"source": "page0"})["ids"] == store.get(where={"source": "page0"})["ids"]
+    # The memory-mapped matrix is copied on the first write
+    reloaded.delete(["id0"])
+    reloaded.upsert(ids=["new"], documents=["new"], embeddings=query[None, :], metadatas=[{"source": "page0"}])
+    reloaded.persist()
+    again = NumpyVectorStore("test", None, directory=str(tmp_path))
+    assert again.count() == 50
+    assert again.query(query_embeddings=[query], n_results=1)["ids"] == [["new"]]
+    assert "id0" not in again.get()["ids"]
+
+
+@pytest.mark.parametrize("precision", ["float16", "int8"])
+def test_compact_vectors_are_rescored_with_float32(precision, tmp_path):
+    vectors = random_vectors(500)
+    store = filled_store(vectors, directory=str(tmp_path), precision=precision, rescore=4)
+    exact = filled_store(vectors)
+    assert store.resident_bytes() < exact.resident_bytes()
+
+    for seed in range(1, 6):
+        query = random_vectors(1, seed=seed)[0]
+        rows, distances = exact_top(vectors, query, 10)
+        result = store.query(query_embeddings=[query], n_results=10)
+        assert result["ids"] == [[f"id{row}" for row in rows]]
+        # Distances of the rescored results come from the exact vectors
+        np.testing.assert_allclose(result["distances"][0], distances, rtol=1e-5, atol=1e-6)
+        filtered = store.query(query_embeddings=[query], n_results=3, where={"source": "page1"})
+        assert filtered["ids"] == exact.query(query_embeddings=[query], n_results=3, where={"source": "page1"})["ids"]
+
+
+@pytest.mark.parametrize("precision", ["float16", "int8"])
+def test_compact_vectors_without_rescoring(precision):
+    vectors = random_vectors(200)
+    store = filled_store(vectors, precision=precision, rescore=0)
+    query = vectors[7]
+    result = store.query(query_embeddings=[query], n_results=1)
+    assert result["ids"] == [["id7"]]
+    assert result["distances"][0][0] == pytest.approx(0, abs=1e-2)
+
+
+@pytest.mark.parametrize("precision", ["float16", "int8"])
+def test_compact_vectors_after_delete_and_reload(precision, tmp_path):
+    vectors = random_vectors(100)
+    store = filled_store(vectors, directory=str(tmp_path), precision=precision)
+    store.delete(["id3"])
+    # The compact row of id99 moved to the hole too
+    assert store.query(query_embeddings=[vectors[99]], n_results=1)["ids"] == [["id99"]]
+    store.persist()
+
+    reloaded = NumpyVectorStore("test", None, directory=str(tmp_path), precision=precision)
+
+    assert reloaded.count() == 99
+    for i in (0, 50, 99):
+        assert reloaded.query(query_embeddings=[vectors[i]], n_results=1)["ids"] == [[f"id{i}"]]
+    assert reloaded.resident_bytes() == store.resident_bytes()
+
+
+def test_unknown_precision():
+    with pytest.raises(ValueError):
+        NumpyVectorStore("test", None, precision="bfloat16")
@@ -0,0 +1,33 @@
+import pytest
+
+pytest.importorskip("chromadb")
+pytest.importorskip("spacy")
+
+from cache import IngestionCache  # noqa: E402
+from chunking import Chunker  # noqa: E402
+
+PAGE = ("<html><body><p>Apples are red. Bananas are yellow.</p>"
+        "<p>Cherries are dark red. Limes are green.</p></body></html>")
+
+
+def test_changing_the_chunking_reindexes_a_page_that_answers_304(app_state, page_server, monkeypatch, tmp_path):
+    webchat, client = app_state
+    server = page_server({"/page.html": PAGE})
+    url = server.url("/page.html")
+
+    collection = webchat.create_embedding(url, "chunking", client)
+    assert collection.count() == 4
+
+    # A restart with CHUNK_MODE=window
+    monkeypatch.setattr(webchat, "chunker", Chunker("window", max_tokens=200, overlap_tokens=0,
+                                                    tokenizer=webchat.chunker.tokenizer))
+    monkeypatch.setattr(webchat, "ingestion_cache", IngestionCache(path=str(tmp_path / "ingestion_cache.json"),
+                                                                   version=webchat.chunker.signature))
+    collection = webchat.create_embedding(url, "chunking", client)
+    assert server.statuses[("/page.html", 200)] == 2
+    assert collection.get(where={"source": url})["documents"] == [
+        "Apples are red. Bananas are yellow. Cherries are dark red. Limes are green."]
+
+    # Indexed with the new chunking, the page is revalidated again
+    webchat.create_embedding(url, "chunking", client)
+    assert server.statuses[("/page.html", 304)] == 1
@@ -1,7 +1,9 @@
 from urllib.parse import urlparse
 from dotenv import load_dotenv
+import ipaddress
 import os
-import chromadb
+import re
+import threading
 import streamlit as st
 def get_credentials():
     load_dotenv()
@@ -13,33 +15,53 @@ def load_css(file_name):
         st.markdown(f'<style>{file.read()}</style>', unsafe_allow_html=True)
 
 def create_collection_name(url):
-    parsed_url = urlparse(url)
-    domain_parts = parsed_url.netloc.split('.')
-    if len(domain_parts) >= 2:
-        return domain_parts[-2]  # Extracting the second-level domain
-    else:
+    # One collection per site: the host name without "www.", so docs.python.org and
+    # python.org or example.com and example.co.uk do not share a collection. Chroma
+    # names are 3-512 characters of [a-zA-Z0-9._-], start and end with a letter or
+    # digit and are not IPv4 addresses.
+    host = (urlparse(url).hostname or "").lower()
+    if host.startswith("www."):
+        host = host[4:]
+    name = re.sub(r"[^a-z0-9._-]+", "-", host).strip("._-")[:500]
+    if not name:
         return "base"
+    try:
+        ipaddress.ip_address(name)
+        name = f"site-{name}"
+    except ValueError:
+        pass
+    if len(name) < 3:
+        name = f"site-{name}"
+    return name
     
+# One persistent client per process, shared by every Streamlit session and rerun,
+# so the indexes are loaded from disk once and stay in memory
+_chromadb_client = None
+_chromadb_client_lock = threading.Lock()
+
+def chroma_persist_dir():
+    return os.getenv("CHROMA_PERSIST_DIR", os.path.join(os.getcwd(), ".cache", "chroma"))
+
 def chromadb_client():
-    import chromadb
-    # Set up cache directory (consider user-defined location)
-    current_dir = os.getcwd()
-    # Replace 'my_custom_cache_path' with your desired location
-    custom_cache_path = os.path.join(current_dir, ".cache")
-    # Create settings object with custom cache path
-    settings = chromadb.Settings(persist_directory=custom_cache_path)
-     # Initialize client with custom settings
-    client = chromadb.Client(settings)
-    return client
+    global _chromadb_client
+    with _chromadb_client_lock:
+        if _chromadb_client is None:
+            import chromadb
+            # chromadb.Client(Settings(persist_directory=...)) is in-memory on recent
+            # Chroma versions; PersistentClient actually writes the index to disk
+            _chromadb_client = chromadb.PersistentClient(
+                path=chroma_persist_dir(),
+                settings=chromadb.Settings(anonymized_telemetry=False),
+            )
+        return _chromadb_client
 
 def clear_collection(collection_name,client):
-    try:
-        collection = client.get_collection(collection_name)
-        if collection:
-            collection.delete()
-            print(f"Collection '{collection_name}' cleared successfully!")
-    except ValueError:
-        pass  # collection does not exist, do nothing
+    # Drops the collection with its index, which frees its disk space.
+    # list_collections() returns names on some Chroma versions, collections on others
+    names = [getattr(collection, "name", collection) for collection in client.list_collections()]
+    if collection_name in names:
+        client.delete_collection(collection_name)
+        print(f"Collection '{collection_name}' cleared successfully!")
 
 
 
@@ -0,0 +1,385 @@
+import json
+import os
+import tempfile
+import threading
+
+import numpy as np
+
+VECTOR_BACKEND = os.getenv("VECTOR_BACKEND", "chroma")
+# Where the numpy backend saves its matrices; empty keeps them in memory only
+VECTOR_STORE_DIR = os.getenv("VECTOR_STORE_DIR", "")
+# Precision of the vectors the numpy backend scans: float32, float16 or int8
+VECTOR_PRECISION = os.getenv("VECTOR_PRECISION", "float32")
+# With float16 or int8, candidates per result rescored with the exact vectors;
+# 0 ranks by the compact vectors only
+VECTOR_RESCORE = int(os.getenv("VECTOR_RESCORE", 4))
+
+COMPACT_DTYPES = {"float16": np.float16, "int8": np.int8}
+# Rows of compact vectors widened to float32 at a time by a query
+SCAN_BLOCK = 16384
+
+
+class VectorStore:
+    # The part of a Chroma collection the app uses: get/upsert/delete chunks by id,
+    # equality filters on metadata (e.g. where={"source": url}) and top-k queries
+    # returning Chroma-shaped results ({"ids": [[...]], "documents": [[...]], ...}).
+    def get(self, ids=None, where=None, limit=None, include=None):
+        raise NotImplementedError
+
+    def upsert(self, ids, documents, embeddings=None, metadatas=None):
+        raise NotImplementedError
+
+    def delete(self, ids):
+        raise NotImplementedError
+
+    def query(self, query_texts=None, query_embeddings=None, n_results=10, where=None):
+        raise NotImplementedError
+
+    def count(self):
+        raise NotImplementedError
+
+    def persist(self):
+        # Called after a page was indexed
+        pass
+
+
+class ChromaVectorStore(VectorStore):
+    def __init__(self, collection):
+        self.collection = collection
+        self.name = collection.name
+
+    def get(self, ids=None, where=None, limit=None, include=None):
+        return self.collection.get(ids=ids, where=where, limit=limit,
+                                   include=include if include is not None else ["documents", "metadatas"])
+
+    def upsert(self, ids, documents, embeddings=None, metadatas=None):
+        self.collection.upsert(ids=ids, documents=documents, embeddings=embeddings, metadatas=metadatas)
+
+    def delete(self, ids):
+        self.collection.delete(ids=ids)
+
+    def query(self, query_texts=None, query_embeddings=None, n_results=10, where=None):
+        return self.collection.query(query_texts=query_texts, query_embeddings=query_embeddings,
+                                     n_results=n_results, where=where)
+
+    def count(self):
+        return self.collection.count()
+
+
+class NumpyVectorStore(VectorStore):
+    # In-process exact search: the vectors are the rows of one contiguous float32
+    # matrix, normalized so that a query is a single matrix product followed by an
+    # argpartition top-k. Distances are cosine distances, like a Chroma collection
+    # with "hnsw:space": "cosine". Deleted rows are filled with the last row so the
+    # matrix stays contiguous. Metadata values are kept as integer codes per key,
+    # which makes the where filters vectorized too.
+    # With a `directory` the matrix is saved to <name>.npy by persist() and loaded
+    # back memory-mapped, the rest goes to <name>.json.
+    # With `precision` float16 or int8 (one scale per row) queries scan a compact
+    # copy of the vectors and rescore the best `rescore` x n_results candidates
+    # with the exact float32 vectors, which are kept in a file-backed map instead
+    # of the resident memory.
+    def __init__(self, name, embed, directory=None, precision=VECTOR_PRECISION, rescore=VECTOR_RESCORE):
+        if precision != "float32" and precision not in COMPACT_DTYPES:
+            raise ValueError(f"Unknown vector precision: {precision}")
+        self.name = name
+        self.embed = embed
+        self.directory = directory
+        self.precision = precision
+        self.rescore = rescore
+        self._lock = threading.RLock()
+        self._matrix = None
+        # The matrix loaded from disk is read-only until the first write
+        self._mapped = False
+        self._compact = None
+        self._scales = None
+        self._size = 0
+        self.ids = []
+        self.documents = []
+        self.metadatas = []
+        self._rows = {}
+        self._codes = {}
+        self._code_arrays = {}
+        if directory:
+            self._load()
+
+    def _paths(self):
+        base = os.path.join(self.directory, self.name)
+        return base + ".npy", base + ".json"
+
+    def _load(self):
+        matrix_path, data_path = self._paths()
+        if not (os.path.exists(matrix_path) and os.path.exists(data_path)):
+            return
+        with open(data_path, encoding="utf-8") as file:
+            data = json.load(file)
+        # Read-only until the first write, which copies it into memory
+        self._matrix = np.load(matrix_path, mmap_mode="r")
+        self._mapped = True
+        self._size = len(data["ids"])
+        if self.precision != "float32":
+            self._compact = np.empty((self._size, self._matrix.shape[1]), dtype=COMPACT_DTYPES[self.precision])
+            self._scales = np.ones(self._size, dtype=np.float32)
+            for start in range(0, self._size, SCAN_BLOCK):
+                block = slice(start, min(start + SCAN_BLOCK, self._size))
+                self._write_compact(block, np.asarray(self._matrix[block]))
+        self.ids = data["ids"]
+        self.documents = data["documents"]
+        self.metadatas = data["metadatas"]
+        self._rows = {id: row for row, id in enumerate(self.ids)}
+        for row, metadata in enumerate(self.metadatas):
+            self._set_codes(row, metadata)
+
+    def persist(self):
+        if not self.directory:
+            return
+        os.makedirs(self.directory, exist_ok=True)
+        matrix_path, data_path = self._paths()
+        with self._lock:
+            if self._matrix is not None and not self._mapped:
+                with open(matrix_path + ".tmp", "wb") as file:
+                    np.save(file, self._matrix[:self._size])
+                os.replace(matrix_path + ".tmp", matrix_path)
+            with open(data_path + ".tmp", "w", encoding="utf-8") as file:
+                json.dump({"ids": self.ids, "documents": self.documents, "metadatas": self.metadatas}, file)
+            os.replace(data_path + ".tmp", data_path)
+
+    def _allocate(self, capacity, dimension):
+        if self.precision == "float32":
+            return np.empty((capacity, dimension), dtype=np.float32)
+        # Only the rows of the candidates are read back, so the exact vectors live
+        # in an unlinked temporary file the OS can page out
+        if self.directory:
+            os.makedirs(self.directory, exist_ok=True)
+        with tempfile.TemporaryFile(dir=self.directory or None) as file:
+            return np.memmap(file, dtype=np.float32, mode="w+", shape=(capacity, dimension))
+
+    def _reserve(self, rows, dimension):
+        # Grows the matrices by doubling; a memory-mapped matrix is copied on first write
+        capacity = 0 if self._matrix is None else len(self._matrix)
+        if self._matrix is not None and not self._mapped and rows <= capacity:
+            return
+        capacity = max(rows, capacity * 2, 1024)
+        matrix = self._allocate(capacity, dimension)
+        if self._matrix is not None:
+            matrix[:self._size] = self._matrix[:self._size]
+        self._matrix = matrix
+        self._mapped = False
+        if self.precision != "float32":
+            compact = np.empty((capacity, dimension), dtype=COMPACT_DTYPES[self.precision])
+            scales = np.ones(capacity, dtype=np.float32)
+            if self._compact is not None:
+                compact[:self._size] = self._compact[:self._size]
+                scales[:self._size] = self._scales[:self._size]
+            self._compact, self._scales = compact, scales
+
+    def _write_compact(self, rows, vectors):
+        if self.precision == "float16":
+            self._compact[rows] = vectors
+        else:
+            # Symmetric int8 with one scale per row: the largest component maps to 127
+            scales = np.abs(vectors).max(axis=1) / 127
+            scales[scales == 0] = 1
+            self._compact[rows] = np.round(vectors / scales[:, None])
+            self._scales[rows] = scales
+
+    def resident_bytes(self):
+        # Memory of the vectors scanned by queries; the exact vectors of a compact
+        # store are file-backed and not counted
+        if self._matrix is None:
+            return 0
+        dimension = self._matrix.shape[1]
+        if self.precision == "float32":
+            return self._size * dimension * 4
+        return self._size * (dimension * np.dtype(COMPACT_DTYPES[self.precision]).itemsize +
+                             (4 if self.precision == "int8" else 0))
+
+    def _set_codes(self, row, metadata):
+        for array in self._code_arrays.values():
+            if row < len(array):
+                array[row] = -1
+        for key, value in (metadata or {}).items():
+            codes = self._codes.setdefault(key, {})
+            code = codes.setdefault(value, len(codes))
+            array = self._code_arrays.get(key)
+            if array is None or len(array) <= row:
+                grown = np.full(max(row + 1, 2 * (0 if array is None else len(array)), 1024), -1, dtype=np.int32)
+                if array is not None:
+                    grown[:len(array)] = array
+                array = self._code_arrays[key] = grown
+            array[row] = code
+
+    def _move_codes(self, source, target):
+        for array in self._code_arrays.values():
+            if source < len(array):
+                array[target] = array[source]
+                array[source] = -1
+
+    def _mask(self, where):
+        # Rows matching every key of an equality filter
+        mask = np.ones(self._size, dtype=bool)
+        for key, value in (where or {}).items():
+            code = self._codes.get(key, {}).get(value)
+            if code is None:
+                return np.zeros(self._size, dtype=bool)
+            # Rows added after the last one with this key have no code
+            codes = self._code_arrays[key][:self._size]
+            mask[:len(codes)] &= codes == code
+            mask[len(codes):] = False
+        return mask
+
+    @staticmethod
+    def _normalize(matrix):
+        matrix = np.asarray(matrix, dtype=np.float32)
+        norms = np.linalg.norm(matrix, axis=1, keepdims=True)
+        norms[norms == 0] = 1
+        return matrix / norms
+
+    def get(self, ids=None, where=None, limit=None, include=None):
+        include = include if include is not None else ["documents", "metadatas"]
+        with self._lock:
+            if ids is not None:
+                rows = [self._rows[id] for id in ids if id in self._rows]
+            else:
+                rows = np.flatnonzero(self._mask(where)).tolist()
+            rows = rows[:limit] if limit is not None else rows
+            result = {"ids": [self.ids[row] for row in rows]}
+            if "documents" in include:
+                result["documents"] = [self.documents[row] for row in rows]
+            if "metadatas" in include:
+                result["metadatas"] = [self.metadatas[row] for row in rows]
+            if "embeddings" in include:
+                result["embeddings"] = np.array(self._matrix[rows]) if rows else []
+            return result
+
+    def upsert(self, ids, documents, embeddings=None, metadatas=None):
+        if not ids:
+            return
+        # Without embeddings the texts are encoded, like Chroma's embedding function does
+        vectors = self._normalize(embeddings if embeddings is not None else self.embed(documents))
+        metadatas = metadatas or [None] * len(ids)
+        with self._lock:
+            self._reserve(self._size + len(ids), vectors.shape[1])
+            written = []
+            for id, document, vector, metadata in zip(ids, documents, vectors, metadatas):
+                row = self._rows.get(id)
+                if row is None:
+                    row = self._size
+                    self._size += 1
+                    self._rows[id] = row
+                    self.ids.append(id)
+                    self.documents.append(document)
+                    self.metadatas.append(metadata)
+                else:
+                    self.documents[row] = document
+                    self.metadatas[row] = metadata
+                self._matrix[row] = vector
+                self._set_codes(row, metadata)
+                written.append(row)
+            if self._compact is not None:
+                self._write_compact(np.array(written), vectors)
+
+    def delete(self, ids):
+        with self._lock:
+            if self._mapped:
+                self._reserve(self._size, self._matrix.shape[1])
+            for id in ids:
+                row = self._rows.pop(id, None)
+                if row is None:
+                    continue
+                last = self._size - 1
+                if row != last:
+                    # Fill the hole with the last row
+                    self._matrix[row] = self._matrix[last]
+                    if self._compact is not None:
+                        self._compact[row] = self._compact[last]
+                        self._scales[row] = self._scales[last]
+                    self.ids[row] = self.ids[last]
+                    self.documents[row] = self.documents[last]
+                    self.metadatas[row] = self.metadatas[last]
+                    self._rows[self.ids[row]] = row
+                self._move_codes(last, row)
+                self.ids.pop()
+                self.documents.pop()
+                self.metadatas.pop()
+                self._size -= 1
+
+    def _scores(self, queries, rows):
+        # Similarity of the queries to every row, or to `rows` only
+        if self.precision == "float32":
+            return queries @ (self._matrix[:self._size] if rows is None else self._matrix[rows]).T
+        # The compact vectors are widened a block at a time, so the product runs in
+        # BLAS without a float32 copy of the whole matrix
+        count = self._size if rows is None else len(rows)
+        scores = np.empty((len(queries), count), dtype=np.float32)
+        for start in range(0, count, SCAN_BLOCK):
+            block = slice(start, min(start + SCAN_BLOCK, count))
+            index = block if rows is None else rows[block]
+            scores[:, block] = queries @ self._compact[index].astype(np.float32).T
+            if self.precision == "int8":
+                scores[:, block] *= self._scales[index]
+        return scores
+
+    @staticmethod
+    def _top(scores, k):
+        # argpartition finds the k best in linear time, only those are sorted
+        if k == 0:
+            return np.empty(0, dtype=np.int64)
+        top = np.argpartition(-scores, k - 1)[:k]
+        return top[np.argsort(-scores[top])]
+
+    def query(self, query_texts=None, query_embeddings=None, n_results=10, where=None):
+        if query_embeddings is None:
+            query_embeddings = self.embed(list(query_texts))
+        queries = self._normalize(np.atleast_2d(np.asarray(query_embeddings, dtype=np.float32)))
+        with self._lock:
+            if self._size == 0:
+                rows = np.empty(0, dtype=np.int64)
+                scores = np.empty((len(queries), 0), dtype=np.float32)
+            else:
+                rows = np.flatnonzero(self._mask(where)) if where else None
+                scores = self._scores(queries, rows)
+            k = min(n_results, scores.shape[1])
+            rescore = self.precision != "float32" and self.rescore > 0
+            result = {"ids": [], "documents": [], "metadatas": [], "distances": []}
+            for query, query_scores in zip(queries, scores):
+                if rescore:
+                    candidates = self._top(query_scores, min(k * self.rescore, len(query_scores)))
+                    candidate_rows = candidates if rows is None else rows[candidates]
+                    exact = self._matrix[candidate_rows] @ query
+                    best = self._top(exact, k)
+                    matrix_rows, top_scores = candidate_rows[best], exact[best]
+                else:
+                    top = self._top(query_scores, k)
+                    matrix_rows, top_scores = (top if rows is None else rows[top]), query_scores[top]
+                result["ids"].append([self.ids[row] for row in matrix_rows])
+                result["documents"].append([self.documents[row] for row in matrix_rows])
+                result["metadatas"].append([self.metadatas[row] for row in matrix_rows])
+                result["distances"].append((1 - top_scores).tolist())
+            return result
+
+    def count(self):
+        return self._size
+
+
+# Numpy stores live as long as the process, like the persistent Chroma client
+_numpy_stores = {}
+_numpy_stores_lock = threading.Lock()
+
+
+def get_numpy_store(name, embed, directory=VECTOR_STORE_DIR):
+    with _numpy_stores_lock:
+        store = _numpy_stores.get(name)
+        if store is None:
+            store = _numpy_stores[name] = NumpyVectorStore(name, embed, directory or None)
+        return store
+
+
+def drop_numpy_store(name, directory=VECTOR_STORE_DIR):
+    with _numpy_stores_lock:
+        _numpy_stores.pop(name, None)
+    if directory:
+        for extension in (".npy", ".json"):
+            path = os.path.join(directory, name + extension)
+            if os.path.exists(path):
+                os.remove(path)
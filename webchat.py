@@ -2,20 +2,26 @@
 import os
 from dotenv import load_dotenv
 
-from sentence_transformers import SentenceTransformer
-from chromadb.api.types import EmbeddingFunction
-
-# WML python SDK
-from ibm_watson_machine_learning.foundation_models import Model
-from ibm_watson_machine_learning.metanames import GenTextParamsMetaNames as GenParams
-from ibm_watson_machine_learning.foundation_models.utils.enums import ModelTypes, DecodingMethods
-
-import requests
-from bs4 import BeautifulSoup
-import spacy
-import chromadb
-import en_core_web_md
-from utils import chromadb_client
+# The WML python SDK, spaCy, chromadb and sentence-transformers are imported on
+# first use so that importing this module (every Streamlit rerun) stays cheap
+import asyncio
+import itertools
+import time
+from cache import AnswerCache, EmbeddingCache, IngestionCache, LazyCache, hash_text
+import splitter
+import models
+from crawler import Crawler, conditional_headers, make_session, REQUEST_TIMEOUT
+import pipeline
+import extractors
+from chunking import Chunker
+import llm
+import telemetry
+import jobs
+import vectorstore
+import retrieval
+from context import ContextBuilder
+from embeddings import EmbeddingEngine
+from registry import CollectionRegistry
 
 # Important: hardcoding the API key in Python code is not a best practice. We are using
 # this approach for the ease of demo setup. In a production application these variables
@@ -36,9 +42,18 @@ def get_credentials():
     globals()["api_key"] = os.getenv("api_key", None)
     globals()["watsonx_project_id"] = os.getenv("project_id", None)
 
-# The get_model function creates an LLM model object with the specified parameters
+# Model clients are kept in a pool, so that authentication and connection setup
+# happen once per (credentials, model, parameters) instead of once per question
+model_pool = llm.ModelPool(max_size=int(os.getenv("MODEL_POOL_SIZE", 32)))
+
+# The get_model function returns an LLM model object with the specified parameters.
+# Credentials are passed explicitly; without them the ones read by get_credentials() are used
+
+def get_model(model_type, max_tokens, min_tokens, decoding, temperature, top_k, top_p,
+              request_api_key=None, request_project_id=None):
+    # WML python SDK
+    from ibm_watson_machine_learning.metanames import GenTextParamsMetaNames as GenParams
 
-def get_model(model_type, max_tokens, min_tokens, decoding, temperature, top_k, top_p):
     generate_params = {
         GenParams.MAX_NEW_TOKENS: max_tokens,
         GenParams.MIN_NEW_TOKENS: min_tokens,
@@ -48,19 +63,19 @@ def get_model(model_type, max_tokens, min_tokens, decoding, temperature, top_k,
         GenParams.TOP_P: top_p,
     }
 
-    model = Model(
-        model_id=model_type,
-        params=generate_params,
-        credentials={
-            "apikey": api_key,
-            "url": url
-        },
-        project_id=watsonx_project_id
+    return model_pool.get(
+        model_type,
+        generate_params,
+        request_api_key if request_api_key is not None else api_key,
+        request_project_id if request_project_id is not None else watsonx_project_id,
+        url,
     )
 
-    return model
+def get_model_test(model_type, max_tokens, min_tokens, decoding, temperature,
+                   request_api_key=None, request_project_id=None):
+    # WML python SDK
+    from ibm_watson_machine_learning.metanames import GenTextParamsMetaNames as GenParams
 
-def get_model_test(model_type, max_tokens, min_tokens, decoding, temperature):
     generate_params = {
         GenParams.MAX_NEW_TOKENS: max_tokens,
         GenParams.MIN_NEW_TOKENS: min_tokens,
@@ -68,60 +83,97 @@ def get_model_test(model_type, max_tokens, min_tokens, decoding, temperature):
         GenParams.TEMPERATURE: temperature
     }
 
-    model = Model(
-        model_id=model_type,
-        params=generate_params,
-        credentials={
-            "apikey": api_key,
-            "url": url
-        },
-        project_id=watsonx_project_id
+    return model_pool.get(
+        model_type,
+        generate_params,
+        request_api_key if request_api_key is not None else api_key,
+        request_project_id if request_project_id is not None else watsonx_project_id,
+        url,
     )
 
-    return model
-
-# Set up cache directory (consider user-defined location)
-current_dir = os.getcwd()
-cache_dir = os.path.join(current_dir, ".cache")
-# Create cache directory if necessary
-if not os.path.exists(cache_dir):
-    os.makedirs(cache_dir)
-# Set the Hugging Face cache directory
-os.environ["HF_HOME"] = cache_dir    
-# Download the model (specify the correct model identifier)
-model_name = 'sentence-transformers/all-MiniLM-L6-v2'
-#model_name = "all-MiniLM-L6-v2"  
-model = SentenceTransformer(model_name, cache_folder=cache_dir)
-# Print confirmation message
-print(f"Model '{model_name}' downloaded and loaded from cache directory: {cache_dir}")
-
-# Embedding function
-class MiniLML6V2EmbeddingFunction(EmbeddingFunction):
-    MODEL = model
-    def __call__(self, texts):
-        return MiniLML6V2EmbeddingFunction.MODEL.encode(texts).tolist()
+# The embedding model is loaded on first use (or by warm_up()); it can be loaded
+# offline from the directory in EMBEDDING_MODEL_DIR
+model_name = models.EMBEDDING_MODEL_NAME
+model = models.embedding_model
+
+# Sentences embedded before are read back from disk instead of being encoded again.
+# The caches below are opened on first use, importing this module creates no files
+embedding_cache = LazyCache(lambda: EmbeddingCache(max_entries=int(os.getenv("EMBEDDING_CACHE_MAX_ENTRIES", 200_000))))
+
+# Embedding engine shared by every collection
+embedding_engine = EmbeddingEngine(
+    model,
+    batch_size=int(os.getenv("EMBEDDING_BATCH_SIZE", 64)),
+    normalize=os.getenv("EMBEDDING_NORMALIZE", "false").lower() == "true",
+    cache=embedding_cache,
+    cache_key=models.EMBEDDING_CACHE_KEY,
+)
+
+_embedding_function_class = None
+
+def get_embedding_function_class():
+    # Chroma requires a subclass of its EmbeddingFunction, so the class is created
+    # the first time a collection needs it
+    global _embedding_function_class
+    if _embedding_function_class is None:
+        from chromadb.api.types import EmbeddingFunction
+
+        # Embedding function
+        class MiniLML6V2EmbeddingFunction(EmbeddingFunction):
+            ENGINE = embedding_engine
+            def __init__(self):
+                pass
+
+            def __call__(self, input):
+                # One float32 row per text; the rows are views of a single matrix
+                with telemetry.stage("embed", texts=len(input)):
+                    return list(MiniLML6V2EmbeddingFunction.ENGINE.encode(input))
+
+        _embedding_function_class = MiniLML6V2EmbeddingFunction
+    return _embedding_function_class
+
+def __getattr__(name):
+    # Keeps webchat.MiniLML6V2EmbeddingFunction available without importing chromadb
+    if name == "MiniLML6V2EmbeddingFunction":
+        return get_embedding_function_class()
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
+
+def warm_up():
+    # Load the embedding model and the sentence splitter in background threads so
+    # that the first question does not pay for them
+    models.warm_up("embedding")
+    if models.RERANKER_MODEL_NAME:
+        models.warm_up("reranker")
+    splitter.warm_up()
+
+# Pooled keep-alive connections shared by every page download
+http_session = make_session()
+
+def fetch_page(url, etag=None, last_modified=None, stream=False):
+    # Conditional GET: the server answers 304 if the page did not change since the
+    # response that carried these validators
+    with telemetry.stage("fetch", url=url):
+        return http_session.get(url, headers=conditional_headers(etag, last_modified), timeout=REQUEST_TIMEOUT,
+                                stream=stream)
+
+# HTML_EXTRACTOR picks the parser backend: lxml (default when installed, else
+# incremental), html.parser, bs4-lxml or selectolax
+html_extractor = extractors.get_extractor(debug=os.getenv("HTML_EXTRACTOR_DEBUG", "false").lower() == "true")
+
+def parse_html(html):
+    # Text of the headings, paragraphs, list items, tables and code blocks of the
+    # page, without navigation and footers
+    with telemetry.stage("parse"):
+        return html_extractor.extract(html)
 
 def extract_text(url):
     try:
         # Send an HTTP GET request to the URL
-        response = requests.get(url)
+        response = fetch_page(url)
 
         # Check if the request was successful
         if response.status_code == 200:
-            # Parse the HTML content of the page using BeautifulSoup
-            soup = BeautifulSoup(response.text, 'html.parser')
-
-            # Extract contents of <p> elements
-            p_contents = [p.get_text() for p in soup.find_all('p')]
-
-            # Print the contents of <p> elements
-            print("\nContents of <p> elements: \n")
-            for content in p_contents:
-                print(content)
-            raw_web_text = " ".join(p_contents)
-            # remove \xa0 which is used in html to avoid words break acorss lines.
-            cleaned_text = raw_web_text.replace("\xa0", " ")
-            return cleaned_text
+            return parse_html(response.text)
         else:
             print(f"Failed to retrieve the page. Status code: {response.status_code}")
 
@@ -129,26 +181,262 @@ def extract_text(url):
         print(f"An error occurred: {str(e)}")
 
 
-def split_text_into_sentences(text):
-    nlp = spacy.load("en_core_web_md")
-    doc = nlp(text)
-    sentences = [sent.text for sent in doc.sents]
-    cleaned_sentences = [s.strip() for s in sentences]
-    return cleaned_sentences
-
-def create_embedding(url, collection_name,client):
-    cleaned_text = extract_text(url)
+def split_text_into_sentences(text, mode=None):
+    # The spaCy pipeline is loaded once per process; see splitter.py for the modes
+    with telemetry.stage("split"):
+        sentences = splitter.split_text_into_sentences(text, mode)
+    telemetry.count("sentences", len(sentences))
+    return sentences
+
+# Pages already indexed, so repeated questions about an unchanged page skip the
+# download, the sentence splitting and the embedding. Pages cached with another
+# chunking are not revalidated: they are fetched and indexed again.
+ingestion_cache = LazyCache(lambda: IngestionCache(
+    ttl=int(os.getenv("INGESTION_CACHE_TTL", 24 * 3600)),
+    max_entries=int(os.getenv("INGESTION_CACHE_MAX_ENTRIES", 256)),
+    version=chunker.signature,
+))
+
+# One chunk per sentence, or with CHUNK_MODE=window sentences packed into windows
+# of CHUNK_MAX_TOKENS tokens overlapping by CHUNK_OVERLAP_TOKENS
+chunker = Chunker(tokenizer=lambda texts, **kwargs: model.tokenizer(texts, **kwargs))
+
+def page_version(text_hash):
+    # Identifies what is indexed for a page: its text and how it was chunked
+    return f"{chunker.signature}:{text_hash}"
+
+# HNSW parameters of new collections. Chroma stores them with the collection, an
+# existing collection keeps the parameters it was created with
+HNSW_SETTINGS = {
+    "hnsw:space": os.getenv("CHROMA_HNSW_SPACE", "cosine"),
+    "hnsw:construction_ef": int(os.getenv("CHROMA_HNSW_CONSTRUCTION_EF", 100)),
+    "hnsw:M": int(os.getenv("CHROMA_HNSW_M", 16)),
+    "hnsw:search_ef": int(os.getenv("CHROMA_HNSW_SEARCH_EF", 50)),
+}
+
+# Size, build time and last use of every collection, to evict the least recently
+# used sites once they take more than COLLECTIONS_BUDGET_MB
+collection_registry = LazyCache(CollectionRegistry)
+
+def get_collection(collection_name, client, hnsw=None):
+    # Returns the vector store of the collection, see vectorstore.VECTOR_BACKEND,
+    # with a BM25 index next to it in hybrid retrieval mode.
+    # `hnsw` overrides HNSW_SETTINGS for this collection, e.g. {"hnsw:search_ef": 100}
+    collection_registry.touch(collection_name)
+    if vectorstore.VECTOR_BACKEND == "numpy":
+        store = vectorstore.get_numpy_store(collection_name, embedding_engine.encode)
+    else:
+        store = vectorstore.ChromaVectorStore(client.get_or_create_collection(
+            collection_name,
+            metadata=dict(HNSW_SETTINGS, **(hnsw or {})),
+            embedding_function=get_embedding_function_class()(),
+        ))
+    if retrieval.RETRIEVAL_MODE == "hybrid":
+        store = retrieval.hybrid_store(store)
+    return store
+
+def clear_collection(collection_name, client):
+    # Forgets everything indexed in the collection
+    if vectorstore.VECTOR_BACKEND == "numpy":
+        vectorstore.drop_numpy_store(collection_name)
+    else:
+        from utils import clear_collection as clear_chroma_collection
+        clear_chroma_collection(collection_name, client)
+    retrieval.drop_index(collection_name)
+    ingestion_cache.invalidate(collection_name)
+    answer_cache.invalidate(collection_name)
+    collection_registry.remove(collection_name)
+
+def record_page(collection_name, url, sync, text_bytes, seconds, engine=None):
+    # Estimated size of the page in the store: one float32 vector per chunk and its text.
+    # The BM25 index of hybrid retrieval keeps a second copy of the text in memory;
+    # its postings are not counted
+    chunks = len(sync.seen)
+    vector_bytes = (engine or embedding_engine).dimension * 4
+    if retrieval.RETRIEVAL_MODE == "hybrid":
+        text_bytes *= 2
+    collection_registry.record(collection_name, url, chunks, chunks * vector_bytes + text_bytes, seconds)
+
+def enforce_collection_budget(client, keep=()):
+    # Drops the least recently used collections while the indexed sites take more
+    # than the budget; collections being indexed are kept
+    keep = set(keep) | {job.collection_name for job in ingestion_queue.jobs()}
+    for name in collection_registry.over_budget(keep):
+        print(f"Collection '{name}' evicted to stay within {collection_registry.budget_bytes / (1024 * 1024):.1f} MB")
+        clear_collection(name, client)
+
+def is_indexed(collection, url):
+    return len(collection.get(where={"source": url}, limit=1, include=[])["ids"]) > 0
+
+def index_text(collection, collection_name, url, cleaned_text, etag=None, last_modified=None, links=None,
+               engine=None, progress=None):
+    # Split, embed and upsert the text of one page unless exactly this text is
+    # already indexed for the url. Returns True when the collection was updated.
+    # `links` are the ones the crawler followed from the page, cached with it;
+    # `engine` replaces the embedding function of the collection and
+    # `progress(sync)` is called once the chunks are stored.
+    text_hash = page_version(hash_text(cleaned_text))
+    cached = ingestion_cache.get(collection_name, url)
+    if cached is not None and cached["text_hash"] == text_hash:
+        # The server sent the page again but the extracted text is the same
+        ingestion_cache.record_hit()
+        ingestion_cache.put(collection_name, url, etag, last_modified, text_hash, links)
+        return False
+
+    ingestion_cache.record_miss()
+    start = time.perf_counter()
     cleaned_sentences = split_text_into_sentences(cleaned_text)
-    collection = client.get_or_create_collection(collection_name)
-    # Upload text to chroma
-    collection.upsert(
-        documents=cleaned_sentences,
-        metadatas=[{"source": str(i)} for i in range(len(cleaned_sentences))],
-        ids=[str(i) for i in range(len(cleaned_sentences))],
-    )
+    embed = None
+    if engine is not None:
+        def embed(texts):
+            with telemetry.stage("embed", texts=len(texts)):
+                return engine.encode(texts)
+    # Upload to chroma only the chunks that are new for this url, and remove the
+    # ones that are no longer on the page
+    with telemetry.stage("upsert"):
+        sync = pipeline.ChunkSync(collection, url)
+        sync.upsert(list(chunker(cleaned_sentences)), embed)
+        sync.finish()
+        collection.persist()
+    if progress is not None:
+        progress(sync)
+    telemetry.count("chunks_embedded", sync.added)
+    print(f"Indexed {url}: {sync.added} new and {sync.deleted} deleted chunks")
+    ingestion_cache.put(collection_name, url, etag, last_modified, text_hash, links)
+    record_page(collection_name, url, sync, len(cleaned_text.encode("utf-8")), time.perf_counter() - start, engine)
+    return True
+
+# Pages larger than this are indexed with the streaming pipeline
+STREAMING_MIN_BYTES = int(os.getenv("STREAMING_MIN_BYTES", 1024 * 1024))
+
+def create_embedding(url, collection_name,client, streaming_min_bytes=None, engine=None, progress=None):
+    # `engine` replaces the embedding function of the collection. The streaming
+    # pipeline calls `progress(sync, stats)` after every batch it upserts (see
+    # jobs.py); a smaller page calls `progress(sync)` once it is indexed
+    if streaming_min_bytes is None:
+        streaming_min_bytes = STREAMING_MIN_BYTES
+    collection = get_collection(collection_name, client)
+    cached = ingestion_cache.get(collection_name, url)
+    # The cache entry is only valid while the collection still holds the page
+    if cached is not None and not is_indexed(collection, url):
+        ingestion_cache.invalidate(collection_name, url)
+        cached = None
+
+    if cached is None:
+        response = fetch_page(url, stream=True)
+    else:
+        response = fetch_page(url, cached["etag"], cached["last_modified"], stream=True)
+        if response.status_code == 304:
+            response.close()
+            ingestion_cache.record_hit()
+            return collection
+    with response:
+        if response.status_code != 200:
+            raise ValueError(f"Failed to retrieve the page. Status code: {response.status_code}")
+        etag = response.headers.get("ETag")
+        last_modified = response.headers.get("Last-Modified")
+
+        # Read up to STREAMING_MIN_BYTES; pages larger than that go through the
+        # streaming pipeline so memory stays bounded whatever the page size
+        chunks = response.iter_content(chunk_size=pipeline.CHUNK_SIZE)
+        head = []
+        size = 0
+        start = time.perf_counter()
+        for chunk in chunks:
+            head.append(chunk)
+            size += len(chunk)
+            if size > streaming_min_bytes:
+                # The bytes are counted by the pipeline, which reads the head again
+                telemetry.record("fetch", time.perf_counter() - start)
+                index_stream(collection, collection_name, url, itertools.chain(head, chunks),
+                             response.encoding, etag, last_modified, engine, progress)
+                enforce_collection_budget(client, keep={collection_name})
+                return collection
+        html = b"".join(head).decode(response.encoding or "utf-8", errors="replace")
+        telemetry.record("fetch", time.perf_counter() - start)
+        telemetry.count("bytes_fetched", size)
+
+    cleaned_text = parse_html(html)
+    if index_text(collection, collection_name, url, cleaned_text, etag, last_modified, engine=engine,
+                  progress=progress):
+        enforce_collection_budget(client, keep={collection_name})
+    return collection
 
+# Pages are indexed by background workers, so the Streamlit thread never waits
+# for a whole page: it submits a job and answers once the first batch is stored.
+# The embedding model runs in EMBEDDING_PROCESSES worker processes (0 keeps it
+# in the ingestion threads); embeddings are shared through the same cache.
+if jobs.EMBEDDING_PROCESSES > 0:
+    background_engine = EmbeddingEngine(
+        jobs.ProcessPoolModel(),
+        batch_size=embedding_engine.batch_size,
+        normalize=embedding_engine.normalize,
+        cache=embedding_cache,
+        cache_key=models.EMBEDDING_CACHE_KEY,
+    )
+else:
+    background_engine = embedding_engine
+
+def ingest(url, collection_name, client, job):
+    # Large pages go through the streaming pipeline, which reports each batch; the
+    # others are compared with the text indexed last time before being split, so
+    # an unchanged page served without validators is not chunked again. The
+    # stages are recorded in the trace of the job, shown next to the answer's.
+    with telemetry.request("ingest", url=url) as job.trace:
+        create_embedding(url, collection_name, client, engine=background_engine, progress=job.update)
+
+ingestion_queue = jobs.IngestionQueue(ingest)
+
+def index_stream(collection, collection_name, url, chunks, encoding, etag=None, last_modified=None, engine=None,
+                 progress=None):
+    ingestion_cache.record_miss()
+    start = time.perf_counter()
+    sync, text_hash, stats = pipeline.index_stream(collection, url, chunks, encoding, engine or embedding_engine,
+                                                   chunker, progress=progress)
+    collection.persist()
+    # The stages overlap while the page streams in, so they are reported as
+    # durations without spans of their own
+    for stage, totals in stats.stages.items():
+        telemetry.record(stage, totals["seconds"])
+    telemetry.count("bytes_fetched", stats.stages.get("fetch", {}).get("bytes", 0))
+    telemetry.count("sentences", stats.stages.get("split", {}).get("items", 0))
+    telemetry.count("chunks_embedded", sync.added)
+    ingestion_cache.put(collection_name, url, etag, last_modified, page_version(text_hash))
+    record_page(collection_name, url, sync, stats.stages.get("parse", {}).get("bytes", 0),
+                time.perf_counter() - start, engine)
+    print(f"Indexed {url}: {sync.added} new and {sync.deleted} deleted chunks\n{stats}")
+    return stats
+
+async def crawl_and_embed_async(seed_url, collection_name, client, max_depth=1, max_pages=20):
+    # Crawl the pages of the seed's domain and index each one as soon as it arrives;
+    # parsing and embedding run in a worker thread while the crawl goes on
+    collection = get_collection(collection_name, client)
+    crawler = Crawler(max_depth=max_depth, max_pages=max_pages,
+                      ingestion_cache=ingestion_cache, collection_name=collection_name)
+    try:
+        async for page in crawler.crawl(seed_url):
+            url = page["url"]
+            if page["status"] == 304:
+                if await asyncio.to_thread(is_indexed, collection, url):
+                    ingestion_cache.record_hit()
+                    continue
+                # The cached validators outlived the indexed copy of the page: fetch
+                # it in full, still under robots.txt and the per-host limit
+                ingestion_cache.invalidate(collection_name, url)
+                page = await crawler.fetch(url, follow_links=page["links"] is not None, conditional=False)
+                if page is None or page["status"] != 200:
+                    continue
+            cleaned_text = await asyncio.to_thread(parse_html, page["html"])
+            await asyncio.to_thread(index_text, collection, collection_name, url, cleaned_text,
+                                    page["etag"], page["last_modified"], page["links"])
+    finally:
+        crawler.close()
+    enforce_collection_budget(client, keep={collection_name})
     return collection
 
+def crawl_and_embed(seed_url, collection_name, client, max_depth=1, max_pages=20):
+    return asyncio.run(crawl_and_embed_async(seed_url, collection_name, client, max_depth, max_pages))
+
 
 def create_prompt_old(url, question, collection_name, client):
     # Create embeddings for the text file
@@ -168,47 +456,115 @@ def create_prompt_old(url, question, collection_name, client):
 
     return prompt
 
-def create_prompt(url, question, collection_name,client):
+# Over-fetched chunks are deduplicated, optionally reranked and packed into the
+# token budget of the model
+context_builder = ContextBuilder(
+    embedding_engine.encode,
+    chunker.count_tokens,
+    reranker=models.reranker_model if models.RERANKER_MODEL_NAME else None,
+)
+
+def retrieve_contexts(collection, url, questions, n_results=None, model_id=None):
+    # One vectorized query for all the questions about a page; returns the
+    # context of every question, at most `n_results` chunks each (CONTEXT_MAX_CHUNKS)
+    n_results = n_results or context_builder.max_chunks
+    with telemetry.stage("query", questions=len(questions)):
+        relevant_chunks = collection.query(
+            query_texts=list(questions),
+            n_results=max(n_results, context_builder.candidates),
+            where={"source": url},
+        )
+    contexts = []
+    for question, documents in zip(questions, relevant_chunks["documents"]):
+        with telemetry.stage("prompt"):
+            context, report = context_builder.build(question, documents, model_id, n_results)
+        telemetry.count("context_tokens", report.context_tokens)
+        print(report)
+        contexts.append(context)
+    return contexts
+
+def build_prompt(context, question):
+    return (
+        "<|begin_of_text|>\n"
+        "<|start_header_id|>system<|end_header_id|>\n"
+        "You are a helpful AI assistant.\n"
+        "<|eot_id|>\n"
+        "<|start_header_id|>user<|end_header_id|>\n"
+        f"### Context:\n{context}\n\n"
+        f"### Instruction:\n"
+        f"Please answer the following question based on the above context. Your answer should be concise and directly address the question. "
+        f"If the question is unanswerable based on the given context, respond with 'unanswerable'.\n\n"
+        f"### Question:\n{question}\n"
+        "<|eot_id|>\n"
+        "<|start_header_id|>assistant<|end_header_id|>\n"
+    )
+
+def create_prompt(url, question, collection_name,client, collection=None, model_id=None, raise_errors=False):
+  # Errors are returned as the prompt, unless raise_errors=True (the HTTP API)
   try:
-    # Create embeddings for the text file
-    collection = create_embedding(url, collection_name,client)
+    # Create embeddings for the text file, unless the caller already did
+    if collection is None:
+      collection = create_embedding(url, collection_name,client)
   except Exception as e:
+    if raise_errors:
+      raise
     return f"Error creating embeddings: {e}"
   
   try:
     # Query relevant information
-    relevant_chunks = collection.query(
-        query_texts=[question],
-        n_results=5,
-    )
-    context = "\n\n\n".join(relevant_chunks["documents"][0])
+    context = retrieve_contexts(collection, url, [question], model_id=model_id)[0]
   except Exception as e:
+    if raise_errors:
+      raise
     return f"Error querying the collection: {e}"
   
   # Create the prompt
-  prompt = (
-      "<|begin_of_text|>\n"
-      "<|start_header_id|>system<|end_header_id|>\n"
-      "You are a helpful AI assistant.\n"
-      "<|eot_id|>\n"
-      "<|start_header_id|>user<|end_header_id|>\n"
-      f"### Context:\n{context}\n\n"
-      f"### Instruction:\n"
-      f"Please answer the following question based on the above context. Your answer should be concise and directly address the question. "
-      f"If the question is unanswerable based on the given context, respond with 'unanswerable'.\n\n"
-      f"### Question:\n{question}\n"
-      "<|eot_id|>\n"
-      "<|start_header_id|>assistant<|end_header_id|>\n"
-  )
-
-  return prompt
-
-
+  return build_prompt(context, question)
+
+
+# Answers to questions asked before, or paraphrases of them, about the same version
+# of a page; a changed page gets a new version and therefore new answers
+answer_cache = AnswerCache(
+    threshold=float(os.getenv("ANSWER_CACHE_THRESHOLD", 0.95)),
+    ttl=int(os.getenv("ANSWER_CACHE_TTL", 3600)),
+    max_entries=int(os.getenv("ANSWER_CACHE_MAX_ENTRIES", 1024)),
+)
+
+def model_id_of(model):
+    return getattr(model, "model_id", type(model).__name__)
+
+def lookup_answer(url, question, collection_name, client, model, ingest=True, raise_errors=False):
+    # Indexes the page, then looks the question up in the answer cache.
+    # Returns (collection, cache key, cached answer or None). The collection is None
+    # when the page could not be indexed; create_prompt reports the error then,
+    # or with raise_errors=True the error is raised here.
+    # With ingest=False the page is being indexed by ingestion_queue, and the
+    # question is answered from the chunks stored so far.
+    try:
+        if ingest:
+            collection = create_embedding(url, collection_name, client)
+        else:
+            collection = get_collection(collection_name, client)
+    except Exception:
+        if raise_errors:
+            raise
+        return None, None, None
+    if not ingest:
+        job = ingestion_queue.get(url, collection_name)
+        if job is not None and not job.done.is_set():
+            # An answer from part of the page must not be cached for the whole page
+            return collection, None, None
+    cached = ingestion_cache.get(collection_name, url)
+    if cached is None or answer_cache.max_entries <= 0:
+        return collection, None, None
+    key = (collection_name, url, cached["text_hash"], model_id_of(model), embedding_engine.encode([question])[0])
+    return collection, key, answer_cache.get(*key)
 
 def main():
 
     # Get the API key and project id and update global variables
     get_credentials()
+    from utils import chromadb_client
     client=chromadb_client()
     # Try diffrent URLs and questions
     url = "https://huggingface.co/learn/nlp-course/chapter1/2?fw=pt"
@@ -220,10 +576,8 @@ def main():
     answer_questions_from_web(api_key, watsonx_project_id, url, question, collection_name,client)
 
 
-def answer_questions_from_web(request_api_key, request_project_id, url, question, collection_name,client):
-    # Update the global variable
-    globals()["api_key"] = request_api_key
-    globals()["watsonx_project_id"] = request_project_id
+def get_answer_model(request_api_key=None, request_project_id=None):
+    from ibm_watson_machine_learning.foundation_models.utils.enums import DecodingMethods
 
     # Specify model parameters
     model_type = "meta-llama/llama-2-70b-chat"
@@ -236,29 +590,101 @@ def answer_questions_from_web(request_api_key, request_project_id, url, question
     temperature = 0.7
 
     # Get the watsonx model = try both options
-    model = get_model(model_type, max_tokens, min_tokens, decoding, temperature, top_k, top_p)
-
-    # Get the prompt
-    complete_prompt = create_prompt(url, question, collection_name,client)
+    return get_model(model_type, max_tokens, min_tokens, decoding, temperature, top_k, top_p,
+                     request_api_key, request_project_id)
 
+def print_prompt(complete_prompt):
     # Let's review the prompt
     print("----------------------------------------------------------------------------------------------------")
     print("*** Prompt:" + complete_prompt + "***")
     print("----------------------------------------------------------------------------------------------------")
 
-    generated_response = model.generate(prompt=complete_prompt)
-    response_text = generated_response['results'][0]['generated_text']
-
-    # Remove trailing white spaces
-    response_text = response_text.strip()
-
+def print_response(response_text):
     # print model response
     print("--------------------------------- Generated response -----------------------------------")
     print(response_text)
     print("*********************************************************************************************")
 
+def answer_questions_from_web(request_api_key, request_project_id, url, question, collection_name,client, model=None,
+                              ingest=True, raise_errors=False):
+    # A model can be passed in, e.g. llm.FakeModel to run without watsonx.
+    # The credentials of the request are not written to the module globals, so
+    # concurrent sessions do not see each other's keys.
+    # With raise_errors=True a page that cannot be indexed or queried raises instead
+    # of being answered from a prompt that carries the error
+    if model is None:
+        model = get_answer_model(request_api_key, request_project_id)
+
+    # The same question about the same page is answered once
+    collection, cache_key, cached_answer = lookup_answer(url, question, collection_name, client, model, ingest,
+                                                         raise_errors)
+    if cached_answer is not None:
+        print_response(cached_answer)
+        return cached_answer
+
+    # Get the prompt
+    complete_prompt = create_prompt(url, question, collection_name,client, collection, model_id_of(model),
+                                    raise_errors)
+    print_prompt(complete_prompt)
+
+    with telemetry.stage("generate", model=model_id_of(model)):
+        generated_response = model.generate(prompt=complete_prompt)
+    response_text = generated_response['results'][0]['generated_text']
+    telemetry.count("tokens_generated", generated_response['results'][0].get(
+        'generated_token_count', len(response_text.split())))
+
+    # Remove trailing white spaces
+    response_text = response_text.strip()
+    print_response(response_text)
+    if cache_key is not None:
+        answer_cache.put(*cache_key, response_text)
+
     return response_text
 
+def answer_questions_from_web_stream(request_api_key, request_project_id, url, question, collection_name, client,
+                                     model=None, stats=None, ingest=True, raise_errors=False):
+    # Same as answer_questions_from_web, but yields the answer piece by piece as
+    # watsonx generates it. Pass an llm.GenerationStats as `stats` to read the time
+    # to first token and the tokens/s once the generator is exhausted.
+    if model is None:
+        model = get_answer_model(request_api_key, request_project_id)
+
+    collection, cache_key, cached_answer = lookup_answer(url, question, collection_name, client, model, ingest,
+                                                         raise_errors)
+    if cached_answer is not None:
+        # Shown at once, as a single piece
+        if stats is not None:
+            stats.begin()
+            stats.record(cached_answer)
+            stats.end()
+        print_response(cached_answer)
+        yield cached_answer
+        return
+
+    complete_prompt = create_prompt(url, question, collection_name, client, collection, model_id_of(model),
+                                    raise_errors)
+    print_prompt(complete_prompt)
+
+    stats = stats if stats is not None else llm.GenerationStats()
+    pieces = []
+    # The pieces can be pulled from different threads (see api.py)
+    with telemetry.stage("generate", detached=True, model=model_id_of(model)):
+        for piece in llm.stream_generate(model, complete_prompt, stats):
+            # Leading white space of the answer is dropped, like strip() does
+            if not pieces:
+                piece = piece.lstrip()
+                if not piece:
+                    continue
+            pieces.append(piece)
+            yield piece
+    telemetry.count("tokens_generated", stats.tokens)
+
+    response_text = "".join(pieces).strip()
+    print_response(response_text)
+    if cache_key is not None:
+        answer_cache.put(*cache_key, response_text)
+    print(stats)
+
 # Invoke the main function
 if __name__ == "__main__":
     main()